@@ -3,6 +3,8 @@
 import os
 from pathlib import Path
 
+import dj_database_url
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -11,7 +13,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = os.environ.get('django-insecure-df(-&)3-^#&%*_wo(o%&&c5#@w%f*!-ro--&jz5488$i1gl-@=')
+SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure-df(-&)3-^#&%*_wo(o%&&c5#@w%f*!-ro--&jz5488$i1gl-@=')
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.environ.get('DEBUG', 'True') == 'True'
@@ -44,8 +46,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the timings cover all the other middleware too.
+    'surveys.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise, able to run as a coroutine under ASGI too.
+    'surveys.middleware.StaticFilesMiddleware',
 
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,6 +58,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Runs its checks once the URL is resolved, just before the view.
+    'surveys.middleware.ThrottleMiddleware',
      
 ]
 
@@ -81,13 +88,43 @@ WSGI_APPLICATION = 'amusurvey.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# The database comes from DATABASE_URL (set by render.yaml), falling back to
+# the local SQLite file. Connections are kept open for CONN_MAX_AGE seconds
+# instead of being opened on every request, and are checked before reuse so
+# a connection the server has dropped is replaced instead of failing.
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': dj_database_url.config(
+        default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
+        conn_max_age=int(os.environ.get('CONN_MAX_AGE', 60)),
+        conn_health_checks=True,
+    )
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # Run on every new connection. The database itself is switched to WAL
+    # once, by migration 0015 (the mode is stored in the file); busy_timeout
+    # (via 'timeout', in seconds) makes a writer wait for the lock instead of
+    # failing with "database is locked"; NORMAL is safe with WAL; mmap_size
+    # lets reads come straight from the page cache. IMMEDIATE takes the write lock when a transaction
+    # starts, so two submissions cannot deadlock upgrading from a read lock.
+    DATABASES['default']['OPTIONS'] = {
+        'timeout': 20,
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': (
+            'PRAGMA synchronous=NORMAL;'
+            f"PRAGMA mmap_size={int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))};"
+        ),
+    }
+elif os.environ.get('DATABASE_POOL', 'False') == 'True':
+    # Postgres connection pooling (needs psycopg 3 with its pool extra). A pool
+    # replaces persistent connections, so CONN_MAX_AGE must be 0.
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 10)),
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -119,6 +156,81 @@ STATICFILES_DIRS = [
 ]
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# A file-based cache is shared by every gunicorn worker on the machine, so a
+# schema version bumped by one worker is seen by all of them.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, 'django_cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+
+# Route the take/submit, public-link and thank-you pages to the async views in
+# surveys/async_views.py. Only worth it when serving through ASGI (see README).
+SURVEY_ASYNC_VIEWS = os.environ.get('SURVEY_ASYNC_VIEWS', 'False') == 'True'
+
+
+# Queued submission ingest (surveys/ingest.py). When enabled, submissions are
+# appended to a separate SQLite file and saved in batches by
+# `python manage.py run_submission_worker`, which must be running.
+SUBMISSION_QUEUE_ENABLED = os.environ.get('SUBMISSION_QUEUE_ENABLED', 'False') == 'True'
+SUBMISSION_QUEUE_PATH = os.environ.get('SUBMISSION_QUEUE_PATH', os.path.join(BASE_DIR, 'submission_queue.sqlite3'))
+
+
+# Per-view performance metrics served at /metrics (surveys/metrics.py). Each
+# worker adds its numbers to the shared METRICS_PATH file every
+# METRICS_FLUSH_INTERVAL seconds. The scraper must send
+# "Authorization: Bearer <METRICS_TOKEN>"; without a METRICS_TOKEN the page is
+# refused, except with DEBUG on.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_PATH = os.environ.get('METRICS_PATH', os.path.join(BASE_DIR, 'metrics.sqlite3'))
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 10))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+
+# Rate limiting and load shedding (surveys/throttling.py), per URL name:
+#   per_ip / per_survey: (requests, seconds) token buckets; over them -> 429.
+#   max_concurrent: requests in progress across all workers; over it -> 503.
+# The state is shared by the workers through the RATE_LIMIT_PATH file. Behind
+# a reverse proxy (e.g. Render), set RATE_LIMIT_TRUST_PROXY so the client IP
+# comes from X-Forwarded-For.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True') == 'True'
+RATE_LIMIT_PATH = os.environ.get('RATE_LIMIT_PATH', os.path.join(BASE_DIR, 'rate_limits.sqlite3'))
+RATE_LIMIT_TRUST_PROXY = os.environ.get('RATE_LIMIT_TRUST_PROXY', 'False') == 'True'
+RATE_LIMITS = {
+    # Anonymous respondents load and submit the form through the public link.
+    'surveys:survey-public-take': {
+        'per_ip': (30, 60),
+        'per_survey': (3000, 60),
+        'max_concurrent': 32,
+    },
+    # Logged-in respondents use the take page; it is just as open to floods.
+    'surveys:survey-take': {
+        'per_ip': (30, 60),
+        'per_survey': (3000, 60),
+        'max_concurrent': 32,
+    },
+}
+
+
+# Submission-rate rollups (surveys/rollups.py). Per-minute counts are merged
+# into hourly ones after ROLLUP_MINUTE_RETENTION_HOURS, and hourly counts into
+# daily ones after ROLLUP_HOUR_RETENTION_DAYS. The submission worker compacts
+# them every hour; without it, run `python manage.py backfill_rollups --compact`
+# from a cron job.
+ROLLUP_MINUTE_RETENTION_HOURS = int(os.environ.get('ROLLUP_MINUTE_RETENTION_HOURS', 48))
+ROLLUP_HOUR_RETENTION_DAYS = int(os.environ.get('ROLLUP_HOUR_RETENTION_DAYS', 90))
+
+
+# Where the memory-mapped NumPy response matrices (surveys/matrix.py) are stored.
+ANALYTICS_CACHE_DIR = os.environ.get('ANALYTICS_CACHE_DIR', os.path.join(BASE_DIR, 'analytics_cache'))
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -3,6 +3,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from users.views import home  # <-- IMPORTANT: We import YOUR home view.
+from surveys.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -16,4 +17,7 @@ urlpatterns = [
     # This says that all survey-related pages (the dashboard, create, detail, etc.)
     # will start with /surveys/.
     path('surveys/', include('surveys.urls')),
+
+    # Per-view performance metrics for Prometheus (see surveys/metrics.py).
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
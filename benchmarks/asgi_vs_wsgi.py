@@ -0,0 +1,126 @@
+# benchmarks/asgi_vs_wsgi.py
+
+"""
+Concurrency benchmark: sync (WSGI) vs async (ASGI) survey take/submit views.
+
+Run from the project root:
+
+    python -m benchmarks.asgi_vs_wsgi --respondents 500 --threads 4 --client-delay 0.05
+
+Each simulated respondent opens the take form and then submits it. Before
+each request the respondent "spends" --client-delay seconds on a slow
+connection. Under WSGI that time is spent holding one of --threads worker
+threads (like a gunicorn worker with a few threads). Under ASGI it is an
+await, so the event loop keeps serving other respondents in the meantime.
+
+All respondents arrive at once, so a latency is the time from the start of
+the run until that respondent's submission was accepted (including any wait
+for a free thread).
+
+Everything runs in-process against a throwaway test database, so the numbers
+are only useful for comparing the two paths on the same machine. Results are
+printed as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'amusurvey.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.test import Client, AsyncClient
+from django.urls import reverse
+
+from surveys.models import Survey, Question, Choice, Response
+
+from .environment import benchmark_database
+
+
+def make_fixture(num_respondents, num_questions):
+    User = get_user_model()
+    creator = User.objects.create(username='bench-creator', is_staff=True)
+    survey = Survey.objects.create(title='Benchmark survey', creator=creator)
+    data = {}
+    for i in range(num_questions):
+        question = Question.objects.create(survey=survey, text=f'Question {i}', question_type=Question.QuestionType.CHOICE, order=i)
+        choice = Choice.objects.create(question=question, text='Yes')
+        Choice.objects.create(question=question, text='No')
+        data[f'question_{question.id}'] = str(choice.id)
+    respondents = User.objects.bulk_create([User(username=f'bench-{mode}-{n}') for mode in ('sync', 'async') for n in range(num_respondents)])
+    return survey, data, respondents[:num_respondents], respondents[num_respondents:]
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'respondents': len(latencies),
+        'elapsed_seconds': round(elapsed, 3),
+        'respondents_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+def run_sync(url, data, users, threads, delay):
+    def respondent(user):
+        client = Client()
+        client.force_login(user)
+        time.sleep(delay)  # the slow connection holds this worker thread
+        assert client.get(url).status_code == 200
+        time.sleep(delay)
+        assert client.post(url, data).status_code == 302
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(respondent, users))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def run_async(url, data, users, delay):
+    async def respondent(user):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        await asyncio.sleep(delay)  # the slow connection just waits in the event loop
+        assert (await client.get(url)).status_code == 200
+        await asyncio.sleep(delay)
+        assert (await client.post(url, data)).status_code == 302
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(respondent(user) for user in users))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--respondents', type=int, default=200)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=4, help='WSGI worker threads.')
+    parser.add_argument('--client-delay', type=float, default=0.05, help='Seconds each request spends on the slow connection.')
+    args = parser.parse_args()
+
+    with benchmark_database():
+        survey, data, sync_users, async_users = make_fixture(args.respondents, args.questions)
+        results = {
+            'questions': args.questions,
+            'client_delay_seconds': args.client_delay,
+            'wsgi': run_sync(reverse('surveys:survey-take', args=[survey.pk]), data, sync_users, args.threads, args.client_delay),
+            'asgi': asyncio.run(run_async(reverse('bench-async-take', args=[survey.pk]), data, async_users, args.client_delay)),
+        }
+        results['wsgi']['threads'] = args.threads
+        expected = 2 * args.respondents
+        saved = Response.objects.filter(survey=survey).count()
+        assert saved == expected, f'expected {expected} responses, found {saved}'
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# benchmarks/environment.py
+
+"""
+A throwaway database and test settings for running benchmarks offline.
+
+The benchmarks never touch the real database: they create a fresh test
+database, seed it, drive the site through Django's test client, and delete
+it again. SQLite test databases are normally in memory, but a shared
+in-memory database locks whole tables between threads, so a temporary file
+is used instead to get the same locking as a real deployment.
+"""
+
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+BENCH_SETTINGS = {
+    'ROOT_URLCONF': 'benchmarks.urls',
+    'ALLOWED_HOSTS': ['testserver'],
+    # A private cache, so the benchmark neither reads nor clears the site's cache.
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'SUBMISSION_QUEUE_ENABLED': False,
+    # Every simulated user shares one IP, so the per-IP limits would kick in.
+    'RATE_LIMIT_ENABLED': False,
+    # Password hashing is deliberately slow and is not what is being measured.
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+}
+
+
+@contextmanager
+def benchmark_database():
+    """Create a test database and apply the benchmark settings for the duration of the block."""
+    temp_dir = tempfile.mkdtemp()
+    if connection.vendor == 'sqlite':
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(temp_dir, 'benchmark.sqlite3')
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        with override_settings(**BENCH_SETTINGS, METRICS_PATH=os.path.join(temp_dir, 'metrics.sqlite3')):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        shutil.rmtree(temp_dir, ignore_errors=True)
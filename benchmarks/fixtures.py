@@ -0,0 +1,85 @@
+# benchmarks/fixtures.py
+
+"""
+The seeded data the benchmarks run against.
+
+seed() creates a handful of surveys, each with a mix of question types and
+some existing responses, plus the users who browse them. Everything is
+deterministic, so two runs with the same arguments measure the same data.
+"""
+
+from typing import NamedTuple
+
+from django.contrib.auth import get_user_model
+from django.http import QueryDict
+
+from surveys.models import Survey, Question, Choice, Profile
+from surveys.schema import get_survey_schema
+from surveys.submission import save_submission
+
+QUESTION_TYPES = [value for value, _ in Question.QuestionType.choices]
+
+
+class Fixture(NamedTuple):
+    admin: object
+    creator: object
+    surveys: list        # the first one is the survey that is taken and submitted
+    public_survey: object
+    respondents: list    # have already answered every survey
+    fresh: list          # have not answered anything yet
+
+
+def answer_data(survey):
+    """POST data answering every question of `survey` (a Survey)."""
+    data = QueryDict(mutable=True)
+    for question in survey.questions.prefetch_related('choices'):
+        field = f'question_{question.id}'
+        choice_ids = [str(choice.id) for choice in question.choices.all()]
+        if question.question_type == Question.QuestionType.CHOICE:
+            data[field] = choice_ids[0]
+        elif question.question_type == Question.QuestionType.MULTIPLE_CHOICE:
+            data.setlist(field, choice_ids[:2])
+        elif question.question_type == Question.QuestionType.RATING:
+            data[field] = '4'
+        else:
+            data[field] = 'A benchmark answer'
+    return data
+
+
+def _make_users(prefix, count):
+    User = get_user_model()
+    # bulk_create skips the post_save signal, so the profiles are added here.
+    users = User.objects.bulk_create([User(username=f'{prefix}-{n}') for n in range(count)])
+    Profile.objects.bulk_create([Profile(user=user, user_type=Survey.RespondentType.STUDENT) for user in users])
+    return list(User.objects.filter(username__startswith=f'{prefix}-').order_by('pk'))
+
+
+def seed(surveys=5, questions=10, choices=4, responses=100, fresh=200):
+    """Create the benchmark data. `responses` is the number of existing responses per survey."""
+    User = get_user_model()
+    admin = User.objects.create_superuser(username='bench-admin', email='admin@example.com', password='bench')
+    creator = User.objects.create(username='bench-creator', is_staff=True)
+
+    created = []
+    for s in range(surveys):
+        survey = Survey.objects.create(title=f'Benchmark survey {s}', creator=creator, is_public=(s == 1))
+        for q in range(questions):
+            question = Question.objects.create(survey=survey, text=f'Question {q}', question_type=QUESTION_TYPES[q % len(QUESTION_TYPES)], order=q)
+            if question.question_type in (Question.QuestionType.CHOICE, Question.QuestionType.MULTIPLE_CHOICE):
+                Choice.objects.bulk_create([Choice(question=question, text=f'Choice {n}') for n in range(choices)])
+        created.append(survey)
+
+    respondents = _make_users('bench-respondent', responses)
+    for survey in created:
+        schema, data = get_survey_schema(survey.pk), answer_data(survey)
+        for respondent in respondents:
+            save_submission(schema, respondent, data)
+
+    return Fixture(
+        admin=admin,
+        creator=creator,
+        surveys=created,
+        public_survey=created[1 % len(created)],
+        respondents=respondents,
+        fresh=_make_users('bench-fresh', fresh),
+    )
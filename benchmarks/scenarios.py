@@ -0,0 +1,123 @@
+# benchmarks/scenarios.py
+
+"""
+The hot paths that are benchmarked, and the code that drives them.
+
+Each scenario is one real URL route requested through Django's test client
+by several simulated users at once (one thread per concurrent user, like
+the threads of a WSGI server). For every request we record its latency and
+the number of SQL queries it ran; logging in happens before the timer starts.
+"""
+
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Callable, Optional
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .fixtures import answer_data
+
+
+class Scenario(NamedTuple):
+    name: str
+    url: str
+    user: Callable            # request number -> the user who makes it
+    data: Optional[dict] = None  # POST data; None means GET
+    expected_status: int = 200
+
+
+def build_scenarios(fixture):
+    survey = fixture.surveys[0]
+    respondents, fresh = fixture.respondents, fixture.fresh
+    cycle = lambda users: (lambda i: users[i % len(users)])
+    return [
+        Scenario('dashboard', reverse('surveys:survey-list'), cycle(respondents)),
+        Scenario('take_get', reverse('surveys:survey-take', args=[survey.pk]), cycle(fresh)),
+        # Each submission needs a respondent who has not answered yet.
+        Scenario('take_post', reverse('surveys:survey-take', args=[survey.pk]), lambda i: fresh[i], answer_data(survey), 302),
+        Scenario('public_take', reverse('surveys:survey-public-take', args=[fixture.public_survey.public_id]), cycle(fresh)),
+        # Anonymous visitors (user None) get a fresh client, so no cookie is carried over.
+        Scenario('public_take_anonymous', reverse('surveys:survey-public-take', args=[fixture.public_survey.public_id]), lambda i: None),
+        Scenario('public_post_anonymous', reverse('surveys:survey-public-take', args=[fixture.public_survey.public_id]), lambda i: None, answer_data(fixture.public_survey), 302),
+        Scenario('results', reverse('surveys:survey-results', args=[survey.pk]), lambda i: fixture.creator),
+        Scenario('admin_surveys', reverse('admin:surveys_survey_changelist'), lambda i: fixture.admin),
+        Scenario('admin_responses', reverse('admin:surveys_response_changelist'), lambda i: fixture.admin),
+    ]
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, int(round(p / 100 * len(sorted_values))) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def _run_requests(scenario, request_numbers):
+    clients = {}
+    timings = []
+    try:
+        for i in request_numbers:
+            user = scenario.user(i)
+            if user is None:
+                client = Client()
+            elif user.pk in clients:
+                client = clients[user.pk]
+            else:
+                client = clients[user.pk] = Client()
+                client.force_login(user)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                if scenario.data is None:
+                    response = client.get(scenario.url)
+                else:
+                    response = client.post(scenario.url, scenario.data)
+                elapsed = time.perf_counter() - started
+            if response.status_code != scenario.expected_status:
+                raise AssertionError(f"{scenario.name}: {scenario.url} returned {response.status_code}, expected {scenario.expected_status}")
+            timings.append((elapsed, len(queries)))
+    finally:
+        # Each worker thread has its own database connection.
+        connection.close()
+    return timings
+
+
+def run_scenario(scenario, requests, concurrency):
+    """Make `requests` requests spread over `concurrency` threads and summarize them."""
+    batches = [range(start, requests, concurrency) for start in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = [timing for batch in pool.map(lambda batch: _run_requests(scenario, batch), batches) for timing in batch]
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in timings)
+    queries = [count for _, count in timings]
+    return {
+        'requests': len(timings),
+        'concurrency': concurrency,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+        'throughput_rps': round(len(timings) / elapsed, 1),
+        'queries_per_request': round(statistics.mean(queries), 2),
+        'max_queries': max(queries),
+    }
+
+
+def compare(results, baseline):
+    """Lines describing how each scenario's p95 latency and queries changed against a baseline report."""
+    lines = []
+    for name, current in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            lines.append(f"{name}: no baseline")
+            continue
+        change = (current['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+        lines.append(
+            f"{name}: p95 {before['p95_ms']} -> {current['p95_ms']} ms ({change:+.1f}%), "
+            f"queries {before['queries_per_request']} -> {current['queries_per_request']}"
+        )
+    return lines
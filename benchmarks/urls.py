@@ -0,0 +1,15 @@
+# benchmarks/urls.py
+
+"""
+URLconf used by the benchmarks: the whole site, plus the async take/submit
+view on its own path so the sync and async versions can be compared in one run.
+"""
+
+from django.urls import path
+
+from amusurvey.urls import urlpatterns as site_urlpatterns
+from surveys import async_views
+
+urlpatterns = site_urlpatterns + [
+    path('bench/async/survey/<int:pk>/take/', async_views.survey_take, name='bench-async-take'),
+]
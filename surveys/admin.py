@@ -1,7 +1,15 @@
 # surveys/admin.py
 
 from django.contrib import admin
+from django.forms.models import BaseInlineFormSet
 from .models import Survey, Question, Choice, Response, Answer, Profile
+from .admin_pagination import LargeTableAdminMixin, RecentSurveyFilter
+from .deletion import delete_responses
+
+# The response and answer tables grow to millions of rows, so every list here
+# loads its related objects up front (list_select_related), never lists every
+# survey or user in a filter or dropdown, and pages with a cursor instead of
+# COUNT(*) and OFFSET (see admin_pagination.py).
 
 # --- Inline Admin for Choices and Answers ---
 
@@ -10,13 +18,46 @@ class ChoiceInline(admin.TabularInline):
     model = Choice
     extra = 1 # Show 1 extra empty form for adding a new choice
 
-# This allows you to see the read-only Answers directly from the Response page
+
+class PagedInlineFormSet(BaseInlineFormSet):
+    """Shows one page of the inline objects; `page` is set per request by AnswerInline.get_formset."""
+    page = 1
+    page_size = 50
+
+    def get_queryset(self):
+        if not hasattr(self, '_page'):
+            start = (self.page - 1) * self.page_size
+            # One extra row tells whether there is a next page.
+            rows = list(super().get_queryset()[start:start + self.page_size + 1])
+            self.has_next_page = len(rows) > self.page_size
+            self._page = rows[:self.page_size]
+        return self._page
+
+
+# This allows you to see the read-only Answers directly from the Response page,
+# 50 at a time (?answers_page=2 for the next 50).
 class AnswerInline(admin.TabularInline):
     model = Answer
+    formset = PagedInlineFormSet
     extra = 0 # Don't show any extra forms
+    fields = ('question', 'body', 'get_choices')
     readonly_fields = ('question', 'body', 'get_choices') # Make fields read-only
     can_delete = False # Prevent deleting answers from this view
 
+    def get_queryset(self, request):
+        # The questions (whose __str__ shows the survey title) and selected
+        # choices of a whole page in two queries.
+        return super().get_queryset(request).select_related('question__survey').prefetch_related('choices').order_by('question__order', 'id')
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        page = request.GET.get('answers_page', '1')
+        formset.page = int(page) if page.isdigit() and int(page) > 0 else 1
+        return formset
+
+    def has_add_permission(self, request, obj=None): return False
+    def has_change_permission(self, request, obj=None): return False
+
     # Custom method to display ManyToMany choices nicely
     def get_choices(self, obj):
         return ", ".join([c.text for c in obj.choices.all()])
@@ -24,23 +65,46 @@ class AnswerInline(admin.TabularInline):
 
 # --- Custom Admin Views ---
 
+@admin.register(Survey)
+class SurveyAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('title', 'creator', 'target_audience', 'is_active', 'created_at')
+    list_filter = ('is_active', 'target_audience')
+    list_select_related = ('creator',)
+    search_fields = ('title',) # Also used by the survey autocomplete on other pages
+    autocomplete_fields = ('creator',)
+
 @admin.register(Question)
-class QuestionAdmin(admin.ModelAdmin):
+class QuestionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('text', 'survey', 'question_type', 'order')
-    list_filter = ('survey', 'question_type')
+    list_filter = (RecentSurveyFilter, 'question_type')
+    list_select_related = ('survey',)
+    autocomplete_fields = ('survey',)
     inlines = [ChoiceInline] # Add the ChoiceInline here
 
 @admin.register(Response)
-class ResponseAdmin(admin.ModelAdmin):
-    list_display = ('__str__', 'survey', 'respondent', 'submitted_at')
-    list_filter = ('survey', 'submitted_at')
+class ResponseAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    # Response.__str__ would look up the respondent and survey of every row.
+    list_display = ('id', 'survey', 'respondent', 'submitted_at')
+    list_filter = (RecentSurveyFilter, 'submitted_at')
     inlines = [AnswerInline] # Add the AnswerInline here
     readonly_fields = ('survey', 'respondent', 'submitted_at') # Make the main fields read-only
 
-# --- Simple registrations for other models ---
+    def get_queryset(self, request):
+        # For the list columns, and for the change page's title (__str__).
+        return super().get_queryset(request).select_related('survey', 'respondent')
+
+    def delete_queryset(self, request, queryset):
+        # The "delete selected" action: rebuild the surveys' tallies and
+        # rollups once afterwards rather than take out each response one at a time.
+        delete_responses(queryset)
 
-admin.site.register(Survey)
-admin.site.register(Profile)
+@admin.register(Profile)
+class ProfileAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'user_type')
+    list_filter = ('user_type',)
+    list_select_related = ('user',)
+    search_fields = ('user__username',)
+    autocomplete_fields = ('user',)
 
 # Note: We don't need to register Choice or Answer separately
-# because they are handled by the inlines.
\ No newline at end of file
+# because they are handled by the inlines.
@@ -0,0 +1,184 @@
+# surveys/admin_pagination.py
+
+"""
+Changelist pagination for admin pages over large tables.
+
+The stock changelist runs an exact COUNT(*) (twice, with the unfiltered
+"full" count) on every page and pages with OFFSET, so page 10,000 walks and
+throws away 250,000 rows. LargeTableAdminMixin changes that:
+
+* EstimatedCountPaginator reads the row count of an unfiltered table from
+  the database's statistics (Postgres) or the highest rowid (SQLite), and
+  stops counting a filtered list at COUNT_LIMIT rows.
+* CursorChangeList replaces the page numbers with "First page" / "Next page"
+  links. The next page starts after the sort key of the last row shown, the
+  same keyset idea as pagination.py, so every page costs the same. It works
+  for any ordering made of non-null fields of the model itself; for other
+  orderings the page numbers come back.
+"""
+
+import base64
+import json
+
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList, PAGE_VAR
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .models import Survey
+
+CURSOR_VAR = 'cursor'
+COUNT_LIMIT = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """A Paginator whose count is cheap: estimated for whole tables, capped for filtered lists."""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = _estimated_rows(queryset)
+            if estimate is not None:
+                return estimate
+        # COUNT(*) over a LIMITed subquery stops after COUNT_LIMIT rows.
+        return queryset.order_by()[:COUNT_LIMIT].count()
+
+
+def _estimated_rows(queryset):
+    """The approximate number of rows in the queryset's table, or None if the database cannot tell."""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            # -1 means the table was never analyzed.
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite' and queryset.model._meta.pk.get_internal_type() in ('AutoField', 'BigAutoField'):
+            # Ids are never reused, so this overestimates by the deleted rows. One index lookup.
+            cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+            return cursor.fetchone()[0] or 0
+    return None
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    """The sort key of the last row of the previous page, or None (first page) for a bad cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        if not isinstance(values, list) or len(values) != len(fields):
+            return None
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+class CursorChangeList(ChangeList):
+    """A changelist that pages with a keyset cursor instead of page numbers (see the module docstring)."""
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def _cursor_ordering(self, request):
+        """[(field, descending)] for the current ordering, or None when a cursor cannot follow it."""
+        opts = self.lookup_opts
+        ordering = []
+        for item in self.get_ordering(request, self.queryset):
+            if not isinstance(item, str):
+                return None
+            name = item.lstrip('-')
+            try:
+                field = opts.pk if name == 'pk' else opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if field.null or not field.concrete or field.is_relation:
+                return None
+            if any(field == seen for seen, _ in ordering):
+                continue  # e.g. '-id' followed by the '-pk' the changelist adds
+            ordering.append((field, item.startswith('-')))
+        return ordering or None
+
+    def get_results(self, request):
+        self.cursor_ordering = self._cursor_ordering(request)
+        if self.cursor_ordering is None or self.show_all:
+            return super().get_results(request)
+
+        fields = [field for field, _ in self.cursor_ordering]
+        queryset = self.queryset
+        cursor = request.GET.get(CURSOR_VAR)
+        position = decode_cursor(cursor, fields) if cursor else None
+        if position is not None:
+            # Rows after the last one shown: (a, b) > (x, y) is a > x, or a = x and b > y.
+            after = Q()
+            for i, (field, descending) in enumerate(self.cursor_ordering):
+                step = Q(**{f'{field.attname}__{"lt" if descending else "gt"}': position[i]})
+                for earlier, value in zip(fields[:i], position):
+                    step &= Q(**{earlier.attname: value})
+                after |= step
+            queryset = queryset.filter(after)
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        rows = list(queryset[:self.list_per_page + 1])
+        self.has_next_page = len(rows) > self.list_per_page
+        rows = rows[:self.list_per_page]
+
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = self.has_next_page or position is not None
+        self.paginator = paginator
+        self.is_cursor_page = True
+        self.is_first_page = position is None
+        self.first_page_url = self.get_query_string(remove=[CURSOR_VAR, PAGE_VAR])
+        self.next_page_url = None
+        if self.has_next_page:
+            last = rows[-1]
+            self.next_page_url = self.get_query_string(
+                {CURSOR_VAR: encode_cursor([getattr(last, field.attname) for field in fields])}, [PAGE_VAR]
+            )
+
+
+class LargeTableAdminMixin:
+    """Use on a ModelAdmin whose table can grow to millions of rows."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return CursorChangeList
+
+
+class RecentSurveyFilter(admin.SimpleListFilter):
+    """
+    Filter by survey without listing every survey: the LIMIT most recently
+    created ones are offered, plus the one currently selected. Any other
+    survey can still be picked with ?survey=<id> in the URL.
+    """
+    title = 'survey'
+    parameter_name = 'survey'
+    LIMIT = 20
+
+    def lookups(self, request, model_admin):
+        selected = Q(pk=self.value()) if (self.value() or '').isdigit() else Q(pk__in=[])
+        recent = Survey.objects.order_by('-created_at', '-pk').values('pk')[:self.LIMIT]
+        surveys = Survey.objects.filter(Q(pk__in=recent) | selected).order_by('-created_at', '-pk')
+        return [(str(pk), title) for pk, title in surveys.values_list('pk', 'title')]
+
+    def queryset(self, request, queryset):
+        if (self.value() or '').isdigit():
+            return queryset.filter(survey_id=self.value())
+        return queryset
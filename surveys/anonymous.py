@@ -0,0 +1,33 @@
+# surveys/anonymous.py
+
+"""
+Duplicate suppression for anonymous submissions through a public link.
+
+Anonymous respondents have no account, so "one response per person" can't
+be enforced with the (survey, respondent) unique constraint. Instead a signed
+cookie is set after a submission, and the take view refuses that browser
+from then on. It is only a deterrent (clearing cookies gets round it), but
+it needs no session row and no database query at all.
+"""
+
+COOKIE_SALT = 'surveys.anonymous-submission'
+COOKIE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def _cookie_name(survey_id):
+    return f'survey_{survey_id}_submitted'
+
+
+def has_submitted(request, survey_id):
+    """True if this browser has already submitted the survey anonymously."""
+    value = request.get_signed_cookie(_cookie_name(survey_id), default=None, salt=COOKIE_SALT)
+    return value == str(survey_id)
+
+
+def remember_submission(response, survey_id):
+    """Mark the browser that receives `response` as having submitted the survey."""
+    response.set_signed_cookie(
+        _cookie_name(survey_id), str(survey_id), salt=COOKIE_SALT,
+        max_age=COOKIE_MAX_AGE, httponly=True, samesite='Lax',
+    )
+    return response
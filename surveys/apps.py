@@ -3,4 +3,10 @@ from django.apps import AppConfig
 
 class SurveysConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'surveys'
\ No newline at end of file
+    name = 'surveys'
+
+    def ready(self):
+        # Connects the signals that invalidate cached survey schemas and open
+        # survey lists, that start/stop the per-survey tallies, and that take
+        # deleted responses out of the submission-rate rollups and text term counts.
+        from . import schema, tallies, availability, rollups, text_summary  # noqa: F401
\ No newline at end of file
@@ -0,0 +1,93 @@
+# surveys/async_views.py
+
+"""
+Async versions of the survey take/submit and thank-you pages, for ASGI.
+
+Under ASGI (uvicorn workers, see README) these views don't tie up a thread
+while a slow mobile connection trickles in a form post, so one small instance
+can keep thousands of respondents connected during a survey blast. They are
+routed instead of the sync views when SURVEY_ASYNC_VIEWS is enabled.
+
+The survey definition comes from the cache (schema.py) and the eligibility
+checks are a single async ORM query (availability.arespondent_status). The
+submission itself still runs in a worker thread, because transaction.atomic()
+is not available in async code. Pages are rendered in a thread too, since
+base.html reads the user's profile.
+"""
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.shortcuts import render, redirect
+from django.views.decorators.http import require_http_methods
+
+from .anonymous import has_submitted, remember_submission
+from .availability import is_open_to, arespondent_status
+from .ingest import queue_enabled, enqueue_submission, is_queued
+from .models import Survey
+from .schema import aget_survey_schema, aget_survey_id_for_public_id
+from .submission import save_submission, build_answers
+
+
+async def _can_take(request, survey, user, public_link):
+    """Async version of BaseSurveyTakeView.test_func."""
+    if not user.is_authenticated:
+        return not has_submitted(request, survey.id)
+    if user.pk == survey.creator_id:
+        return False
+    has_responded, user_type = await arespondent_status(survey.id, user)
+    if has_responded:
+        return False
+    if queue_enabled() and await sync_to_async(is_queued)(survey.id, user.pk):
+        return False
+    if public_link:
+        return True
+    return is_open_to(survey, user_type)
+
+
+async def _take(request, survey_id, public_link):
+    user = await request.auser()
+    try:
+        survey = await aget_survey_schema(survey_id)
+    except Survey.DoesNotExist:
+        raise Http404("No survey found matching the query")
+    if public_link and not (survey.is_public and survey.is_active):
+        raise Http404("No survey found matching the query")
+    if not await _can_take(request, survey, user, public_link):
+        raise PermissionDenied
+
+    if request.method == 'POST':
+        if not user.is_authenticated:
+            await sync_to_async(save_submission)(survey, None, request.POST)
+            return remember_submission(redirect('surveys:survey-thank-you'), survey.id)
+        if queue_enabled():
+            answers = build_answers(survey.questions, survey.valid_choices, request.POST)
+            await sync_to_async(enqueue_submission)(survey, user, answers)
+        else:
+            await sync_to_async(save_submission)(survey, user, request.POST)
+        return redirect('surveys:survey-thank-you')
+
+    context = {'object': survey, 'survey': survey}
+    return await sync_to_async(render)(request, 'surveys/survey_take_form.html', context)
+
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+async def survey_take(request, pk):
+    """Show the take form for a survey and accept its submission."""
+    return await _take(request, pk, public_link=False)
+
+
+@require_http_methods(['GET', 'POST'])
+async def public_survey_take(request, public_id):
+    """The same through a public link, which anonymous respondents can use too."""
+    try:
+        survey_id = await aget_survey_id_for_public_id(public_id)
+    except Survey.DoesNotExist:
+        raise Http404("No survey found matching the query")
+    return await _take(request, survey_id, public_link=True)
+
+
+async def survey_thank_you(request):
+    return await sync_to_async(render)(request, 'surveys/survey_thank_you.html')
@@ -0,0 +1,143 @@
+# surveys/availability.py
+
+"""
+Cached list of the surveys that are currently open, per audience.
+
+The respondent dashboard used to filter every survey by is_active, the
+start/end window and the target audience, and then exclude the user's own
+responses with a subquery, on every hit. Which surveys are open only changes
+when a survey is saved or when a start_date/end_date is reached, so the list
+is cached per audience:
+
+* the cache entry expires at the next start_date/end_date boundary, and
+* saving or deleting a Survey switches to a fresh generation of keys.
+
+A dashboard hit then costs one query for the user's taken survey ids, and an
+in-memory difference against the cached list.
+"""
+
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q, Min, Exists, OuterRef
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Survey, Response
+
+GENERATION_KEY = 'open-surveys-generation'
+# Upper bound on how long a list is kept when no boundary is coming up.
+MAX_TIMEOUT = 60 * 60
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        if not cache.add(GENERATION_KEY, generation, timeout=None):
+            generation = cache.get(GENERATION_KEY, generation)
+    return generation
+
+
+def _audience_filter(audience):
+    if audience:
+        return Q(target_audience='ALL') | Q(target_audience=audience)
+    return Q(target_audience='ALL')
+
+
+def _load_open_surveys(audience, now):
+    """Return (the open surveys as small dicts, newest first; seconds until the list can change)."""
+    surveys = Survey.objects.filter(is_active=True).filter(_audience_filter(audience))
+    open_surveys = [
+        {'pk': pk, 'title': title, 'description': description, 'created_at': created_at}
+        for pk, title, description, created_at in surveys.filter(
+            Q(start_date__isnull=True) | Q(start_date__lte=now)
+        ).filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=now)
+        ).order_by('-created_at').values_list('pk', 'title', 'description', 'created_at')
+    ]
+
+    # The list changes when a survey opens (start_date) or closes (end_date).
+    boundaries = surveys.aggregate(
+        next_start=Min('start_date', filter=Q(start_date__gt=now)),
+        next_end=Min('end_date', filter=Q(end_date__gte=now)),
+    )
+    upcoming = [boundary for boundary in boundaries.values() if boundary is not None]
+    timeout = MAX_TIMEOUT
+    if upcoming:
+        timeout = min(timeout, max(1, int((min(upcoming) - now).total_seconds()) + 1))
+    return open_surveys, timeout
+
+
+def open_surveys_for(audience):
+    """
+    Return the currently open surveys for an audience (a Profile.user_type, or
+    None for users without a profile) as dicts with pk, title, description and
+    created_at, newest first.
+    """
+    key = f'open-surveys:{_generation()}:{audience or "ALL"}'
+    open_surveys = cache.get(key)
+    if open_surveys is None:
+        open_surveys, timeout = _load_open_surveys(audience, timezone.now())
+        cache.set(key, open_surveys, timeout)
+    return open_surveys
+
+
+def is_open_to(survey, user_type, now=None):
+    """
+    The active / start-end window / audience rules for taking a survey.
+    `survey` may be a Survey or a SurveySchema; `user_type` is the respondent's
+    Profile.user_type, or None when they have no profile.
+    """
+    now = now or timezone.now()
+    if not survey.is_active: return False
+    if survey.start_date and now < survey.start_date: return False
+    if survey.end_date and now > survey.end_date: return False
+    return survey.target_audience == 'ALL' or (user_type is not None and survey.target_audience == user_type)
+
+
+def _respondent_query(survey_id, user_id):
+    User = get_user_model()
+    return User.objects.select_related('profile').annotate(
+        has_responded=Exists(Response.objects.filter(survey_id=survey_id, respondent_id=OuterRef('pk')))
+    ).filter(pk=user_id)
+
+
+def _status(user, row):
+    profile = getattr(row, 'profile', None)
+    # Cache the profile on the request's user, so base.html does not fetch it again.
+    get_user_model().profile.related.set_cached_value(user, profile)
+    return row.has_responded, profile.user_type if profile else None
+
+
+def respondent_status(survey_id, user):
+    """
+    What taking a survey needs to know about a user, in one query:
+    (whether they have already responded, their Profile.user_type or None).
+    """
+    return _status(user, _respondent_query(survey_id, user.pk).get())
+
+
+async def arespondent_status(survey_id, user):
+    return _status(user, await _respondent_query(survey_id, user.pk).aget())
+
+
+def available_surveys_for(user):
+    """The open surveys this user is eligible for and has not taken yet."""
+    audience = user.profile.user_type if hasattr(user, 'profile') else None
+    taken = set(Response.objects.filter(respondent=user).values_list('survey_id', flat=True))
+    return [survey for survey in open_surveys_for(audience) if survey['pk'] not in taken]
+
+
+def invalidate_open_surveys():
+    """Switch to a fresh generation of keys, so every cached list is rebuilt."""
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+@receiver([post_save, post_delete], sender=Survey)
+def survey_availability_changed(sender, **kwargs):
+    # After commit, so no request can cache the old rows under the new generation.
+    transaction.on_commit(invalidate_open_surveys)
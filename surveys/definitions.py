@@ -0,0 +1,194 @@
+# surveys/definitions.py
+
+"""
+Survey definitions: a survey's settings, questions and choices as a plain
+JSON (or YAML) document, for copying surveys between sites or keeping them
+in version control.
+
+    {
+      "version": 1,
+      "title": "Library feedback",
+      "description": "",
+      "target_audience": "STUDENT",
+      "start_date": null, "end_date": null,
+      "is_active": true, "is_public": false,
+      "questions": [
+        {"text": "How often do you visit?", "type": "CHOICE", "choices": ["Daily", "Weekly", "Never"]},
+        {"text": "Anything else?", "type": "TEXTAREA"}
+      ]
+    }
+
+Questions are numbered in the order they are listed. Responses are not part
+of a definition; use export.py for those.
+
+save_new_survey() is also how the single-page create view saves a survey:
+the survey row, then every question in one bulk INSERT and every choice in
+another, all in one transaction. So saving a survey with 150 questions takes
+as many statements as one with 5, instead of one or more per question and
+choice. bulk_create does not send post_save for the questions and choices,
+but the survey's own post_save already bumps its schema version once the
+transaction commits (see schema.py), after they are all saved.
+"""
+
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import Survey, Question, Choice
+
+# PyYAML is optional; without it definitions can only be JSON.
+try:
+    import yaml
+except ImportError:  # pragma: no cover
+    yaml = None
+
+VERSION = 1
+SURVEY_FIELDS = ('title', 'description', 'target_audience', 'start_date', 'end_date', 'is_active', 'is_public')
+CHOICE_TYPES = (Question.QuestionType.CHOICE, Question.QuestionType.MULTIPLE_CHOICE)
+MAX_QUESTIONS = 1000
+
+
+def definition_formats():
+    """The formats definitions can be read and written in here."""
+    return ('json', 'yaml') if yaml is not None else ('json',)
+
+
+def format_for_filename(filename):
+    """'yaml' for a .yaml/.yml file name, otherwise 'json'."""
+    return 'yaml' if filename.lower().endswith(('.yaml', '.yml')) else 'json'
+
+
+# --- Export ---
+
+def export_definition(survey):
+    """The definition of a saved survey, as a dict. Two queries: questions, then their choices."""
+    definition = {'version': VERSION}
+    for name in SURVEY_FIELDS:
+        value = getattr(survey, name)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif isinstance(value, str):
+            value = str(value)  # A plain str, not the TextChoices member YAML cannot write
+        definition[name] = value
+    definition['questions'] = []
+    for question in survey.questions.order_by('order', 'pk').prefetch_related('choices'):
+        item = {'text': question.text, 'type': str(question.question_type)}
+        if question.question_type in CHOICE_TYPES:
+            item['choices'] = [choice.text for choice in sorted(question.choices.all(), key=lambda choice: choice.pk)]
+        definition['questions'].append(item)
+    return definition
+
+
+def dump_definition(definition, definition_format='json'):
+    """A definition dict as JSON or YAML text."""
+    if definition_format == 'yaml':
+        if yaml is None:
+            raise ValueError("Writing YAML needs PyYAML (pip install PyYAML).")
+        return yaml.safe_dump(definition, sort_keys=False, allow_unicode=True)
+    return json.dumps(definition, indent=2, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n'
+
+
+# --- Import ---
+
+def load_definition(text, definition_format='json'):
+    """Parse JSON or YAML text into a dict. Raises ValidationError if it cannot be read."""
+    try:
+        if definition_format == 'yaml':
+            if yaml is None:
+                raise ValidationError("Reading YAML needs PyYAML (pip install PyYAML); upload JSON instead.")
+            definition = yaml.safe_load(text)
+        else:
+            definition = json.loads(text)
+    except (ValueError, getattr(yaml, 'YAMLError', ValueError)) as error:
+        raise ValidationError(f"The file is not valid {definition_format.upper()}: {error}")
+    if not isinstance(definition, dict):
+        raise ValidationError("A survey definition must be an object with a title and a list of questions.")
+    return definition
+
+
+def build_survey(definition, creator):
+    """
+    Check a definition and turn it into an unsaved Survey and its unsaved
+    [(Question, [choice texts])], ready for save_new_survey(). Every problem
+    found is reported at once, in one ValidationError. No queries.
+    """
+    errors = []
+    version = definition.get('version', VERSION)
+    if version != VERSION:
+        raise ValidationError(f"Unsupported definition version {version!r}; this site reads version {VERSION}.")
+
+    unknown = set(definition) - set(SURVEY_FIELDS) - {'version', 'questions'}
+    if unknown:
+        errors.append(f"Unknown survey fields: {', '.join(sorted(unknown))}.")
+    survey = Survey(creator=creator, **{name: definition[name] for name in SURVEY_FIELDS if name in definition})
+    if survey.description is None:
+        survey.description = ''
+    try:
+        # public_id is unique, but a new random one; skipping that check saves a query.
+        survey.full_clean(exclude=['creator', 'public_id'], validate_unique=False)
+    except ValidationError as error:
+        errors.extend(_field_errors(error, 'Survey'))
+
+    items = definition.get('questions')
+    if not isinstance(items, list) or not items:
+        errors.append("A survey definition needs a non-empty list of questions.")
+        items = []
+    elif len(items) > MAX_QUESTIONS:
+        errors.append(f"A survey can have at most {MAX_QUESTIONS} questions.")
+        items = []
+
+    questions = []
+    for number, item in enumerate(items, start=1):
+        label = f"Question {number}"
+        if not isinstance(item, dict):
+            errors.append(f"{label}: must be an object with a text and a type.")
+            continue
+        question = Question(text=item.get('text'), question_type=item.get('type', Question.QuestionType.TEXT), order=number - 1)
+        try:
+            question.full_clean(exclude=['survey'], validate_unique=False)
+        except ValidationError as error:
+            errors.extend(_field_errors(error, label))
+        choices = item.get('choices') or []
+        if not isinstance(choices, list) or not all(isinstance(text, (str, int, float)) for text in choices):
+            errors.append(f"{label}: choices must be a list of texts.")
+            choices = []
+        choices = [str(text).strip() for text in choices if str(text).strip()]
+        if choices and question.question_type not in CHOICE_TYPES:
+            errors.append(f"{label}: only CHOICE and MULTICHOICE questions can have choices.")
+        for text in choices:
+            if len(text) > Choice._meta.get_field('text').max_length:
+                errors.append(f"{label}: the choice '{text[:30]}...' is too long.")
+        questions.append((question, choices))
+
+    if errors:
+        raise ValidationError(errors)
+    return survey, questions
+
+
+def _field_errors(error, label):
+    return [f"{label} {field}: {message}" for field, messages in error.message_dict.items() for message in messages]
+
+
+def save_new_survey(survey, questions):
+    """
+    Save an unsaved survey with its unsaved [(Question, [choice texts])] in
+    one transaction and a fixed number of statements (see the module docstring).
+    """
+    with transaction.atomic():
+        survey.save()
+        for question, _ in questions:
+            question.survey = survey
+        # Both databases we run on hand back the new ids, which the choices need.
+        Question.objects.bulk_create([question for question, _ in questions])
+        Choice.objects.bulk_create([
+            Choice(question=question, text=text) for question, choices in questions for text in choices
+        ])
+    return survey
+
+
+def import_definition(definition, creator):
+    """Create a new survey owned by `creator` from a definition dict. Raises ValidationError if it is invalid."""
+    survey, questions = build_survey(definition, creator)
+    return save_new_survey(survey, questions)
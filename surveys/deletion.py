@@ -0,0 +1,47 @@
+# surveys/deletion.py
+
+"""
+Deleting many responses at once.
+
+Deleting one response takes it out of its survey's tallies, rollups and text
+summaries again, through delete signals that cost a few queries each. For
+a batch (the admin's "delete selected" action) that is a few queries per
+response. delete_responses() deletes the batch with BulkResponseDeletion as
+the signals' origin, so those receivers stand aside, and then rebuilds the
+summaries of each survey involved once, in the same transaction.
+"""
+
+from django.db import router, transaction
+from django.db.models.deletion import Collector
+
+from .models import Survey, SurveyTally
+from .rollups import rebuild_rollups
+from .schema import get_survey_schema
+from .tallies import BulkResponseDeletion, bump_responses_version, rebuild_tallies
+from .text_summary import rebuild_text_summary
+
+
+def delete_responses(responses):
+    """
+    Delete a queryset of responses and rebuild the summaries of their surveys.
+    Returns what QuerySet.delete() does: (rows deleted, {model label: rows}).
+    """
+    responses = responses.select_related(None).order_by()
+    using = router.db_for_write(responses.model)
+    with transaction.atomic(using=using):
+        survey_ids = sorted(set(responses.values_list('survey_id', flat=True)))
+        collector = Collector(using=using, origin=BulkResponseDeletion())
+        collector.collect(responses)
+        deleted = collector.delete()
+        for survey_id in survey_ids:
+            bump_responses_version(survey_id)
+            try:
+                schema = get_survey_schema(survey_id)
+            except Survey.DoesNotExist:
+                continue
+            # Only surveys whose tallies are maintained (see tallies.py).
+            if SurveyTally.objects.filter(survey_id=survey_id).exists():
+                rebuild_tallies(schema)
+            rebuild_rollups(survey_id)
+            rebuild_text_summary(schema)
+    return deleted
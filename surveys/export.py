@@ -0,0 +1,108 @@
+# surveys/export.py
+
+"""
+Streaming export of survey responses as wide-format CSV or JSONL.
+
+One row per Response, one column per Question. Responses are read in chunks
+with `.iterator()`, and each chunk's answers and selected choices are fetched
+with two bulk queries, so memory stays flat however many responses there are.
+Only plain values (never model instances) are loaded for the rows.
+"""
+
+import csv
+import json
+from itertools import islice
+
+from .models import Choice, Response, Answer
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+CHUNK_SIZE = 2000
+
+# How several selected choices of a MULTICHOICE question are put in one cell.
+MULTI_CHOICE_SEPARATOR = '; '
+
+
+class Echo:
+    """A file-like object whose write() just hands the value back, for csv.writer."""
+    def write(self, value):
+        return value
+
+
+def export_columns(survey):
+    """Return the (question_id, column label) pairs for a survey, in survey order."""
+    questions = survey.questions.values_list('id', 'text')
+    return [(question_id, f"Q{position}. {text}") for position, (question_id, text) in enumerate(questions, start=1)]
+
+
+def iter_response_rows(survey, columns, chunk_size=CHUNK_SIZE):
+    """
+    Yield one dict per response: the fixed response fields followed by one
+    entry per question column (empty string when the question was skipped).
+    """
+    choice_text = dict(Choice.objects.filter(question__survey=survey).values_list('id', 'text'))
+    through = Answer.choices.through
+
+    responses = (
+        Response.objects.filter(survey=survey)
+        .order_by('id')
+        .values_list('id', 'respondent__username', 'submitted_at')
+        .iterator(chunk_size=chunk_size)
+    )
+    while True:
+        chunk = list(islice(responses, chunk_size))
+        if not chunk:
+            break
+
+        response_ids = [row[0] for row in chunk]
+        answers = {}  # answer id -> (response id, question id, body)
+        for answer_id, response_id, question_id, body in Answer.objects.filter(
+            response_id__in=response_ids
+        ).values_list('id', 'response_id', 'question_id', 'body'):
+            answers[answer_id] = (response_id, question_id, body)
+
+        # Filter by response rather than by answer id, so the IN list stays
+        # chunk-sized no matter how many questions the survey has.
+        selected = {}  # answer id -> [choice text, ...]
+        for answer_id, choice_id in through.objects.filter(
+            answer__response_id__in=response_ids
+        ).values_list('answer_id', 'choice_id').order_by('id'):
+            selected.setdefault(answer_id, []).append(choice_text.get(choice_id, ''))
+
+        cells = {}  # (response id, question id) -> cell value
+        for answer_id, (response_id, question_id, body) in answers.items():
+            if answer_id in selected:
+                cells[(response_id, question_id)] = MULTI_CHOICE_SEPARATOR.join(selected[answer_id])
+            else:
+                cells[(response_id, question_id)] = body or ''
+
+        for response_id, username, submitted_at in chunk:
+            row = {
+                'response_id': response_id,
+                'respondent': username or '',
+                'submitted_at': submitted_at.isoformat(),
+            }
+            for question_id, label in columns:
+                row[label] = cells.get((response_id, question_id), '')
+            yield row
+
+
+def stream_csv(survey, chunk_size=CHUNK_SIZE):
+    """Yield the export as CSV text, one line at a time (header first)."""
+    columns = export_columns(survey)
+    writer = csv.writer(Echo())
+    yield writer.writerow(['response_id', 'respondent', 'submitted_at'] + [label for _, label in columns])
+    for row in iter_response_rows(survey, columns, chunk_size):
+        yield writer.writerow(row.values())
+
+
+def stream_jsonl(survey, chunk_size=CHUNK_SIZE):
+    """Yield the export as JSON Lines, one JSON object per response."""
+    columns = export_columns(survey)
+    for row in iter_response_rows(survey, columns, chunk_size):
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def stream_export(survey, export_format='csv', chunk_size=CHUNK_SIZE):
+    if export_format == 'jsonl':
+        return stream_jsonl(survey, chunk_size)
+    return stream_csv(survey, chunk_size)
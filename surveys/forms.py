@@ -2,7 +2,8 @@
 
 from django import forms
 from django.forms import inlineformset_factory
-from .models import Survey, Question, Choice
+from .models import Survey, Question, Choice, Profile, SubmissionRollup
+from .definitions import build_survey, format_for_filename, load_definition
 
 # --- FORMS FOR THE SINGLE-PAGE CREATE VIEW ---
 
@@ -65,4 +66,135 @@ ChoiceFormSet = inlineformset_factory(
     extra=1,
     can_delete=True,
     widgets={'text': forms.TextInput(attrs={'class': 'form-control'})}
-)
\ No newline at end of file
+)
+
+# --- FORM FOR FILTERING THE INDIVIDUAL RESPONSES BROWSER ---
+
+class ResponseFilterForm(forms.Form):
+    """
+    Filters for the individual responses page. Every field is optional;
+    an empty form shows all responses.
+    """
+    user_type = forms.ChoiceField(
+        label="Respondent Role",
+        choices=[('', 'All roles')] + Profile.USER_TYPE_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    start = forms.DateField(
+        label="Submitted from",
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+    end = forms.DateField(
+        label="Submitted until",
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end and start > end:
+            raise forms.ValidationError("The start date must be before the end date.")
+        return cleaned_data
+
+
+# --- FORM FOR THE SEGMENTED RESULTS / CROSS-TAB PAGE ---
+
+class SegmentForm(ResponseFilterForm):
+    """
+    The response filters, plus two optional questions to cross-tabulate.
+    `questions` are the survey's choice and rating questions (from its schema).
+    """
+    row_question = forms.TypedChoiceField(
+        label="Cross-tab rows", coerce=int, required=False, empty_value=None,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    column_question = forms.TypedChoiceField(
+        label="Cross-tab columns", coerce=int, required=False, empty_value=None,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+
+    def __init__(self, *args, questions=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        # Responses without a profile (e.g. anonymous public ones) form their own segment.
+        self.fields['user_type'].choices = self.fields['user_type'].choices + [('NONE', 'No profile / anonymous')]
+        question_choices = [('', '---------')] + [(question.id, question.text) for question in questions]
+        self.fields['row_question'].choices = question_choices
+        self.fields['column_question'].choices = question_choices
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if bool(cleaned_data.get('row_question')) != bool(cleaned_data.get('column_question')):
+            raise forms.ValidationError("Pick both questions to cross-tabulate, or neither.")
+        return cleaned_data
+
+
+# --- FORM FOR THE SUBMISSION TIMELINE PAGE ---
+
+class TimelineForm(forms.Form):
+    """
+    Bucket size and optional date range for the submission timeline. Without
+    a start date the page shows a recent window that suits the bucket size.
+    """
+    granularity = forms.ChoiceField(
+        label="Submissions per",
+        choices=SubmissionRollup.Granularity.choices,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    start = forms.DateField(
+        label="From",
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+    end = forms.DateField(
+        label="Until",
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        cleaned_data['granularity'] = cleaned_data.get('granularity') or SubmissionRollup.Granularity.HOUR
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end and start > end:
+            raise forms.ValidationError("The start date must be before the end date.")
+        return cleaned_data
+
+
+# --- FORM FOR IMPORTING A SURVEY DEFINITION ---
+
+class SurveyImportForm(forms.Form):
+    """
+    Upload of a survey definition file (see definitions.py). When valid,
+    `cleaned_data['survey']` is the unsaved survey and
+    `cleaned_data['questions']` its unsaved questions and choices.
+    """
+    MAX_SIZE = 2 * 1024 * 1024
+
+    file = forms.FileField(
+        label="Survey definition",
+        help_text="A .json file (or .yaml/.yml) exported from this or another survey site.",
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.json,.yaml,.yml'}),
+    )
+
+    def __init__(self, *args, creator=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.creator = creator
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload = cleaned_data.get('file')
+        if not upload:
+            return cleaned_data
+        if upload.size > self.MAX_SIZE:
+            raise forms.ValidationError("The file is too large (at most 2 MB).")
+        try:
+            text = upload.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise forms.ValidationError("The file must be UTF-8 text.")
+        definition = load_definition(text, format_for_filename(upload.name))
+        cleaned_data['survey'], cleaned_data['questions'] = build_survey(definition, self.creator)
+        return cleaned_data
@@ -0,0 +1,238 @@
+# surveys/ingest.py
+
+"""
+Optional queued ingest of survey submissions.
+
+When a survey link goes out to the whole university, many submissions arrive
+at once and compete for SQLite's single writer ("database is locked"). With
+SUBMISSION_QUEUE_ENABLED, SurveyTakeView.post only validates a submission and
+appends it to a small, separate SQLite file (the queue), then shows the
+thank-you page straight away. `manage.py run_submission_worker` moves queued
+submissions into Response/Answer in large batches, one transaction per batch.
+
+Exactly-once: the queue itself only accepts one submission per
+(survey, respondent), and the worker skips any pair that already has a
+Response before inserting. A batch is removed from the queue only after its
+transaction has committed, so a crash in between just means the batch is
+seen again and its already-saved submissions are skipped.
+
+A batch that the database refuses (e.g. its respondent or a question was
+deleted while it waited) is retried one submission at a time. Submissions
+that still fail are moved to the failed_submission table of the queue file,
+with the error, so they can never block the queue.
+
+Each thread keeps one connection to the queue file open, set up once, so
+checking the queue on every take page costs no new connection.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Survey, Response, Answer, Profile
+from .schema import get_survey_schema
+from .tallies import record_submission
+from .rollups import record_submissions
+from .text_summary import record_text_answers
+from .segments import NO_ROLE
+
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queued_submission (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    survey_id INTEGER NOT NULL,
+    respondent_id INTEGER NOT NULL,
+    submitted_at TEXT NOT NULL,
+    answers TEXT NOT NULL,
+    UNIQUE (survey_id, respondent_id)
+);
+CREATE TABLE IF NOT EXISTS failed_submission (
+    id INTEGER PRIMARY KEY,
+    survey_id INTEGER NOT NULL,
+    respondent_id INTEGER NOT NULL,
+    submitted_at TEXT NOT NULL,
+    answers TEXT NOT NULL,
+    error TEXT NOT NULL,
+    failed_at TEXT NOT NULL
+);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def queue_enabled():
+    return getattr(settings, 'SUBMISSION_QUEUE_ENABLED', False)
+
+
+# One connection per thread (and queue file), opened and set up on first use.
+_local = threading.local()
+
+
+def _connect():
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    path = settings.SUBMISSION_QUEUE_PATH
+    if path not in connections:
+        connection = sqlite3.connect(path, timeout=30)
+        # WAL lets the worker read while web processes append; FULL makes every
+        # accepted submission survive a power cut.
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=FULL')
+        connection.executescript(QUEUE_SCHEMA)
+        connections[path] = connection
+    return connections[path]
+
+
+@contextmanager
+def _queue():
+    """This thread's connection. After an error it is dropped, so the next call opens a fresh one."""
+    try:
+        yield _connect()
+    except sqlite3.Error:
+        connection = _local.connections.pop(settings.SUBMISSION_QUEUE_PATH, None)
+        if connection is not None:
+            connection.close()
+        raise
+
+
+def enqueue_submission(schema, respondent, answers):
+    """
+    Durably queue a validated submission. `answers` are the (Answer, [choice ids])
+    pairs from submission.build_answers(). Returns False if this respondent
+    already has a submission for the survey waiting in the queue.
+    """
+    payload = json.dumps([[answer.question_id, answer.body, choice_ids] for answer, choice_ids in answers])
+    with _queue() as connection, connection:
+        cursor = connection.execute(
+            'INSERT OR IGNORE INTO queued_submission (survey_id, respondent_id, submitted_at, answers) VALUES (?, ?, ?, ?)',
+            (schema.id, respondent.pk, timezone.now().isoformat(), payload),
+        )
+    return cursor.rowcount == 1
+
+
+def is_queued(survey_id, respondent_id):
+    """True if the respondent has a submission for this survey waiting to be flushed."""
+    with _queue() as connection:
+        row = connection.execute(
+            'SELECT 1 FROM queued_submission WHERE survey_id = ? AND respondent_id = ?', (survey_id, respondent_id)
+        ).fetchone()
+    return row is not None
+
+
+def queue_length():
+    with _queue() as connection:
+        return connection.execute('SELECT COUNT(*) FROM queued_submission').fetchone()[0]
+
+
+def failed_submissions():
+    """The submissions the worker gave up on: (id, survey id, respondent id, submitted at, error)."""
+    with _queue() as connection:
+        return connection.execute(
+            'SELECT id, survey_id, respondent_id, submitted_at, error FROM failed_submission ORDER BY id'
+        ).fetchall()
+
+
+def _write_batch(rows):
+    """
+    Insert one batch of queued rows into Response/Answer in a single transaction.
+    Returns the number of submissions saved (duplicates and submissions for
+    deleted surveys are dropped).
+    """
+    schemas = {}
+    for survey_id in {row[1] for row in rows}:
+        try:
+            schemas[survey_id] = get_survey_schema(survey_id)
+        except Survey.DoesNotExist:
+            pass
+
+    pairs = {(row[1], row[2]) for row in rows if row[1] in schemas}
+    with transaction.atomic():
+        existing = set(
+            Response.objects.filter(
+                survey_id__in={survey_id for survey_id, _ in pairs},
+                respondent_id__in={respondent_id for _, respondent_id in pairs},
+            ).values_list('survey_id', 'respondent_id')
+        )
+
+        pending = []  # (schema, Response, [(Answer, [choice ids])])
+        for _, survey_id, respondent_id, submitted_at, payload in rows:
+            if survey_id not in schemas or (survey_id, respondent_id) in existing:
+                continue
+            existing.add((survey_id, respondent_id))
+            schema = schemas[survey_id]
+            # Questions or choices may have been removed since the submission was queued.
+            valid_choices = schema.valid_choices
+            answers = [
+                (Answer(question_id=question_id, body=body), [c for c in choice_ids if c in valid_choices[question_id]])
+                for question_id, body, choice_ids in json.loads(payload)
+                if question_id in valid_choices
+            ]
+            response = Response(survey_id=survey_id, respondent_id=respondent_id, submitted_at=datetime.fromisoformat(submitted_at))
+            pending.append((schema, response, answers))
+
+        Response.objects.bulk_create([response for _, response, _ in pending])
+        for _, response, answers in pending:
+            for answer, _ in answers:
+                answer.response = response
+        Answer.objects.bulk_create([answer for _, _, answers in pending for answer, _ in answers])
+
+        through = Answer.choices.through
+        through.objects.bulk_create([
+            through(answer_id=answer.pk, choice_id=choice_id)
+            for _, _, answers in pending
+            for answer, choice_ids in answers
+            for choice_id in choice_ids
+        ])
+        text_answers = {survey_id: [] for survey_id in schemas}
+        for schema, _, answers in pending:
+            record_submission(schema, answers)
+            text_answers[schema.id] += answers
+        # The words of the whole batch are counted together: one UPDATE per question and count.
+        for survey_id, answers in text_answers.items():
+            record_text_answers(schemas[survey_id], answers)
+        roles = dict(Profile.objects.filter(user_id__in={response.respondent_id for _, response, _ in pending}).values_list('user_id', 'user_type'))
+        record_submissions([(response.survey_id, response.submitted_at, roles.get(response.respondent_id, NO_ROLE)) for _, response, _ in pending])
+    return len(pending)
+
+
+def flush_queue(batch_size=500):
+    """
+    Move up to `batch_size` of the oldest queued submissions into the database.
+    Returns (rows taken from the queue, submissions saved).
+    """
+    with _queue() as connection:
+        rows = connection.execute(
+            'SELECT id, survey_id, respondent_id, submitted_at, answers FROM queued_submission ORDER BY id LIMIT ?',
+            (batch_size,),
+        ).fetchall()
+        if not rows:
+            return 0, 0
+        failed = []
+        try:
+            saved = _write_batch(rows)
+        except (IntegrityError, DataError):
+            # One bad submission must not hold up the others, or the queue.
+            saved = 0
+            for row in rows:
+                try:
+                    saved += _write_batch([row])
+                except (IntegrityError, DataError) as error:
+                    failed.append((*row, str(error), timezone.now().isoformat()))
+        # Only now that the batch is committed can it leave the queue.
+        with connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO failed_submission (id, survey_id, respondent_id, submitted_at, answers, error, failed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                failed,
+            )
+            connection.execute('DELETE FROM queued_submission WHERE id <= ?', (rows[-1][0],))
+        for row in failed:
+            logger.warning("Queued submission %s (survey %s, respondent %s) could not be saved: %s", *row[:3], row[5])
+        return len(rows), saved
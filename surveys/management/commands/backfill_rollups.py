@@ -0,0 +1,31 @@
+# surveys/management/commands/backfill_rollups.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from surveys.models import Survey
+from surveys.rollups import compact_rollups, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the submission-rate rollups from Response.submitted_at, "
+        "or only merge aged minute/hour rows into coarser ones with --compact."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('survey_ids', nargs='*', type=int, help="Surveys to rebuild. Defaults to every survey.")
+        parser.add_argument('--compact', action='store_true', help="Only compact the existing rollups of every survey; rebuild nothing.")
+
+    def handle(self, *args, **options):
+        if options['compact']:
+            merged = compact_rollups()
+            self.stdout.write(self.style.SUCCESS(f"Merged {merged} rollup row(s) into coarser buckets."))
+            return
+
+        survey_ids = options['survey_ids'] or list(Survey.objects.values_list('pk', flat=True))
+        existing = set(Survey.objects.filter(pk__in=survey_ids).values_list('pk', flat=True))
+        for survey_id in survey_ids:
+            if survey_id not in existing:
+                raise CommandError(f"Survey {survey_id} does not exist.")
+            rows = rebuild_rollups(survey_id)
+            self.stdout.write(self.style.SUCCESS(f"Survey {survey_id}: {rows} rollup row(s) written"))
@@ -0,0 +1,26 @@
+# surveys/management/commands/build_response_matrix.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from surveys.matrix import build_response_matrix, matrix_dir
+from surveys.models import Survey
+
+
+class Command(BaseCommand):
+    help = "Build or incrementally update the memory-mapped NumPy response matrix of one or more surveys."
+
+    def add_arguments(self, parser):
+        parser.add_argument('survey_ids', nargs='*', type=int, help="Surveys to build. Defaults to every survey.")
+        parser.add_argument('--full', action='store_true', help="Rebuild from scratch instead of appending new responses.")
+
+    def handle(self, *args, **options):
+        surveys = Survey.objects.all()
+        if options['survey_ids']:
+            surveys = surveys.filter(pk__in=options['survey_ids'])
+            missing = set(options['survey_ids']) - set(surveys.values_list('pk', flat=True))
+            if missing:
+                raise CommandError(f"Unknown survey id(s): {', '.join(map(str, sorted(missing)))}")
+
+        for survey in surveys:
+            matrix = build_response_matrix(survey, full=options['full'])
+            self.stdout.write(f"Survey {survey.pk} '{survey.title}': {len(matrix)} responses in {matrix_dir(survey.pk)}")
@@ -0,0 +1,31 @@
+# surveys/management/commands/export_responses.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from surveys.export import EXPORT_FORMATS, CHUNK_SIZE, stream_export
+from surveys.models import Survey
+
+
+class Command(BaseCommand):
+    help = "Stream a survey's responses as wide-format CSV or JSONL (one row per response, one column per question)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('survey_id', type=int)
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', dest='export_format')
+        parser.add_argument('--output', '-o', help="File to write to. Defaults to standard output.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            survey = Survey.objects.get(pk=options['survey_id'])
+        except Survey.DoesNotExist:
+            raise CommandError(f"Survey {options['survey_id']} does not exist.")
+
+        lines = stream_export(survey, options['export_format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+            self.stderr.write(self.style.SUCCESS(f"Exported '{survey.title}' to {options['output']}."))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,29 @@
+# surveys/management/commands/export_survey_definition.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from surveys.definitions import definition_formats, dump_definition, export_definition
+from surveys.models import Survey
+
+
+class Command(BaseCommand):
+    help = "Write a survey's settings, questions and choices as a JSON or YAML definition (see surveys/definitions.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('survey_id', type=int)
+        parser.add_argument('--format', choices=definition_formats(), default='json', dest='definition_format')
+        parser.add_argument('--output', '-o', help="File to write to. Defaults to standard output.")
+
+    def handle(self, *args, **options):
+        try:
+            survey = Survey.objects.get(pk=options['survey_id'])
+        except Survey.DoesNotExist:
+            raise CommandError(f"Survey {options['survey_id']} does not exist.")
+
+        text = dump_definition(export_definition(survey), options['definition_format'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(text)
+            self.stderr.write(self.style.SUCCESS(f"Exported the definition of '{survey.title}' to {options['output']}."))
+        else:
+            self.stdout.write(text, ending='')
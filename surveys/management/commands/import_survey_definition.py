@@ -0,0 +1,35 @@
+# surveys/management/commands/import_survey_definition.py
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from surveys.definitions import format_for_filename, import_definition, load_definition
+
+
+class Command(BaseCommand):
+    help = "Create new surveys from JSON or YAML definition files (see surveys/definitions.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help="Definition files; .yaml/.yml files are read as YAML, others as JSON.")
+        parser.add_argument('--creator', required=True, help="Username of the user who will own the new surveys.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            creator = User.objects.get(username=options['creator'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['creator']}' does not exist.")
+
+        for path in options['files']:
+            try:
+                with open(path, encoding='utf-8-sig') as definition_file:
+                    definition = load_definition(definition_file.read(), format_for_filename(path))
+                survey = import_definition(definition, creator)
+            except OSError as error:
+                raise CommandError(f"{path}: {error}")
+            except ValidationError as error:
+                raise CommandError(f"{path}:\n  " + "\n  ".join(error.messages))
+            self.stdout.write(self.style.SUCCESS(
+                f"{path}: created survey {survey.pk} '{survey.title}' with {survey.questions.count()} questions."
+            ))
@@ -0,0 +1,40 @@
+# surveys/management/commands/rebuild_tallies.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from surveys.models import Survey
+from surveys.schema import get_survey_schema
+from surveys.tallies import rebuild_tallies, verify_tallies
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-survey results tallies from the raw responses, or verify them with --verify."
+
+    def add_arguments(self, parser):
+        parser.add_argument('survey_ids', nargs='*', type=int, help="Surveys to process. Defaults to every survey.")
+        parser.add_argument('--verify', action='store_true', help="Only compare the tallies with the raw responses; change nothing.")
+
+    def handle(self, *args, **options):
+        survey_ids = options['survey_ids'] or list(Survey.objects.values_list('pk', flat=True))
+        failed = False
+        for survey_id in survey_ids:
+            try:
+                schema = get_survey_schema(survey_id)
+            except Survey.DoesNotExist:
+                raise CommandError(f"Survey {survey_id} does not exist.")
+
+            if options['verify']:
+                problems = verify_tallies(schema)
+                if problems:
+                    failed = True
+                    self.stdout.write(self.style.ERROR(f"Survey {survey_id} '{schema.title}': {len(problems)} mismatch(es)"))
+                    for problem in problems:
+                        self.stdout.write(f"  - {problem}")
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"Survey {survey_id} '{schema.title}': tallies are correct"))
+            else:
+                rebuild_tallies(schema)
+                self.stdout.write(self.style.SUCCESS(f"Survey {survey_id} '{schema.title}': tallies rebuilt"))
+
+        if failed:
+            raise CommandError("Some tallies do not match the responses. Run rebuild_tallies without --verify to fix them.")
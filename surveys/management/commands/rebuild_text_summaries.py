@@ -0,0 +1,24 @@
+# surveys/management/commands/rebuild_text_summaries.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from surveys.models import Survey
+from surveys.schema import get_survey_schema
+from surveys.text_summary import rebuild_text_summary
+
+
+class Command(BaseCommand):
+    help = "Recompute the word and word-pair counts of the text questions from the saved answers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('survey_ids', nargs='*', type=int, help="Surveys to process. Defaults to every survey.")
+
+    def handle(self, *args, **options):
+        survey_ids = options['survey_ids'] or list(Survey.objects.values_list('pk', flat=True))
+        for survey_id in survey_ids:
+            try:
+                schema = get_survey_schema(survey_id)
+            except Survey.DoesNotExist:
+                raise CommandError(f"Survey {survey_id} does not exist.")
+            terms = rebuild_text_summary(schema)
+            self.stdout.write(self.style.SUCCESS(f"Survey {survey_id} '{schema.title}': {terms} term count(s) rebuilt"))
@@ -0,0 +1,70 @@
+# surveys/management/commands/run_benchmarks.py
+
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from benchmarks.environment import benchmark_database
+from benchmarks.fixtures import seed
+from benchmarks.scenarios import build_scenarios, run_scenario, compare
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the survey hot paths (dashboard, take, submit, public link, results, admin) "
+        "against a freshly seeded throwaway database and print the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Simulated users making requests at the same time.")
+        parser.add_argument('--scenario', action='append', dest='scenarios', help="Only run this scenario (can be repeated).")
+        parser.add_argument('--surveys', type=int, default=5)
+        parser.add_argument('--questions', type=int, default=10, help="Questions per survey.")
+        parser.add_argument('--responses', type=int, default=100, help="Existing responses per survey.")
+        parser.add_argument('--output', '-o', help="Also write the JSON report to this file.")
+        parser.add_argument('--baseline', help="A previous JSON report to compare against.")
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--requests and --concurrency must be at least 1.")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as baseline_file:
+                baseline = json.load(baseline_file)
+
+        with benchmark_database():
+            self.stderr.write("Seeding the benchmark database...")
+            # take_post uses up one fresh respondent per request.
+            fixture = seed(surveys=options['surveys'], questions=options['questions'], responses=options['responses'], fresh=options['requests'])
+            scenarios = build_scenarios(fixture)
+            if options['scenarios']:
+                unknown = set(options['scenarios']) - {scenario.name for scenario in scenarios}
+                if unknown:
+                    raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+                scenarios = [scenario for scenario in scenarios if scenario.name in options['scenarios']]
+
+            results = {
+                'environment': {
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'database': connection.vendor,
+                },
+                'dataset': {key: options[key] for key in ('surveys', 'questions', 'responses')},
+                'scenarios': {},
+            }
+            for scenario in scenarios:
+                self.stderr.write(f"Running {scenario.name}...")
+                results['scenarios'][scenario.name] = run_scenario(scenario, options['requests'], options['concurrency'])
+
+        report = json.dumps(results, indent=2)
+        self.stdout.write(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(report + '\n')
+        if baseline is not None:
+            for line in compare(results, baseline):
+                self.stderr.write(line)
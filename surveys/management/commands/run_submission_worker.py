@@ -0,0 +1,47 @@
+# surveys/management/commands/run_submission_worker.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+
+from surveys.ingest import flush_queue
+from surveys.rollups import compact_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Save queued survey submissions (SUBMISSION_QUEUE_ENABLED mode) to the database in batches. "
+        "Run exactly one worker per queue file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Submissions saved per transaction.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit instead of running forever.")
+        parser.add_argument('--compact-interval', type=float, default=3600, help="Seconds between compactions of the submission-rate rollups.")
+
+    def handle(self, *args, **options):
+        last_compacted = None
+        while True:
+            if last_compacted is None or time.monotonic() - last_compacted >= options['compact_interval']:
+                merged = compact_rollups()
+                if merged:
+                    self.stdout.write(f"Compacted {merged} submission rollup row(s).")
+                last_compacted = time.monotonic()
+            try:
+                taken, saved = flush_queue(options['batch_size'])
+            except DatabaseError as error:
+                # e.g. the database is locked or briefly unreachable. The batch
+                # is still queued, so wait and try it again.
+                if options['once']:
+                    raise
+                self.stderr.write(f"Could not save queued submissions, retrying: {error}")
+                time.sleep(options['interval'])
+                continue
+            if taken:
+                self.stdout.write(f"Flushed {taken} queued submission(s), saved {saved}.")
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
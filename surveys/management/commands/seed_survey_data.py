@@ -0,0 +1,88 @@
+# surveys/management/commands/seed_survey_data.py
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from surveys.models import Profile, Question
+from surveys.seeding import SurveyDataGenerator, DEFAULT_USERS, DEFAULT_QUESTION_MIX, EPOCH
+
+
+def parse_counts(pairs, allowed, option):
+    """Turn ['STUDENT=1000', 'STAFF=50'] into {'STUDENT': 1000, 'STAFF': 50}."""
+    counts = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        key = key.upper()
+        if key not in allowed or not value.isdigit():
+            raise CommandError(f"{option}: expected KEY=NUMBER with KEY one of {', '.join(allowed)}, got '{pair}'.")
+        counts[key] = int(value)
+    return counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic users, surveys and responses for load testing. "
+        "Uses bulk inserts, so millions of answers take minutes. The same --seed always gives the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', nargs='+', metavar='TYPE=N',
+            help=f"Users per profile type. Default: {' '.join(f'{k}={v}' for k, v in DEFAULT_USERS.items())}",
+        )
+        parser.add_argument('--surveys', type=int, default=20)
+        parser.add_argument(
+            '--questions', nargs='+', metavar='TYPE=N',
+            help=f"Questions of each type in every survey. Default: {' '.join(f'{k}={v}' for k, v in DEFAULT_QUESTION_MIX.items())}",
+        )
+        parser.add_argument('--choices', type=int, default=4, help="Choices per (multiple) choice question.")
+        parser.add_argument('--response-rate', type=float, default=0.5, help="Fraction of eligible users who answer each survey.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows per bulk insert.")
+        parser.add_argument(
+            '--now', metavar='DATETIME',
+            help=f"Date the data is generated as of, e.g. 2025-06-01 or 'now'. Default: {EPOCH.date()}",
+        )
+
+    def handle(self, *args, **options):
+        user_types = [value for value, _ in Profile.USER_TYPE_CHOICES]
+        users = parse_counts(options['users'], user_types, '--users') if options['users'] else None
+        question_mix = parse_counts(options['questions'], Question.QuestionType.values, '--questions') if options['questions'] else None
+        if not 0 <= options['response_rate'] <= 1:
+            raise CommandError("--response-rate must be between 0 and 1.")
+        if options['choices'] < 1 or options['chunk_size'] < 1:
+            raise CommandError("--choices and --chunk-size must be at least 1.")
+        now = None
+        if options['now'] == 'now':
+            now = timezone.now()
+        elif options['now']:
+            try:
+                now = parse_datetime(options['now']) or parse_datetime(f"{options['now']}T00:00")
+            except ValueError:
+                now = None
+            if now is None:
+                raise CommandError(f"--now: expected a date or date and time like 2025-06-01 14:00, got '{options['now']}'.")
+            if timezone.is_naive(now):
+                now = timezone.make_aware(now)
+        if get_user_model().objects.filter(username__startswith=f"seed{options['seed']}-").exists():
+            raise CommandError(f"Data for --seed {options['seed']} already exists. Use a different --seed.")
+
+        started = time.monotonic()
+        generator = SurveyDataGenerator(
+            users=users,
+            surveys=options['surveys'],
+            question_mix=question_mix,
+            choices=options['choices'],
+            response_rate=options['response_rate'],
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+            log=lambda message: self.stderr.write(message),
+            now=now,
+        )
+        counts = generator.run()
+        summary = ', '.join(f"{n} {name.replace('_', ' ')}" for name, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Created {summary} in {time.monotonic() - started:.1f}s."))
@@ -0,0 +1,326 @@
+# surveys/matrix.py
+
+"""
+Columnar, memory-mapped response matrix for analytics.
+
+Each survey's answers are materialized on disk as NumPy arrays with one row
+per Response (ordered by response id):
+
+    response_ids.npy   int64   (rows,)            Response.id of each row
+    choice.npy         int16   (rows, CHOICE qs)  index into the question's choices, -1 = skipped
+    rating.npy         int8    (rows, RATING qs)  the 1-5 rating, 0 = skipped
+    multi.npy          uint8   (rows, MULTI choices) multi-hot: one 0/1 column per MULTICHOICE choice
+    text_index.npy     int64   (rows, TEXT qs, 2) [start, end) byte offsets into text.bin, -1 = skipped
+    text.bin                                     UTF-8 text of every TEXT/TEXTAREA answer, back to back
+    meta.json                                    column layout and the last response id included
+
+The arrays are opened with `np.load(mmap_mode='r')`, so counts can run
+vectorized over them without going back to the Answer/Answer.choices
+tables. The segments page's cross-tab of the whole survey does this (see
+segments.py): it counts the responses in the matrix here and only the
+responses submitted since the last build in the database.
+
+`build_response_matrix` only reads responses newer than the last build. A
+change to the survey's questions or choices, or a deleted response that the
+matrix still holds, forces a full rebuild; until then usable_response_matrix()
+refuses to hand out the stale matrix.
+"""
+
+import json
+import os
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .models import Question, Response, Answer
+from .schema import get_survey_schema
+
+CHUNK_SIZE = 5000
+MATRIX_FORMAT_VERSION = 2
+
+CHOICE_FILE = 'choice.npy'
+RATING_FILE = 'rating.npy'
+MULTI_FILE = 'multi.npy'
+TEXT_INDEX_FILE = 'text_index.npy'
+TEXT_BLOB_FILE = 'text.bin'
+RESPONSE_IDS_FILE = 'response_ids.npy'
+META_FILE = 'meta.json'
+
+
+def matrix_dir(survey_id):
+    base = getattr(settings, 'ANALYTICS_CACHE_DIR', Path(settings.BASE_DIR) / 'analytics_cache')
+    return Path(base) / f'survey_{survey_id}'
+
+
+def survey_layout(schema):
+    """Describe which column of which array holds each question of a survey schema (see schema.py)."""
+    layout = {'choice': [], 'rating': [], 'multi': [], 'text': [], 'choices': {}}
+    multi_offset = 0
+    for question in schema.questions:
+        if question.choices:
+            layout['choices'][str(question.id)] = [choice.id for choice in question.choices]
+        if question.question_type == Question.QuestionType.CHOICE:
+            layout['choice'].append(question.id)
+        elif question.question_type == Question.QuestionType.RATING:
+            layout['rating'].append(question.id)
+        elif question.question_type == Question.QuestionType.MULTIPLE_CHOICE:
+            width = len(question.choices)
+            layout['multi'].append([question.id, multi_offset, width])
+            multi_offset += width
+        else:
+            layout['text'].append(question.id)
+    layout['multi_width'] = multi_offset
+    return layout
+
+
+class ResponseMatrix:
+    """A read-only, memory-mapped view of one survey's response matrix."""
+
+    def __init__(self, path, meta):
+        self.path = Path(path)
+        self.meta = meta
+        self.layout = meta['layout']
+        self.response_ids = np.load(self.path / RESPONSE_IDS_FILE, mmap_mode='r')
+        self.choice = np.load(self.path / CHOICE_FILE, mmap_mode='r')
+        self.rating = np.load(self.path / RATING_FILE, mmap_mode='r')
+        self.multi = np.load(self.path / MULTI_FILE, mmap_mode='r')
+        self.text_index = np.load(self.path / TEXT_INDEX_FILE, mmap_mode='r')
+        self._choice_col = {qid: i for i, qid in enumerate(self.layout['choice'])}
+        self._rating_col = {qid: i for i, qid in enumerate(self.layout['rating'])}
+        self._text_col = {qid: i for i, qid in enumerate(self.layout['text'])}
+        self._multi_cols = {qid: (offset, width) for qid, offset, width in self.layout['multi']}
+
+    def __len__(self):
+        return len(self.response_ids)
+
+    def choice_ids(self, question_id):
+        """The Choice ids of a question, in the order used for indices and columns."""
+        return self.layout['choices'].get(str(question_id), [])
+
+    def choice_column(self, question_id):
+        return self.choice[:, self._choice_col[question_id]]
+
+    def rating_column(self, question_id):
+        return self.rating[:, self._rating_col[question_id]]
+
+    def multi_columns(self, question_id):
+        offset, width = self._multi_cols[question_id]
+        return self.multi[:, offset:offset + width]
+
+    def choice_counts(self, question_id):
+        """Return {choice id: times selected} for a CHOICE or MULTICHOICE question."""
+        choice_ids = self.choice_ids(question_id)
+        if question_id in self._multi_cols:
+            counts = self.multi_columns(question_id).sum(axis=0, dtype=np.int64)
+        else:
+            column = self.choice_column(question_id)
+            counts = np.bincount(column[column >= 0], minlength=len(choice_ids))
+        return dict(zip(choice_ids, counts.tolist()))
+
+    def rating_histogram(self, question_id):
+        """Return {rating value: count} for a RATING question, skipped answers excluded."""
+        counts = np.bincount(self.rating_column(question_id).astype(np.int64), minlength=6)
+        return {value: int(counts[value]) for value in range(1, len(counts)) if counts[value]}
+
+    def one_hot(self, question_id):
+        """
+        A (rows, values) 0/1 matrix of a CHOICE, MULTICHOICE or RATING
+        question, and the value of each column: choice ids, or '1'-'5' for
+        ratings (the same values segments.py counts in the database).
+        """
+        if question_id in self._multi_cols:
+            return np.asarray(self.multi_columns(question_id), dtype=np.int64), self.choice_ids(question_id)
+        if question_id in self._rating_col:
+            column, values = self.rating_column(question_id), list(range(1, 6))
+            labels = [str(value) for value in values]
+        else:
+            column, values = self.choice_column(question_id), list(range(len(self.choice_ids(question_id))))
+            labels = self.choice_ids(question_id)
+        return (np.asarray(column)[:, None] == np.asarray(values, dtype=np.int64)[None, :]).astype(np.int64), labels
+
+    def cross_tab_counts(self, row_question_id, column_question_id):
+        """{(row value, column value): responses} for two choice/rating questions, as one matrix product."""
+        rows, row_values = self.one_hot(row_question_id)
+        columns, column_values = self.one_hot(column_question_id)
+        counts = rows.T @ columns
+        return {
+            (row_value, column_value): int(counts[i, j])
+            for i, row_value in enumerate(row_values)
+            for j, column_value in enumerate(column_values)
+            if counts[i, j]
+        }
+
+    def text(self, row, question_id):
+        """Return the text answer of one row, or None when it was skipped."""
+        start, end = self.text_index[row, self._text_col[question_id]]
+        if start < 0:
+            return None
+        with open(self.path / TEXT_BLOB_FILE, 'rb') as blob:
+            blob.seek(int(start))
+            return blob.read(int(end - start)).decode('utf-8')
+
+
+def load_response_matrix(survey_id):
+    """Open the cached matrix for a survey, or return None if it was never built."""
+    path = matrix_dir(survey_id)
+    try:
+        with open(path / META_FILE, encoding='utf-8') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta.get('version') != MATRIX_FORMAT_VERSION:
+        return None
+    try:
+        matrix = ResponseMatrix(path, meta)
+    except FileNotFoundError:
+        return None
+    # A build that crashed half-way can leave arrays of different lengths;
+    # treat that as "not built" so the next build starts from scratch.
+    lengths = {len(matrix.response_ids), len(matrix.choice), len(matrix.rating), len(matrix.multi), len(matrix.text_index)}
+    if lengths != {meta['rows']}:
+        return None
+    return matrix
+
+
+def usable_response_matrix(schema):
+    """
+    The survey's matrix if it is built for the survey's current questions and
+    still holds every response up to its last response id (none was deleted
+    since), else None. Responses submitted after that id are not in it; count
+    them separately. One query.
+    """
+    matrix = load_response_matrix(schema.id)
+    if matrix is None or matrix.layout != survey_layout(schema):
+        return None
+    still_there = Response.objects.filter(survey_id=schema.id, id__lte=matrix.meta['last_response_id']).count()
+    return matrix if still_there == len(matrix) else None
+
+
+def _read_block(layout, response_ids, blob, blob_offset):
+    """Fill the array rows for one chunk of responses. Returns the arrays and the new blob offset."""
+    rows = len(response_ids)
+    row_of = {response_id: i for i, response_id in enumerate(response_ids)}
+    choice_col = {qid: i for i, qid in enumerate(layout['choice'])}
+    rating_col = {qid: i for i, qid in enumerate(layout['rating'])}
+    text_col = {qid: i for i, qid in enumerate(layout['text'])}
+    multi_offset = {qid: offset for qid, offset, _ in layout['multi']}
+    choice_position = {
+        choice_id: position
+        for choice_ids in layout['choices'].values()
+        for position, choice_id in enumerate(choice_ids)
+    }
+
+    choice = np.full((rows, len(layout['choice'])), -1, dtype=np.int16)
+    rating = np.zeros((rows, len(layout['rating'])), dtype=np.int8)
+    multi = np.zeros((rows, layout['multi_width']), dtype=np.uint8)
+    text_index = np.full((rows, len(layout['text']), 2), -1, dtype=np.int64)
+
+    answers = Answer.objects.filter(response_id__in=response_ids).values_list('response_id', 'question_id', 'body')
+    for response_id, question_id, body in answers:
+        row = row_of[response_id]
+        if question_id in rating_col:
+            if body and body.isdigit() and 1 <= int(body) <= 5:
+                rating[row, rating_col[question_id]] = int(body)
+        elif question_id in text_col and body:
+            encoded = body.encode('utf-8')
+            blob.write(encoded)
+            text_index[row, text_col[question_id]] = (blob_offset, blob_offset + len(encoded))
+            blob_offset += len(encoded)
+
+    selections = Answer.choices.through.objects.filter(
+        answer__response_id__in=response_ids
+    ).values_list('answer__response_id', 'answer__question_id', 'choice_id')
+    for response_id, question_id, choice_id in selections:
+        if choice_id not in choice_position:
+            continue
+        row = row_of[response_id]
+        if question_id in choice_col:
+            choice[row, choice_col[question_id]] = choice_position[choice_id]
+        elif question_id in multi_offset:
+            multi[row, multi_offset[question_id] + choice_position[choice_id]] = 1
+
+    return (choice, rating, multi, text_index), blob_offset
+
+
+def _append_array(path, old, new):
+    """Write old + new rows to `path` atomically, copying the old rows straight from the memory map."""
+    tmp = path.with_name(path.name + '.tmp')
+    rows = (0 if old is None else len(old)) + len(new)
+    shape = (rows,) + new.shape[1:]
+    out = np.lib.format.open_memmap(tmp, mode='w+', dtype=new.dtype, shape=shape)
+    if old is not None and len(old):
+        out[:len(old)] = old
+    out[rows - len(new):] = new
+    out.flush()
+    del out
+    os.replace(tmp, path)
+
+
+def build_response_matrix(survey, full=False, chunk_size=CHUNK_SIZE):
+    """
+    Bring the on-disk matrix of a survey up to date and return it opened.
+
+    Only responses newer than the last build are read from the database,
+    unless `full` is set, the survey's questions/choices changed since then,
+    or a response the matrix holds was deleted.
+    """
+    path = matrix_dir(survey.pk)
+    schema = get_survey_schema(survey.pk)
+    layout = survey_layout(schema)
+    current = None if full else usable_response_matrix(schema)
+
+    path.mkdir(parents=True, exist_ok=True)
+    if current is None:
+        last_id = 0
+        old = dict.fromkeys(('response_ids', 'choice', 'rating', 'multi', 'text_index'))
+        blob_mode = 'wb'
+    else:
+        last_id = current.meta['last_response_id']
+        old = {name: getattr(current, name) for name in ('response_ids', 'choice', 'rating', 'multi', 'text_index')}
+        blob_mode = 'ab'
+
+    response_ids = (
+        Response.objects.filter(survey=survey, id__gt=last_id)
+        .order_by('id')
+        .values_list('id', flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+    blocks = {name: [] for name in old}
+    with open(path / TEXT_BLOB_FILE, blob_mode) as blob:
+        blob_offset = blob.tell()
+        while True:
+            chunk = list(islice(response_ids, chunk_size))
+            if not chunk:
+                break
+            arrays, blob_offset = _read_block(layout, chunk, blob, blob_offset)
+            blocks['response_ids'].append(np.asarray(chunk, dtype=np.int64))
+            for name, array in zip(('choice', 'rating', 'multi', 'text_index'), arrays):
+                blocks[name].append(array)
+            last_id = chunk[-1]
+
+    if current is None or blocks['response_ids']:
+        # An empty build still writes zero-row arrays of the right shape.
+        empty = {
+            'response_ids': np.zeros((0,), dtype=np.int64),
+            'choice': np.zeros((0, len(layout['choice'])), dtype=np.int16),
+            'rating': np.zeros((0, len(layout['rating'])), dtype=np.int8),
+            'multi': np.zeros((0, layout['multi_width']), dtype=np.uint8),
+            'text_index': np.zeros((0, len(layout['text']), 2), dtype=np.int64),
+        }
+        files = {
+            'response_ids': RESPONSE_IDS_FILE, 'choice': CHOICE_FILE, 'rating': RATING_FILE,
+            'multi': MULTI_FILE, 'text_index': TEXT_INDEX_FILE,
+        }
+        for name, filename in files.items():
+            new = np.concatenate(blocks[name]) if blocks[name] else empty[name]
+            _append_array(path / filename, old[name], new)
+
+    rows = (len(current) if current is not None else 0) + sum(len(block) for block in blocks['response_ids'])
+    meta = {'version': MATRIX_FORMAT_VERSION, 'rows': rows, 'last_response_id': last_id, 'layout': layout}
+    tmp = path / (META_FILE + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp, path / META_FILE)
+    return load_response_matrix(survey.pk)
@@ -0,0 +1,174 @@
+# surveys/metrics.py
+
+"""
+Per-view performance metrics, in the Prometheus text format.
+
+MetricsMiddleware (middleware.py) calls record_request() once per request
+with what it measured. Each worker process adds the numbers up in memory
+(a dict update under a lock) and every METRICS_FLUSH_INTERVAL seconds adds
+its totals into a small SQLite file shared by all gunicorn workers on the
+machine. The /metrics view flushes its own worker and then renders the
+combined totals from that file.
+
+Everything is a counter, or a histogram made of counters, so workers only
+ever add to the stored values and the order in which they flush does not
+matter. A worker that dies loses at most its last few seconds of numbers.
+"""
+
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+# Histogram bucket upper bounds. Seconds for the timings, bytes for the size.
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1_000, 5_000, 20_000, 100_000, 500_000, 1_000_000, 10_000_000)
+
+# name: (type, help, buckets or None)
+METRICS = {
+    'django_view_requests_total': ('counter', 'Requests handled, by view and status code.', None),
+    'django_view_latency_seconds': ('histogram', 'Time spent handling the request.', TIME_BUCKETS),
+    'django_view_sql_queries': ('histogram', 'SQL queries run per request.', QUERY_BUCKETS),
+    'django_view_sql_seconds': ('histogram', 'Time spent in SQL queries per request.', TIME_BUCKETS),
+    'django_view_template_seconds': ('histogram', 'Time spent rendering the response template.', TIME_BUCKETS),
+    'django_view_response_bytes': ('histogram', 'Size of the response body (streaming responses are not counted).', SIZE_BUCKETS),
+}
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    series TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels, series)
+)
+"""
+
+_lock = threading.Lock()
+_pending = {}  # (name, labels, series) -> value added since the last flush
+_last_flush = time.monotonic()
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', False)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    """Render labels the way they appear in the exposition format: view="x",status="200"."""
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+def _add(name, labels, series, value):
+    key = (name, labels, series)
+    _pending[key] = _pending.get(key, 0) + value
+
+
+def _observe(name, labels, value):
+    """Add one observation to a histogram: its bucket, the sum and the count."""
+    for bound in METRICS[name][2]:
+        if value <= bound:
+            _add(name, labels, f'{bound}', 1)
+            break
+    else:
+        _add(name, labels, '+Inf', 1)
+    _add(name, labels, 'sum', value)
+    _add(name, labels, 'count', 1)
+
+
+def record_request(view, status, latency, queries, sql_time, template_time=None, size=None):
+    """Add one request's measurements to this worker's pending totals."""
+    if add_request(view, status, latency, queries, sql_time, template_time, size):
+        flush()
+
+
+def add_request(view, status, latency, queries, sql_time, template_time=None, size=None):
+    """
+    record_request() without the flush. Returns True when a flush() is due,
+    for callers that must not block on the store (the async middleware).
+    """
+    labels = _labels(view=view)
+    with _lock:
+        _add('django_view_requests_total', _labels(view=view, status=status), 'total', 1)
+        _observe('django_view_latency_seconds', labels, latency)
+        _observe('django_view_sql_queries', labels, queries)
+        _observe('django_view_sql_seconds', labels, sql_time)
+        if template_time is not None:
+            _observe('django_view_template_seconds', labels, template_time)
+        if size is not None:
+            _observe('django_view_response_bytes', labels, size)
+    return time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL
+
+
+def _connect():
+    connection = sqlite3.connect(settings.METRICS_PATH, timeout=5)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.execute(STORE_SCHEMA)
+    return connection
+
+
+def flush():
+    """Add this worker's pending totals into the shared store."""
+    global _pending, _last_flush
+    with _lock:
+        pending, _pending = _pending, {}
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+    try:
+        connection = _connect()
+        try:
+            with connection:
+                connection.executemany(
+                    'INSERT INTO metric (name, labels, series, value) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (name, labels, series) DO UPDATE SET value = value + excluded.value',
+                    [(name, labels, series, value) for (name, labels, series), value in pending.items()],
+                )
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        # Metrics must never break a request. Keep the numbers for the next flush.
+        with _lock:
+            for key, value in pending.items():
+                _pending[key] = _pending.get(key, 0) + value
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_metrics():
+    """Flush this worker, then return every stored metric in the Prometheus text format."""
+    flush()
+    connection = _connect()
+    try:
+        rows = connection.execute('SELECT name, labels, series, value FROM metric ORDER BY name, labels').fetchall()
+    finally:
+        connection.close()
+
+    stored = {}
+    for name, labels, series, value in rows:
+        stored.setdefault(name, {}).setdefault(labels, {})[series] = value
+
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for labels, series in stored.get(name, {}).items():
+            if buckets is None:
+                lines.append(f'{name}{{{labels}}} {_number(series.get("total", 0))}')
+                continue
+            # Buckets are stored individually and exposed cumulatively.
+            cumulative = 0
+            for bound in [f'{b}' for b in buckets] + ['+Inf']:
+                cumulative += series.get(bound, 0)
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {_number(cumulative)}')
+            lines.append(f'{name}_sum{{{labels}}} {_number(series.get("sum", 0))}')
+            lines.append(f'{name}_count{{{labels}}} {_number(series.get("count", 0))}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,196 @@
+# surveys/middleware.py
+
+import sqlite3
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connection
+from django.http import HttpResponse
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .metrics import metrics_enabled, add_request, flush
+from .throttling import throttling_enabled, route_limits, check_rate_limits, acquire_slot, release_slot
+
+
+class MetricsMiddleware:
+    """
+    Measures every request for the /metrics endpoint (see metrics.py): the
+    latency, the number of SQL queries and the time spent in them, the time
+    spent rendering a TemplateResponse, and the response size, per URL name.
+
+    SQL is measured with connection.execute_wrapper(), which only adds a
+    function call around each query. Templates are timed from
+    process_template_response() (just before Django renders the response)
+    until the end of rendering, so class-based views are covered; views that
+    call render() themselves count their rendering as view time.
+
+    Like the ThrottleMiddleware below, it works both ways: under ASGI it is a
+    coroutine, so the async views are not pushed onto a thread for its sake.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not metrics_enabled():
+            return self.get_response(request)
+        sql, count_query = self.sql_counter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        if self.record(request, response, time.perf_counter() - started, sql):
+            flush()
+        return response
+
+    async def __acall__(self, request):
+        if not metrics_enabled():
+            return await self.get_response(request)
+        sql, count_query = self.sql_counter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = await self.get_response(request)
+        if self.record(request, response, time.perf_counter() - started, sql):
+            await sync_to_async(flush)()
+        return response
+
+    def sql_counter(self):
+        sql = {'queries': 0, 'seconds': 0.0}
+
+        def count_query(execute, sql_text, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql_text, params, many, context)
+            finally:
+                sql['queries'] += 1
+                sql['seconds'] += time.perf_counter() - started
+
+        return sql, count_query
+
+    def record(self, request, response, latency, sql):
+        """Add the request to the totals. Returns True when they are due to be flushed."""
+        match = request.resolver_match
+        return add_request(
+            view=match.view_name if match else '<unresolved>',
+            status=response.status_code,
+            latency=latency,
+            queries=sql['queries'],
+            sql_time=sql['seconds'],
+            template_time=getattr(request, '_metrics_template_time', None),
+            size=None if response.streaming else len(response.content),
+        )
+
+    def process_template_response(self, request, response):
+        if metrics_enabled():
+            render_started = time.perf_counter()
+
+            def rendered(response):
+                request._metrics_template_time = time.perf_counter() - render_started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise, which only comes as sync middleware, made to work both ways.
+    Otherwise Django would run every request under ASGI through async_to_sync
+    just to get past it. Only the static files themselves are served from a
+    thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class ThrottleMiddleware:
+    """
+    Rate limiting and load shedding for the routes listed in
+    settings.RATE_LIMITS (see throttling.py). Over a token bucket the
+    request gets a 429, and with all of the route's concurrency slots busy
+    a 503; both with a Retry-After header.
+
+    Under ASGI, Django runs process_view() (and so the SQLite calls) on a
+    thread with sync_to_async; __call__ stays a coroutine.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        # The slot claimed in process_view() is given back once the response is ready.
+        token = getattr(request, '_throttle_slot', None)
+        if token is not None:
+            self.release(token)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        token = getattr(request, '_throttle_slot', None)
+        if token is not None:
+            await sync_to_async(self.release)(token)
+        return response
+
+    def release(self, token):
+        try:
+            release_slot(token)
+        except sqlite3.Error:
+            pass  # It expires on its own after SLOT_TIMEOUT.
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not throttling_enabled() or request.resolver_match is None:
+            return None
+        route = request.resolver_match.view_name
+        limits = route_limits(route)
+        if not limits:
+            return None
+        try:
+            retry_after = check_rate_limits(request, route, limits, view_kwargs)
+            if retry_after is not None:
+                return self.refuse(429, 'Too many requests. Please try again shortly.', retry_after)
+            if 'max_concurrent' in limits:
+                request._throttle_slot = acquire_slot(route, limits['max_concurrent'])
+                if request._throttle_slot is None:
+                    return self.refuse(503, 'The server is busy. Please try again shortly.', 1)
+        except sqlite3.Error:
+            return None
+        return None
+
+    def refuse(self, status, message, retry_after):
+        response = HttpResponse(message, status=status, content_type='text/plain')
+        response['Retry-After'] = str(retry_after)
+        return response
+
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0008_alter_survey_public_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['survey', 'submitted_at', 'id'], name='response_survey_submitted_idx'),
+        ),
+    ]
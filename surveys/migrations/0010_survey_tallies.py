@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0009_response_survey_submitted_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('selected_count', models.PositiveIntegerField(default=0)),
+                ('choice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tally', to='surveys.choice')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answered_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveBigIntegerField(default=0)),
+                ('rating_sum_squares', models.PositiveBigIntegerField(default=0)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tally', to='surveys.question')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SurveyTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('response_count', models.PositiveIntegerField(default=0)),
+                ('survey', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tally', to='surveys.survey')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RatingTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_tallies', to='surveys.question')),
+            ],
+            options={
+                'unique_together': {('question', 'value')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0011_response_anonymous_respondent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('MINUTE', 'Minute'), ('HOUR', 'Hour'), ('DAY', 'Day')], max_length=6)),
+                ('bucket_start', models.DateTimeField()),
+                ('user_type', models.CharField(max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('survey', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submission_rollups', to='surveys.survey')),
+            ],
+            options={
+                'unique_together': {('survey', 'granularity', 'bucket_start', 'user_type')},
+            },
+        ),
+    ]
@@ -0,0 +1,138 @@
+# Full-text search index over free-text answers (see surveys/search.py).
+#
+# SQLite gets an FTS5 table and Postgres a tsvector table with a GIN index.
+# Database triggers keep either one in step with surveys_answer, however the
+# answers are written (submissions, queued ingest, bulk seeding, the admin).
+
+from django.db import migrations
+
+TEXT_TYPES = "('TEXT', 'TEXTAREA')"
+
+SQLITE_FORWARDS = [
+    # The survey is stored as a token ("s<id>") in its own column, so a search
+    # within one survey is answered by the index instead of filtering afterwards.
+    """
+    CREATE VIRTUAL TABLE surveys_answer_fts USING fts5(
+        body, survey, question_id UNINDEXED, tokenize = 'porter unicode61'
+    )
+    """,
+    f"""
+    INSERT INTO surveys_answer_fts (rowid, body, survey, question_id)
+    SELECT a.id, a.body, 's' || r.survey_id, a.question_id
+    FROM surveys_answer a
+    JOIN surveys_response r ON r.id = a.response_id
+    JOIN surveys_question q ON q.id = a.question_id
+    WHERE q.question_type IN {TEXT_TYPES} AND a.body IS NOT NULL AND a.body != ''
+    """,
+    f"""
+    CREATE TRIGGER surveys_answer_fts_insert AFTER INSERT ON surveys_answer
+    WHEN NEW.body IS NOT NULL AND NEW.body != ''
+    BEGIN
+        INSERT INTO surveys_answer_fts (rowid, body, survey, question_id)
+        SELECT NEW.id, NEW.body, 's' || r.survey_id, NEW.question_id
+        FROM surveys_response r, surveys_question q
+        WHERE r.id = NEW.response_id AND q.id = NEW.question_id AND q.question_type IN {TEXT_TYPES};
+    END
+    """,
+    f"""
+    CREATE TRIGGER surveys_answer_fts_update AFTER UPDATE OF body ON surveys_answer
+    BEGIN
+        DELETE FROM surveys_answer_fts WHERE rowid = OLD.id;
+        INSERT INTO surveys_answer_fts (rowid, body, survey, question_id)
+        SELECT NEW.id, NEW.body, 's' || r.survey_id, NEW.question_id
+        FROM surveys_response r, surveys_question q
+        WHERE r.id = NEW.response_id AND q.id = NEW.question_id AND q.question_type IN {TEXT_TYPES}
+          AND NEW.body IS NOT NULL AND NEW.body != '';
+    END
+    """,
+    """
+    CREATE TRIGGER surveys_answer_fts_delete AFTER DELETE ON surveys_answer
+    BEGIN
+        DELETE FROM surveys_answer_fts WHERE rowid = OLD.id;
+    END
+    """,
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS surveys_answer_fts_delete",
+    "DROP TRIGGER IF EXISTS surveys_answer_fts_update",
+    "DROP TRIGGER IF EXISTS surveys_answer_fts_insert",
+    "DROP TABLE IF EXISTS surveys_answer_fts",
+]
+
+POSTGRES_FORWARDS = [
+    """
+    CREATE TABLE surveys_answer_search (
+        answer_id bigint PRIMARY KEY REFERENCES surveys_answer (id) ON DELETE CASCADE,
+        survey_id bigint NOT NULL,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX surveys_answer_search_document_idx ON surveys_answer_search USING GIN (document)",
+    "CREATE INDEX surveys_answer_search_survey_idx ON surveys_answer_search (survey_id)",
+    f"""
+    INSERT INTO surveys_answer_search (answer_id, survey_id, document)
+    SELECT a.id, r.survey_id, to_tsvector('english', a.body)
+    FROM surveys_answer a
+    JOIN surveys_response r ON r.id = a.response_id
+    JOIN surveys_question q ON q.id = a.question_id
+    WHERE q.question_type IN {TEXT_TYPES} AND coalesce(a.body, '') <> ''
+    """,
+    f"""
+    CREATE FUNCTION surveys_answer_search_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' THEN
+            DELETE FROM surveys_answer_search WHERE answer_id = OLD.id;
+        END IF;
+        INSERT INTO surveys_answer_search (answer_id, survey_id, document)
+        SELECT NEW.id, r.survey_id, to_tsvector('english', NEW.body)
+        FROM surveys_response r, surveys_question q
+        WHERE r.id = NEW.response_id AND q.id = NEW.question_id AND q.question_type IN {TEXT_TYPES}
+          AND coalesce(NEW.body, '') <> '';
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER surveys_answer_search_sync AFTER INSERT OR UPDATE OF body ON surveys_answer
+    FOR EACH ROW EXECUTE FUNCTION surveys_answer_search_sync()
+    """,
+]
+
+POSTGRES_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS surveys_answer_search_sync ON surveys_answer",
+    "DROP FUNCTION IF EXISTS surveys_answer_search_sync()",
+    "DROP TABLE IF EXISTS surveys_answer_search",
+]
+
+STATEMENTS = {
+    'sqlite': (SQLITE_FORWARDS, SQLITE_BACKWARDS),
+    'postgresql': (POSTGRES_FORWARDS, POSTGRES_BACKWARDS),
+}
+
+
+def _run(schema_editor, direction):
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if statements is None:
+        return  # No search index on other databases; search.py reports it as unavailable.
+    for statement in statements[direction]:
+        schema_editor.execute(statement, params=None)
+
+
+def create_search_index(apps, schema_editor):
+    _run(schema_editor, 0)
+
+
+def drop_search_index(apps, schema_editor):
+    _run(schema_editor, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0012_submission_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
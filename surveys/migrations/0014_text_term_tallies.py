@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0013_answer_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TextTermTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('n', models.PositiveSmallIntegerField()),
+                ('term', models.CharField(max_length=100)),
+                ('answer_count', models.PositiveIntegerField(default=0)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='term_tallies', to='surveys.question')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['question', 'n', '-answer_count'], name='term_tally_top_idx')],
+                'unique_together': {('question', 'term')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Switch an SQLite database to write-ahead logging (WAL), so pages keep
+# reading while a submission is being written.
+#
+# The journal mode is stored in the database file itself, so it only needs
+# setting once, here, rather than on every connection (which rewrote the
+# file whenever any manage.py command opened it). It cannot be changed
+# inside a transaction, hence atomic = False.
+
+from django.db import migrations
+
+
+def set_journal_mode(mode):
+    def apply(apps, schema_editor):
+        connection = schema_editor.connection
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode={mode}')
+    return apply
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('surveys', '0014_text_term_tallies'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_journal_mode('WAL'), set_journal_mode('DELETE')),
+    ]
@@ -101,19 +101,28 @@ class Response(models.Model):
     Represents a single, complete submission of a survey by a respondent.
     """
     survey = models.ForeignKey(Survey, on_delete=models.CASCADE, related_name='responses')
+    # Empty for anonymous submissions through a survey's public link.
     respondent = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='survey_responses'
+        related_name='survey_responses',
+        null=True,
+        blank=True,
     )
     submitted_at = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
-        return f"Response by {self.respondent.username} for '{self.survey.title}'"
+        respondent = self.respondent.username if self.respondent_id else 'an anonymous respondent'
+        return f"Response by {respondent} for '{self.survey.title}'"
 
     class Meta:
         # This crucial constraint ensures a user can only respond to a survey once.
+        # (Anonymous responses have no respondent, so they are not affected.)
         unique_together = ('survey', 'respondent')
+        indexes = [
+            # Serves the keyset-paginated responses browser (newest first).
+            models.Index(fields=['survey', 'submitted_at', 'id'], name='response_survey_submitted_idx'),
+        ]
 
 
 class Answer(models.Model):
@@ -130,7 +139,111 @@ class Answer(models.Model):
     choices = models.ManyToManyField(Choice, related_name='answers', blank=True)
 
     def __str__(self):
-        return f"Answer for Q: '{self.question.text[:30]}...' in Response ID: {self.response.id}"
+        return f"Answer for Q: '{self.question.text[:30]}...' in Response ID: {self.response_id}"
+
+
+# --- Denormalized Tallies for Fast Results ---
+# These are kept up to date with F() increments in the same transaction as each
+# submission (see tallies.py), so the results page can be built from a handful
+# of small rows instead of scanning every Answer. `manage.py rebuild_tallies`
+# recomputes (or just verifies) them from the raw responses.
+
+class SurveyTally(models.Model):
+    """
+    Number of responses to a survey. While this row exists, the other tallies
+    of the survey are being maintained; deleting it switches the results page
+    back to counting the raw answers until the tallies are rebuilt.
+    """
+    survey = models.OneToOneField(Survey, on_delete=models.CASCADE, related_name='tally')
+    response_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.survey.title}: {self.response_count} responses"
+
+
+class QuestionTally(models.Model):
+    """
+    Number of responses that answered a question. For RATING questions it also
+    keeps the sum and sum of squares of the ratings (for the mean and spread).
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name='tally')
+    answered_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveBigIntegerField(default=0)
+    rating_sum_squares = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.question.text[:30]}: answered {self.answered_count} times"
+
+
+class RatingTally(models.Model):
+    """How many times a RATING question was given a particular value (its histogram)."""
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='rating_tallies')
+    value = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.question.text[:30]}: {self.value} chosen {self.count} times"
+
+    class Meta:
+        unique_together = ('question', 'value')
+
+
+class ChoiceTally(models.Model):
+    """Number of times a choice was selected."""
+    choice = models.OneToOneField(Choice, on_delete=models.CASCADE, related_name='tally')
+    selected_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.choice.text}: selected {self.selected_count} times"
+
+
+class TextTermTally(models.Model):
+    """
+    How many answers to a TEXT or TEXTAREA question used a word (n=1) or a
+    pair of adjacent words (n=2, stored as "first second"). Common words
+    like "the" are left out (see text_summary.py).
+    """
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='term_tallies')
+    n = models.PositiveSmallIntegerField()
+    term = models.CharField(max_length=100)
+    answer_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.question.text[:30]}: '{self.term}' in {self.answer_count} answers"
+
+    class Meta:
+        unique_together = ('question', 'term')
+        indexes = [
+            # Serves the top terms of each question, most used first.
+            models.Index(fields=['question', 'n', '-answer_count'], name='term_tally_top_idx'),
+        ]
+
+
+# --- Submission Rate Rollups ---
+# Submissions per time bucket and respondent role, updated as responses arrive
+# and compacted from minute to hour to day buckets as they age (see rollups.py),
+# so the timeline page reads a few hundred rows instead of every Response.
+
+class SubmissionRollup(models.Model):
+    """Number of submissions to a survey by respondents of one role in one time bucket."""
+
+    class Granularity(models.TextChoices):
+        MINUTE = 'MINUTE', 'Minute'
+        HOUR = 'HOUR', 'Hour'
+        DAY = 'DAY', 'Day'
+
+    survey = models.ForeignKey(Survey, on_delete=models.CASCADE, related_name='submission_rollups')
+    granularity = models.CharField(max_length=6, choices=Granularity.choices)
+    bucket_start = models.DateTimeField()
+    # Profile.user_type of the respondents, or 'NONE' for anonymous / no profile.
+    user_type = models.CharField(max_length=20)
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.survey.title}: {self.count} {self.user_type} submissions in the {self.get_granularity_display().lower()} from {self.bucket_start}"
+
+    class Meta:
+        unique_together = ('survey', 'granularity', 'bucket_start', 'user_type')
 
 
 # --- Profile Model to Extend User ---
@@ -0,0 +1,80 @@
+# surveys/pagination.py
+
+"""
+Keyset (cursor) pagination helpers.
+
+OFFSET pagination makes the database walk and throw away every row before the
+requested page, so page 10,000 is far slower than page 1. Keyset pagination
+remembers the sort key of the last row shown and asks for the rows "after" it,
+which the (survey, submitted_at, id) index answers directly.
+"""
+
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(submitted_at, pk):
+    """Turn the sort key of a row into an opaque, URL-safe cursor string."""
+    raw = f"{submitted_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Turn a cursor string back into a (submitted_at, pk) tuple.
+    Returns None for a missing or tampered cursor, which means "first page".
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        timestamp, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def encode_rank_cursor(rank, pk):
+    """Cursor for a row of ranked search results. repr() keeps the float exact."""
+    raw = f"{rank!r}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_rank_cursor(cursor):
+    """Turn a search cursor back into a (rank, pk) tuple, or None for the first page."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        rank, pk = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+        return float(rank), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_page(queryset, cursor=None, page_size=25):
+    """
+    Return (rows, next_cursor) for one page of `queryset`, newest first.
+
+    `queryset` must be a Response queryset (anything with `submitted_at` and
+    `id`). One extra row is fetched to find out whether a next page exists,
+    so there is no COUNT(*) query.
+    """
+    queryset = queryset.order_by('-submitted_at', '-id')
+    position = decode_cursor(cursor)
+    if position:
+        submitted_at, pk = position
+        queryset = queryset.filter(
+            Q(submitted_at__lt=submitted_at) | Q(submitted_at=submitted_at, id__lt=pk)
+        )
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.submitted_at, last.pk)
+    return rows, next_cursor
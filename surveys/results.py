@@ -0,0 +1,180 @@
+# surveys/results.py
+
+"""
+Aggregated survey results, computed in the database.
+
+The results page used to walk every Response -> Answer -> Choice in the
+template, which costs a few queries *per answer*. Everything here is done
+with a fixed number of GROUP BY queries, no matter how many responses a
+survey has, and the page renders from the summary that is returned. The
+questions and choice texts come from the cached survey schema (schema.py).
+
+When a survey's tally tables are maintained (tallies.py), the same summary is
+built from them instead, which reads one row per question and choice.
+"""
+
+from django.db.models import Count, Q
+
+from .models import Question, Response, Answer, SurveyTally, QuestionTally, RatingTally, ChoiceTally
+
+CHOICE_TYPES = (Question.QuestionType.CHOICE, Question.QuestionType.MULTIPLE_CHOICE)
+
+# The take form offers a fixed 1-5 scale for RATING questions.
+RATING_SCALE = range(1, 6)
+
+
+def _percent(part, whole):
+    return round(100.0 * part / whole, 1) if whole else 0.0
+
+
+def _median_from_histogram(histogram, total):
+    """Median of the values described by a {value: count} histogram."""
+    if not total:
+        return None
+    # The median sits at position(s) (total - 1) // 2 and total // 2 (0-based).
+    wanted = sorted({(total - 1) // 2, total // 2})
+    found = []
+    seen = 0
+    for value in sorted(histogram):
+        seen += histogram[value]
+        while wanted and wanted[0] < seen:
+            found.append(value)
+            wanted.pop(0)
+    return sum(found) / len(found)
+
+
+def rating_stats(histogram):
+    """Build the histogram rows, mean and median for a RATING question."""
+    total = sum(histogram.values())
+    return {
+        'histogram': [
+            {'value': value, 'count': histogram.get(value, 0), 'percent': _percent(histogram.get(value, 0), total)}
+            for value in RATING_SCALE
+        ],
+        'count': total,
+        'mean': round(sum(v * n for v, n in histogram.items()) / total, 2) if total else None,
+        'median': _median_from_histogram(histogram, total),
+    }
+
+
+def rating_question_ids(schema):
+    return [question.id for question in schema.questions if question.question_type == Question.QuestionType.RATING]
+
+
+def live_counts(schema):
+    """
+    Count everything the summary needs straight from the Response/Answer tables.
+    Always four GROUP BY queries, whatever the number of responses.
+    """
+    survey_id = schema.id
+    total_responses = Response.objects.filter(survey_id=survey_id).count()
+
+    # An answer counts as "answered" if it has a non-empty body or at least one
+    # selected choice. TEXT and RATING answers are stored even when left blank.
+    answered_counts = dict(
+        Answer.objects.filter(response__survey_id=survey_id)
+        .values('question_id')
+        .annotate(answered=Count(
+            'id',
+            filter=(Q(body__isnull=False) & ~Q(body='')) | Q(choices__isnull=False),
+            distinct=True,
+        ))
+        .values_list('question_id', 'answered')
+    )
+
+    # Choice ids belong to exactly one survey, so the selections can be counted
+    # straight from the answer-choice table without joining back to Answer.
+    selected_counts = dict(
+        Answer.choices.through.objects.filter(choice_id__in=schema.choice_text)
+        .values('choice_id')
+        .annotate(n=Count('id'))
+        .values_list('choice_id', 'n')
+    )
+
+    histograms = {}
+    rating_rows = (
+        Answer.objects.filter(
+            question_id__in=rating_question_ids(schema),
+            body__in=[str(value) for value in RATING_SCALE],
+        )
+        .values_list('question_id', 'body')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for question_id, body, n in rating_rows:
+        histograms.setdefault(question_id, {})[int(body)] = n
+
+    return {
+        'total_responses': total_responses,
+        'answered': answered_counts,
+        'selected': selected_counts,
+        'ratings': histograms,
+    }
+
+
+def tallied_counts(schema):
+    """
+    Read the same counts as live_counts() from the tally tables (see tallies.py),
+    which hold one small row per question/choice. Returns None when the survey's
+    tallies are not being maintained, so the caller can fall back to live counts.
+    """
+    total_responses = SurveyTally.objects.filter(survey_id=schema.id).values_list('response_count', flat=True).first()
+    if total_responses is None:
+        return None
+    question_ids = [question.id for question in schema.questions]
+    histograms = {}
+    for question_id, value, count in RatingTally.objects.filter(question_id__in=rating_question_ids(schema)).values_list('question_id', 'value', 'count'):
+        if count:
+            histograms.setdefault(question_id, {})[value] = count
+    return {
+        'total_responses': total_responses,
+        'answered': dict(QuestionTally.objects.filter(question_id__in=question_ids).values_list('question_id', 'answered_count')),
+        'selected': dict(ChoiceTally.objects.filter(choice_id__in=schema.choice_text).values_list('choice_id', 'selected_count')),
+        'ratings': histograms,
+    }
+
+
+def summarize(schema, counts):
+    """
+    Turn raw counts into the per-question summary the results page renders.
+
+    The result is a dict with the total response count and one entry per
+    question (in survey order) holding answered/skipped counts, plus choice
+    counts for CHOICE/MULTICHOICE questions and histogram/mean/median for
+    RATING questions.
+    """
+    total_responses = counts['total_responses']
+    summary = []
+    for question in schema.questions:
+        answered = counts['answered'].get(question.id, 0)
+        entry = {
+            'question': question,
+            'answered': answered,
+            'skipped': total_responses - answered,
+            'answered_percent': _percent(answered, total_responses),
+        }
+        if question.question_type in CHOICE_TYPES:
+            # Percentages are out of the respondents who answered the question,
+            # so they add up to more than 100% for MULTICHOICE questions.
+            entry['choices'] = [
+                {'choice': choice, 'count': counts['selected'].get(choice.id, 0), 'percent': _percent(counts['selected'].get(choice.id, 0), answered)}
+                for choice in question.choices
+            ]
+        elif question.question_type == Question.QuestionType.RATING:
+            entry['rating'] = rating_stats(counts['ratings'].get(question.id, {}))
+        summary.append(entry)
+
+    return {
+        'total_responses': total_responses,
+        'questions': summary,
+    }
+
+
+def build_results_summary(schema):
+    """Return the results summary of a survey (given its SurveySchema), counted from the raw answers."""
+    return summarize(schema, live_counts(schema))
+
+
+def get_results_summary(schema):
+    """Return the results summary of a survey, from its tallies when they are maintained."""
+    return summarize(schema, tallied_counts(schema) or live_counts(schema))
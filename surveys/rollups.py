@@ -0,0 +1,234 @@
+# surveys/rollups.py
+
+"""
+Submission-rate time series, backed by the SubmissionRollup table.
+
+Every submission adds one to the row for its survey, its respondent's role
+and the minute it arrived in, inside the same transaction that saves it.
+As rows age they are compacted: minute rows older than
+ROLLUP_MINUTE_RETENTION_HOURS are merged into hour rows, and hour rows older
+than ROLLUP_HOUR_RETENTION_DAYS into day rows (compact_rollups, run by the
+submission worker or `manage.py backfill_rollups --compact`). A month-long
+survey therefore needs a few hundred rows, whatever its number of responses.
+
+A series at some granularity adds up the rows of that granularity and all
+finer ones, so a chart is correct whether or not compaction has run yet.
+Minute resolution is only available while the minute rows are kept.
+`manage.py backfill_rollups` rebuilds a survey's rows from Response.submitted_at.
+
+A deleted response is taken out of its bucket again, at two queries per
+response. To delete many at once use deletion.delete_responses() (the
+admin's delete action does), which rebuilds the surveys' rollups once
+afterwards instead; after any other large delete, run
+`manage.py backfill_rollups` for the surveys concerned.
+"""
+
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, Trunc
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Survey, Response, Profile, SubmissionRollup
+from .segments import NO_ROLE, ROLE_LABELS, ROLE_PATH
+from .tallies import BulkResponseDeletion, _increment
+
+Granularity = SubmissionRollup.Granularity
+# Finest first. A series at one granularity reads the rows of it and the ones before it.
+GRANULARITIES = [Granularity.MINUTE, Granularity.HOUR, Granularity.DAY]
+TRUNC_KIND = {Granularity.MINUTE: 'minute', Granularity.HOUR: 'hour', Granularity.DAY: 'day'}
+STEP = {Granularity.MINUTE: timedelta(minutes=1), Granularity.HOUR: timedelta(hours=1), Granularity.DAY: timedelta(days=1)}
+CHUNK_SIZE = 500
+
+
+def bucket_start(moment, granularity):
+    """The start (in UTC) of the bucket of `granularity` that `moment` falls in."""
+    moment = moment.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+    if granularity != Granularity.MINUTE:
+        moment = moment.replace(minute=0)
+    if granularity == Granularity.DAY:
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def respondent_role(respondent):
+    """The role a submission is counted under. Uses the profile cached on the user when there is one."""
+    if respondent is None:
+        return NO_ROLE
+    try:
+        return respondent.profile.user_type
+    except Profile.DoesNotExist:
+        return NO_ROLE
+
+
+def record_submissions(submissions):
+    """
+    Count new submissions, given as (survey id, submitted_at, role) triples.
+    Must be called inside the transaction that saves them. Usually one UPDATE
+    per (survey, minute, role) in the batch.
+    """
+    groups = Counter((survey_id, bucket_start(submitted_at, Granularity.MINUTE), role) for survey_id, submitted_at, role in submissions)
+    for (survey_id, start, role), count in groups.items():
+        _increment(SubmissionRollup, 'user_type', [role], {'count': F('count') + count},
+                   survey_id=survey_id, granularity=Granularity.MINUTE, bucket_start=start)
+
+
+def _retention():
+    """How long rows of each granularity are kept before being merged into the next one."""
+    return {
+        Granularity.MINUTE: timedelta(hours=getattr(settings, 'ROLLUP_MINUTE_RETENTION_HOURS', 48)),
+        Granularity.HOUR: timedelta(days=getattr(settings, 'ROLLUP_HOUR_RETENTION_DAYS', 90)),
+    }
+
+
+def _cutoffs(now):
+    """{granularity: start of the oldest bucket still kept at it}, aligned so no coarser bucket is split."""
+    retention = _retention()
+    return {
+        Granularity.MINUTE: bucket_start(now - retention[Granularity.MINUTE], Granularity.HOUR),
+        Granularity.HOUR: bucket_start(now - retention[Granularity.HOUR], Granularity.DAY),
+    }
+
+
+def compact_rollups(now=None):
+    """
+    Merge minute rows past their retention into hour rows, then hour rows into
+    day rows. Returns the number of rows merged away.
+    """
+    cutoffs = _cutoffs(now or timezone.now())
+    merged = 0
+    for finer, coarser in zip(GRANULARITIES, GRANULARITIES[1:]):
+        with transaction.atomic():
+            # Locked, so a late submission cannot bump a row between reading and deleting it.
+            old_rows = list(
+                SubmissionRollup.objects.select_for_update()
+                .filter(granularity=finer, bucket_start__lt=cutoffs[finer])
+                .values_list('pk', 'survey_id', 'bucket_start', 'user_type', 'count')
+            )
+            if not old_rows:
+                continue
+            totals = Counter()
+            for _, survey_id, start, role, count in old_rows:
+                totals[survey_id, bucket_start(start, coarser), role] += count
+
+            existing = SubmissionRollup.objects.filter(
+                granularity=coarser,
+                survey_id__in={survey_id for survey_id, _, _ in totals},
+                bucket_start__in={start for _, start, _ in totals},
+            )
+            to_update = []
+            for row in existing:
+                key = (row.survey_id, row.bucket_start, row.user_type)
+                if key in totals:
+                    row.count += totals.pop(key)
+                    to_update.append(row)
+            SubmissionRollup.objects.bulk_update(to_update, ['count'], batch_size=CHUNK_SIZE)
+            SubmissionRollup.objects.bulk_create([
+                SubmissionRollup(survey_id=survey_id, granularity=coarser, bucket_start=start, user_type=role, count=count)
+                for (survey_id, start, role), count in totals.items()
+            ], batch_size=CHUNK_SIZE)
+            pks = [row[0] for row in old_rows]
+            for i in range(0, len(pks), CHUNK_SIZE):
+                SubmissionRollup.objects.filter(pk__in=pks[i:i + CHUNK_SIZE]).delete()
+            merged += len(old_rows)
+    return merged
+
+
+def rebuild_rollups(survey_id, now=None):
+    """Recompute a survey's rollups from its responses, already compacted."""
+    cutoffs = _cutoffs(now or timezone.now())
+    ranges = {
+        Granularity.DAY: Q(submitted_at__lt=cutoffs[Granularity.HOUR]),
+        Granularity.HOUR: Q(submitted_at__gte=cutoffs[Granularity.HOUR], submitted_at__lt=cutoffs[Granularity.MINUTE]),
+        Granularity.MINUTE: Q(submitted_at__gte=cutoffs[Granularity.MINUTE]),
+    }
+    with transaction.atomic():
+        # Locking the survey row makes new submissions (whose INSERT must lock
+        # it too, for the foreign key) wait until the rebuilt rows are committed.
+        list(Survey.objects.select_for_update().filter(pk=survey_id).values_list('pk', flat=True))
+        SubmissionRollup.objects.filter(survey_id=survey_id).delete()
+        rows = []
+        for granularity, condition in ranges.items():
+            counts = (
+                Response.objects.filter(condition, survey_id=survey_id)
+                .annotate(bucket=Trunc('submitted_at', TRUNC_KIND[granularity], tzinfo=dt_timezone.utc),
+                          role=Coalesce(ROLE_PATH, Value(NO_ROLE)))
+                .values_list('bucket', 'role')
+                .annotate(n=Count('id'))
+                .order_by()
+            )
+            rows += [SubmissionRollup(survey_id=survey_id, granularity=granularity, bucket_start=bucket, user_type=role, count=n)
+                     for bucket, role, n in counts]
+        SubmissionRollup.objects.bulk_create(rows, batch_size=CHUNK_SIZE)
+    return len(rows)
+
+
+def submission_series(survey_id, granularity, start=None, end=None):
+    """
+    Submissions to a survey per bucket of `granularity` and respondent role,
+    between the datetimes `start` (inclusive) and `end` (exclusive). One
+    GROUP BY query over the rollup rows. Buckets without submissions are
+    included with zero counts, from the first bucket with submissions (or
+    `start`) to `end` (or the last bucket with submissions).
+    """
+    rows = SubmissionRollup.objects.filter(survey_id=survey_id, granularity__in=GRANULARITIES[:GRANULARITIES.index(granularity) + 1])
+    if start:
+        rows = rows.filter(bucket_start__gte=bucket_start(start, granularity))
+    if end:
+        rows = rows.filter(bucket_start__lt=end)
+    counts = (
+        rows.annotate(bucket=Trunc('bucket_start', TRUNC_KIND[granularity], tzinfo=dt_timezone.utc))
+        .values_list('bucket', 'user_type')
+        .annotate(n=Sum('count'))
+        .order_by()
+    )
+    by_bucket = {}
+    for bucket, role, n in counts:
+        by_bucket.setdefault(bucket, Counter())[role] += n
+
+    roles = [(code, label) for code, label in ROLE_LABELS.items() if any(code in row for row in by_bucket.values())]
+    points = []
+    if by_bucket or start:
+        first = bucket_start(start, granularity) if start else min(by_bucket)
+        last = max(by_bucket) if by_bucket else first
+        if end:
+            last = max(last, bucket_start(end - timedelta(microseconds=1), granularity))
+        bucket = first
+        while bucket <= last:
+            row = by_bucket.get(bucket, Counter())
+            points.append({'bucket': bucket, 'counts': [row[code] for code, _ in roles], 'total': sum(row.values())})
+            bucket += STEP[granularity]
+    return {'granularity': granularity, 'roles': roles, 'points': points, 'total': sum(point['total'] for point in points)}
+
+
+# --- Signals ---
+
+@receiver(post_delete, sender=Response)
+def forget_submission(sender, instance, origin=None, **kwargs):
+    """
+    Take a deleted response out of its bucket. The role is looked up again, so
+    if the respondent's role changed since they submitted, the wrong role is
+    decremented; `manage.py backfill_rollups` puts that right.
+    """
+    if isinstance(origin, Survey):
+        return  # The survey's rollups are being deleted along with it.
+    if isinstance(origin, BulkResponseDeletion):
+        return  # They are rebuilt once the whole batch is deleted.
+    role = NO_ROLE
+    if instance.respondent_id:
+        role = Profile.objects.filter(user_id=instance.respondent_id).values_list('user_type', flat=True).first() or NO_ROLE
+    buckets = Q()
+    for granularity in GRANULARITIES:
+        buckets |= Q(granularity=granularity, bucket_start=bucket_start(instance.submitted_at, granularity))
+    # The finest bucket containing the submission has the latest start.
+    row = (
+        SubmissionRollup.objects.filter(buckets, survey_id=instance.survey_id, user_type=role, count__gt=0)
+        .order_by('-bucket_start').values_list('pk', flat=True).first()
+    )
+    if row:
+        SubmissionRollup.objects.filter(pk=row).update(count=F('count') - 1)
@@ -0,0 +1,217 @@
+# surveys/schema.py
+
+"""
+Compiled, cached survey definitions ("schemas").
+
+Taking a survey, submitting it and rendering its results all need the same
+read-only facts: the survey's settings, its ordered questions and each
+question's choices. Instead of reading Survey, Question and Choice on every
+request, they are compiled once into an immutable SurveySchema and stored in
+Django's cache under a per-survey version key.
+
+Saving or deleting a Survey, Question or Choice bumps that version (after the
+transaction commits), so the next request rebuilds the schema and stale
+copies are simply never looked up again.
+"""
+
+import uuid
+from typing import NamedTuple, Optional
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Survey, Question, Choice
+
+# Schemas are only ever replaced through a version bump, so they can live
+# for a long time; the timeout just lets unused ones age out of the cache.
+SCHEMA_TIMEOUT = 60 * 60 * 24
+QUESTION_TYPE_LABELS = dict(Question.QuestionType.choices)
+
+
+class ChoiceSchema(NamedTuple):
+    id: int
+    text: str
+
+
+class QuestionSchema(NamedTuple):
+    id: int
+    text: str
+    question_type: str
+    order: int
+    choices: tuple  # of ChoiceSchema, in creation order
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_question_type_display(self):
+        return QUESTION_TYPE_LABELS.get(self.question_type, self.question_type)
+
+
+class SurveySchema(NamedTuple):
+    id: int
+    version: str
+    title: str
+    description: str
+    creator_id: int
+    target_audience: str
+    is_active: bool
+    is_public: bool
+    public_id: uuid.UUID
+    start_date: Optional[datetime]
+    end_date: Optional[datetime]
+    questions: tuple  # of QuestionSchema, in survey order
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def valid_choices(self):
+        """{question id: frozenset of its choice ids}, used to validate submissions."""
+        return {question.id: frozenset(choice.id for choice in question.choices) for question in self.questions}
+
+    @property
+    def choice_text(self):
+        """{choice id: choice text} for every choice of the survey."""
+        return {choice.id: choice.text for question in self.questions for choice in question.choices}
+
+
+def _version_key(survey_id):
+    return f'survey-schema-version:{survey_id}'
+
+
+def _schema_key(survey_id, version):
+    return f'survey-schema:{survey_id}:{version}'
+
+
+def _public_id_key(public_id):
+    return f'survey-public-id:{public_id}'
+
+
+def get_schema_version(survey_id):
+    """Return the current version token of a survey's schema, creating one if needed."""
+    version = cache.get(_version_key(survey_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        # add() keeps a version another process set in the meantime.
+        if not cache.add(_version_key(survey_id), version, timeout=None):
+            version = cache.get(_version_key(survey_id), version)
+    return version
+
+
+def bump_schema_version(survey_id):
+    """Invalidate every cached schema (and template fragment) of a survey."""
+    cache.set(_version_key(survey_id), uuid.uuid4().hex, timeout=None)
+
+
+def compile_survey_schema(survey_id, version=''):
+    """Read a survey's definition from the database (three queries) and compile it."""
+    survey = Survey.objects.get(pk=survey_id)
+    choices = {}
+    for choice_id, question_id, text in Choice.objects.filter(question__survey_id=survey_id).order_by('id').values_list('id', 'question_id', 'text'):
+        choices.setdefault(question_id, []).append(ChoiceSchema(choice_id, text))
+    questions = tuple(
+        QuestionSchema(question.id, question.text, question.question_type, question.order, tuple(choices.get(question.id, ())))
+        for question in Question.objects.filter(survey_id=survey_id).order_by('order', 'id')
+    )
+    return SurveySchema(
+        id=survey.id,
+        version=version,
+        title=survey.title,
+        description=survey.description,
+        creator_id=survey.creator_id,
+        target_audience=survey.target_audience,
+        is_active=survey.is_active,
+        is_public=survey.is_public,
+        public_id=survey.public_id,
+        start_date=survey.start_date,
+        end_date=survey.end_date,
+        questions=questions,
+    )
+
+
+def get_survey_schema(survey_id):
+    """
+    Return the compiled schema of a survey, from the cache when possible.
+    Raises Survey.DoesNotExist if the survey does not exist.
+    """
+    version = get_schema_version(survey_id)
+    key = _schema_key(survey_id, version)
+    schema = cache.get(key)
+    if schema is None:
+        schema = compile_survey_schema(survey_id, version)
+        cache.set(key, schema, SCHEMA_TIMEOUT)
+    return schema
+
+
+def get_survey_id_for_public_id(public_id):
+    """Map a public link's UUID to a survey id. The mapping never changes, so it is cached without versioning."""
+    key = _public_id_key(public_id)
+    survey_id = cache.get(key)
+    if survey_id is None:
+        survey_id = Survey.objects.filter(public_id=public_id).values_list('id', flat=True).first()
+        if survey_id is None:
+            raise Survey.DoesNotExist
+        cache.set(key, survey_id, SCHEMA_TIMEOUT)
+    return survey_id
+
+
+# --- Async variants, for the ASGI views in async_views.py ---
+
+async def aget_survey_schema(survey_id):
+    """Async get_survey_schema(): the cache is read without blocking; a miss compiles the schema in a worker thread."""
+    version = await cache.aget(_version_key(survey_id))
+    if version is None:
+        return await sync_to_async(get_survey_schema)(survey_id)
+    schema = await cache.aget(_schema_key(survey_id, version))
+    if schema is None:
+        schema = await sync_to_async(compile_survey_schema)(survey_id, version)
+        await cache.aset(_schema_key(survey_id, version), schema, SCHEMA_TIMEOUT)
+    return schema
+
+
+async def aget_survey_id_for_public_id(public_id):
+    key = _public_id_key(public_id)
+    survey_id = await cache.aget(key)
+    if survey_id is None:
+        survey_id = await Survey.objects.filter(public_id=public_id).values_list('id', flat=True).afirst()
+        if survey_id is None:
+            raise Survey.DoesNotExist
+        await cache.aset(key, survey_id, SCHEMA_TIMEOUT)
+    return survey_id
+
+
+# --- Signals that keep the cache in step with the database ---
+
+def _bump_on_commit(survey_id):
+    # Bumping only after commit stops another request from caching the old
+    # rows under the new version while this transaction is still open.
+    if survey_id is not None:
+        transaction.on_commit(lambda: bump_schema_version(survey_id))
+
+
+@receiver([post_save, post_delete], sender=Survey)
+def survey_changed(sender, instance, **kwargs):
+    _bump_on_commit(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    _bump_on_commit(instance.survey_id)
+
+
+@receiver([post_save, post_delete], sender=Choice)
+def choice_changed(sender, instance, **kwargs):
+    # Choices saved through their question (question.choices, the choice
+    # formset, the admin inline) already carry it, so no query is needed.
+    if Choice.question.is_cached(instance):
+        survey_id = instance.question.survey_id
+    else:
+        survey_id = Question.objects.filter(pk=instance.question_id).values_list('survey_id', flat=True).first()
+    _bump_on_commit(survey_id)
@@ -0,0 +1,145 @@
+# surveys/search.py
+
+"""
+Full-text search over a survey's free-text (TEXT and TEXTAREA) answers.
+
+The index is created by migration 0013 and kept in step with surveys_answer
+by database triggers, so every way of saving an answer updates it in the
+same transaction:
+
+* SQLite: an FTS5 table (surveys_answer_fts) with the Porter stemmer. The
+  survey is indexed as a token of its own, so a search within a survey
+  only visits that survey's entries. Ranked with bm25().
+* Postgres: a tsvector table (surveys_answer_search) with a GIN index, using
+  the 'english' configuration. Ranked with ts_rank_cd().
+
+Results come best match first and are paged with a keyset cursor on
+(rank, answer id), so every page costs the same. Matches are highlighted
+with <mark> in a short snippet of each answer.
+"""
+
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Answer
+from .pagination import encode_rank_cursor, decode_rank_cursor
+
+# Snippet markers that cannot appear in an answer, swapped for <mark> after escaping.
+START, STOP = '\x02', '\x03'
+SNIPPET_WORDS = 16
+HEADLINE_OPTIONS = f'StartSel={START}, StopSel={STOP}, MaxWords={SNIPPET_WORDS}, MinWords=6, MaxFragments=2'
+# Words, "quoted phrases" and prefix* searches.
+TERM_RE = re.compile(r'"([^"]*)"|(\w+\*?)')
+
+
+def search_available():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def fts5_query(survey_id, query):
+    """
+    Build an FTS5 MATCH expression for a user's query, or None if it has no
+    words. Every term is quoted, so FTS5 operators typed by the user are
+    searched for as plain words instead of raising a syntax error.
+    """
+    terms = []
+    for phrase, word in TERM_RE.findall(query):
+        if phrase:
+            words = re.findall(r'\w+', phrase)
+            if words:
+                terms.append('"' + ' '.join(words) + '"')
+        elif word.endswith('*'):
+            terms.append(f'"{word[:-1]}"*')
+        else:
+            terms.append(f'"{word}"')
+    if not terms:
+        return None
+    return f'survey : s{survey_id} AND body : ({" ".join(terms)})'
+
+
+def _sqlite_rows(survey_id, query, after, limit):
+    expression = fts5_query(survey_id, query)
+    if expression is None:
+        return []
+    sql = (
+        'SELECT rowid, question_id, rank, snippet(surveys_answer_fts, 0, %s, %s, %s, %s) '
+        'FROM surveys_answer_fts WHERE surveys_answer_fts MATCH %s'
+    )
+    params = [START, STOP, '…', SNIPPET_WORDS, expression]
+    if after:
+        sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+        params += [after[0], after[0], after[1]]
+    sql += ' ORDER BY rank, rowid LIMIT %s'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit])
+        return cursor.fetchall()
+
+
+def _postgres_rows(survey_id, query, after, limit):
+    # The rank is negated (lower is better, as with bm25) and cast to double
+    # precision, so it survives the round trip through the cursor exactly.
+    sql = (
+        'SELECT ranked.answer_id, a.question_id, ranked.rank, ts_headline(%s, a.body, ranked.query, %s) '
+        'FROM ('
+        '  SELECT s.answer_id, query, -ts_rank_cd(s.document, query)::float8 AS rank'
+        '  FROM surveys_answer_search s, websearch_to_tsquery(%s, %s) query'
+        '  WHERE s.survey_id = %s AND s.document @@ query'
+        ') ranked JOIN surveys_answer a ON a.id = ranked.answer_id'
+    )
+    params = ['english', HEADLINE_OPTIONS, 'english', query, survey_id]
+    if after:
+        sql += ' WHERE ranked.rank > %s OR (ranked.rank = %s AND ranked.answer_id > %s)'
+        params += [after[0], after[0], after[1]]
+    sql += ' ORDER BY ranked.rank, ranked.answer_id LIMIT %s'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit])
+        return cursor.fetchall()
+
+
+def highlight(snippet):
+    """Escape an answer snippet and turn the match markers into <mark> tags."""
+    return mark_safe(escape(snippet).replace(START, '<mark>').replace(STOP, '</mark>'))
+
+
+def search_answers(schema, query, cursor=None, page_size=25):
+    """
+    One page of a survey's free-text answers matching `query`, best first.
+    Returns (results, next_cursor). Each result is a dict with the answer id,
+    its question (from the schema), the response it belongs to, the rank
+    and a highlighted snippet. Two queries per page.
+    """
+    query = query.strip()
+    if not query:
+        return [], None
+    rows_for = _postgres_rows if connection.vendor == 'postgresql' else _sqlite_rows
+    # One extra row tells whether there is a next page.
+    rows = rows_for(schema.id, query, decode_rank_cursor(cursor), page_size + 1)
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_rank_cursor(rows[-1][2], rows[-1][0])
+
+    responses = {
+        row['pk']: row
+        for row in Answer.objects.filter(pk__in=[row[0] for row in rows]).values(
+            'pk', 'response_id', 'response__submitted_at', 'response__respondent__username')
+    }
+    questions = {question.id: question for question in schema.questions}
+    results = []
+    for answer_id, question_id, rank, snippet in rows:
+        response = responses.get(answer_id)
+        if response is None:
+            continue  # Deleted since the index was read.
+        results.append({
+            'answer_id': answer_id,
+            'question': questions.get(question_id),
+            'response_id': response['response_id'],
+            'submitted_at': response['response__submitted_at'],
+            'respondent': response['response__respondent__username'],
+            'rank': rank,
+            'snippet': highlight(snippet),
+        })
+    return results, next_cursor
@@ -0,0 +1,196 @@
+# surveys/seeding.py
+
+"""
+Fast generation of large, realistic-looking test datasets.
+
+Creating users and responses one at a time goes through the post_save
+signals (a Profile per user, tallies and cache invalidation per submission)
+and costs several queries per row, which makes a production-sized dataset
+take hours. Here everything is inserted with bulk_create in chunks, one
+transaction per chunk. bulk_create does not send post_save, so the profiles
+are created directly, and the tallies and caches are brought up to date once
+at the end.
+
+All randomness comes from one random.Random(seed), and every timestamp is
+counted back from a fixed `now` (EPOCH unless given), so the same options
+always produce the same data.
+"""
+
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .availability import invalidate_open_surveys
+from .models import Survey, Question, Choice, Response, Answer, Profile
+from .schema import bump_schema_version, get_survey_schema
+from .tallies import rebuild_tallies
+from .rollups import rebuild_rollups
+from .text_summary import rebuild_text_summary
+
+DEFAULT_USERS = {'STUDENT': 1000, 'FACULITY': 100, 'STAFF': 100, 'OTHER': 50}
+DEFAULT_QUESTION_MIX = {'TEXT': 1, 'TEXTAREA': 1, 'CHOICE': 3, 'MULTICHOICE': 2, 'RATING': 3}
+CHOICE_TYPES = (Question.QuestionType.CHOICE, Question.QuestionType.MULTIPLE_CHOICE)
+WORDS = (
+    'good', 'slow', 'helpful', 'library', 'canteen', 'hostel', 'exam', 'course', 'teacher',
+    'campus', 'clean', 'crowded', 'wifi', 'timetable', 'friendly', 'expensive', 'lab', 'sports',
+)
+# Seeded timestamps fall in the year before this, unless another `now` is given.
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+# Never used to log in; bulk_create skips password hashing anyway.
+UNUSABLE_PASSWORD = '!seeded'
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SurveyDataGenerator:
+    """
+    Seeds users, surveys and responses. `users` maps a Profile.user_type to the
+    number of users of that type; `question_mix` maps a question type to the
+    number of questions of that type in every survey. Surveys are created and
+    answered in the year before `now`.
+    """
+
+    def __init__(self, users=None, surveys=20, question_mix=None, choices=4, response_rate=0.5,
+                 seed=0, chunk_size=2000, log=None, now=None):
+        self.users = users or DEFAULT_USERS
+        self.surveys = surveys
+        self.question_mix = question_mix or DEFAULT_QUESTION_MIX
+        self.choices = choices
+        self.response_rate = response_rate
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.random = random.Random(seed)
+        self.log = log or (lambda message: None)
+        self.now = (now or EPOCH).replace(microsecond=0)
+
+    def run(self):
+        """Generate everything. Returns a dict of row counts."""
+        users_by_type = self.create_users()
+        creator = self.create_creator()
+        surveys = self.create_surveys(creator)
+        counts = {'users': sum(len(ids) for ids in users_by_type.values()), 'surveys': len(surveys), 'responses': 0, 'answers': 0, 'answer_choices': 0}
+        for survey in surveys:
+            audience = survey.target_audience
+            eligible = [pk for user_type, ids in users_by_type.items() if audience == 'ALL' or audience == user_type for pk in ids]
+            respondents = self.random.sample(eligible, round(len(eligible) * self.response_rate))
+            for key, value in self.create_responses(survey, respondents).items():
+                counts[key] += value
+            self.log(f"Survey {survey.pk}: {len(respondents)} responses")
+        self.finish(surveys)
+        return counts
+
+    # --- Users ---
+
+    def _bulk_create_users(self, prefix, user_type, count):
+        User = get_user_model()
+        ids = []
+        for numbers in _chunks(range(count), self.chunk_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(username=f'{prefix}-{number}', password=UNUSABLE_PASSWORD, date_joined=self.now) for number in numbers
+                ])
+                Profile.objects.bulk_create([Profile(user=user, user_type=user_type) for user in users])
+            ids.extend(user.pk for user in users)
+        return ids
+
+    def create_users(self):
+        users_by_type = {}
+        for user_type, count in self.users.items():
+            users_by_type[user_type] = self._bulk_create_users(f'seed{self.seed}-{user_type.lower()}', user_type, count)
+            self.log(f"Created {count} {user_type} users")
+        return users_by_type
+
+    def create_creator(self):
+        [pk] = self._bulk_create_users(f'seed{self.seed}-creator', Survey.RespondentType.SURVEY_CREATOR, 1)
+        return pk
+
+    # --- Surveys ---
+
+    def create_surveys(self, creator_id):
+        audiences = ['ALL'] + list(self.users)
+        surveys = Survey.objects.bulk_create([
+            Survey(
+                title=f'Seeded survey {number}',
+                description=' '.join(self.random.choices(WORDS, k=12)),
+                creator_id=creator_id,
+                # Half the surveys are open to everyone, the rest to one audience.
+                target_audience='ALL' if self.random.random() < 0.5 else self.random.choice(audiences[1:] or ['ALL']),
+                created_at=self.now - timedelta(days=self.random.randint(1, 365)),
+                is_public=self.random.random() < 0.2,
+            )
+            for number in range(self.surveys)
+        ])
+
+        question_types = [q_type for q_type, count in self.question_mix.items() for _ in range(count)]
+        questions = Question.objects.bulk_create([
+            Question(survey=survey, text=f'Question {order + 1}', question_type=q_type, order=order)
+            for survey in surveys
+            for order, q_type in enumerate(self.random.sample(question_types, len(question_types)))
+        ])
+        Choice.objects.bulk_create([
+            Choice(question=question, text=f'Option {n + 1}')
+            for question in questions if question.question_type in CHOICE_TYPES
+            for n in range(self.choices)
+        ], batch_size=self.chunk_size)
+        # In case an id was used before, by a survey whose schema is still cached.
+        for survey in surveys:
+            bump_schema_version(survey.pk)
+        return surveys
+
+    # --- Responses ---
+
+    def _answer(self, question, choice_ids):
+        """An unsaved Answer for one question, and the ids of the choices it selects."""
+        q_type = question.question_type
+        if q_type == Question.QuestionType.RATING:
+            # Skewed towards the top of the scale, like most real ratings.
+            return Answer(question_id=question.id, body=str(self.random.choices(range(1, 6), weights=(1, 2, 4, 6, 4))[0])), []
+        if q_type == Question.QuestionType.CHOICE:
+            return Answer(question_id=question.id), [self.random.choice(choice_ids)] if choice_ids else []
+        if q_type == Question.QuestionType.MULTIPLE_CHOICE:
+            return Answer(question_id=question.id), self.random.sample(choice_ids, self.random.randint(1, min(3, len(choice_ids)))) if choice_ids else []
+        length = 4 if q_type == Question.QuestionType.TEXT else 25
+        return Answer(question_id=question.id, body=' '.join(self.random.choices(WORDS, k=length))), []
+
+    def create_responses(self, survey, respondent_ids):
+        schema = get_survey_schema(survey.pk)
+        choice_ids = {question.id: [choice.id for choice in question.choices] for question in schema.questions}
+        window = max(1, int((self.now - survey.created_at).total_seconds()))
+        through = Answer.choices.through
+        counts = {'responses': 0, 'answers': 0, 'answer_choices': 0}
+
+        for chunk in _chunks(respondent_ids, self.chunk_size):
+            with transaction.atomic():
+                responses = Response.objects.bulk_create([
+                    Response(survey_id=survey.pk, respondent_id=pk, submitted_at=survey.created_at + timedelta(seconds=self.random.randrange(window)))
+                    for pk in chunk
+                ])
+                answers = []  # (Answer, [choice ids])
+                for response in responses:
+                    for question in schema.questions:
+                        answer, selected = self._answer(question, choice_ids[question.id])
+                        answer.response_id = response.pk
+                        answers.append((answer, selected))
+                Answer.objects.bulk_create([answer for answer, _ in answers], batch_size=self.chunk_size)
+                links = [through(answer_id=answer.pk, choice_id=choice_id) for answer, selected in answers for choice_id in selected]
+                through.objects.bulk_create(links, batch_size=self.chunk_size)
+            counts['responses'] += len(responses)
+            counts['answers'] += len(answers)
+            counts['answer_choices'] += len(links)
+        return counts
+
+    # --- Caches and tallies ---
+
+    def finish(self, surveys):
+        """Do what the skipped post_save signals would have done."""
+        for survey in surveys:
+            schema = get_survey_schema(survey.pk)
+            rebuild_tallies(schema)
+            rebuild_text_summary(schema)
+            rebuild_rollups(survey.pk)
+        invalidate_open_surveys()
@@ -0,0 +1,211 @@
+# surveys/segments.py
+
+"""
+Segmented and cross-tabulated results, computed in the database.
+
+A segment narrows a survey's responses down by respondent role and/or a
+submission date range. For a segment we compute:
+
+* a breakdown of every choice and rating question by respondent role
+  (two GROUP BY queries for the whole survey), and
+* optionally a cross-tab of two questions: how often each answer to one
+  question went together with each answer to the other in the same
+  response (one GROUP BY query that joins the survey's answers to themselves).
+  For the whole survey, the responses already in its memory-mapped response
+  matrix (matrix.py) are counted from there, and the query only covers the
+  ones submitted since the matrix was built.
+
+Reports are cached per (survey, schema version, segment, questions) together
+with the survey's tallied response count and responses version (tallies.py),
+so re-slicing the same data is a cache hit and any new or deleted response
+makes the next request recompute. A respondent's role decides their segment,
+so changing it bumps the responses version of every survey they answered.
+"""
+
+from datetime import date, datetime, time, timedelta
+from typing import NamedTuple, Optional
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .matrix import usable_response_matrix
+from .models import Profile, Question, Response, Answer, SurveyTally
+from .tallies import bump_responses_version, get_responses_version
+
+SEGMENT_TIMEOUT = 60 * 60
+SEGMENTABLE_TYPES = (Question.QuestionType.CHOICE, Question.QuestionType.MULTIPLE_CHOICE, Question.QuestionType.RATING)
+RATING_VALUES = [str(value) for value in range(1, 6)]
+NO_ROLE = 'NONE'
+ROLE_LABELS = dict(Profile.USER_TYPE_CHOICES, **{NO_ROLE: 'No profile / anonymous'})
+ROLE_PATH = 'respondent__profile__user_type'
+
+
+class Segment(NamedTuple):
+    user_type: str = ''
+    start: Optional[date] = None
+    end: Optional[date] = None
+
+    def key(self):
+        return f'{self.user_type or "all"}:{self.start or ""}:{self.end or ""}'
+
+
+def segment_filter(segment, prefix=''):
+    """
+    A Q object selecting the responses in `segment`. `prefix` is the path to
+    Response from the model being filtered (e.g. 'response__' for Answer).
+    The dates are compared as datetime bounds rather than with `__date`, so
+    the (survey, submitted_at, id) index can still be used.
+    """
+    condition = Q()
+    if segment.user_type == NO_ROLE:
+        condition &= Q(**{f'{prefix}{ROLE_PATH}__isnull': True})
+    elif segment.user_type:
+        condition &= Q(**{f'{prefix}{ROLE_PATH}': segment.user_type})
+    if segment.start:
+        condition &= Q(**{f'{prefix}submitted_at__gte': timezone.make_aware(datetime.combine(segment.start, time.min))})
+    if segment.end:
+        condition &= Q(**{f'{prefix}submitted_at__lt': timezone.make_aware(datetime.combine(segment.end + timedelta(days=1), time.min))})
+    return condition
+
+
+def segmentable_questions(schema):
+    """The questions whose answers can be counted: choice and rating questions."""
+    return [question for question in schema.questions if question.question_type in SEGMENTABLE_TYPES]
+
+
+def _answer_values(question):
+    """[(value, label)] of the possible answers to a choice or rating question."""
+    if question.question_type == Question.QuestionType.RATING:
+        return [(value, value) for value in RATING_VALUES]
+    return [(choice.id, choice.text) for choice in question.choices]
+
+
+def _value_path(question, prefix=''):
+    """Where an Answer's value lives: the selected choice for choice questions, the body for ratings."""
+    return f'{prefix}body' if question.question_type == Question.QuestionType.RATING else f'{prefix}choices'
+
+
+def role_breakdown(schema, segment):
+    """
+    Count every answer of every choice/rating question per respondent role.
+    Returns {'roles': [(role, label, responses)], 'questions': [{'question', 'rows': [(label, [count per role], total)]}]}.
+    """
+    answers = Answer.objects.filter(response__survey_id=schema.id).filter(segment_filter(segment, 'response__'))
+    role = f'response__{ROLE_PATH}'
+
+    role_totals = {
+        user_type or NO_ROLE: n
+        for user_type, n in Response.objects.filter(survey_id=schema.id).filter(segment_filter(segment))
+        .values_list(ROLE_PATH).annotate(n=Count('id')).order_by()
+    }
+    roles = [code for code in ROLE_LABELS if code in role_totals]
+
+    questions = segmentable_questions(schema)
+    counts = {}  # (question id, value, role) -> count
+    rating_ids = [q.id for q in questions if q.question_type == Question.QuestionType.RATING]
+    choice_ids = [q.id for q in questions if q.question_type != Question.QuestionType.RATING]
+    if choice_ids:
+        for question_id, value, user_type, n in (
+            answers.filter(question_id__in=choice_ids, choices__isnull=False)
+            .values_list('question_id', 'choices', role).annotate(n=Count('id')).order_by()
+        ):
+            counts[question_id, value, user_type or NO_ROLE] = n
+    if rating_ids:
+        for question_id, value, user_type, n in (
+            answers.filter(question_id__in=rating_ids, body__in=RATING_VALUES)
+            .values_list('question_id', 'body', role).annotate(n=Count('id')).order_by()
+        ):
+            counts[question_id, value, user_type or NO_ROLE] = n
+
+    breakdown = []
+    for question in questions:
+        rows = []
+        for value, label in _answer_values(question):
+            per_role = [counts.get((question.id, value, code), 0) for code in roles]
+            rows.append((label, per_role, sum(per_role)))
+        breakdown.append({'question': question, 'rows': rows})
+    return {'roles': [(code, ROLE_LABELS[code], role_totals[code]) for code in roles], 'questions': breakdown}
+
+
+def cross_tab(schema, row_question, column_question, segment):
+    """
+    The contingency table of two choice/rating questions within a segment, in
+    one query: each answer to `row_question` is joined to the same response's
+    answer to `column_question`, and the value pairs are counted. For the
+    whole survey, the query only counts the responses the matrix lacks.
+    """
+    counts, after_id = {}, 0
+    if segment == Segment():
+        matrix = usable_response_matrix(schema)
+        if matrix is not None:
+            counts = matrix.cross_tab_counts(row_question.id, column_question.id)
+            after_id = matrix.meta['last_response_id']
+
+    pairs = (
+        Answer.objects.filter(response__survey_id=schema.id, question_id=row_question.id, response_id__gt=after_id)
+        .filter(segment_filter(segment, 'response__'))
+        # One filter() call, so both conditions apply to the same joined answer.
+        .filter(**{'response__answers__question_id': column_question.id, f"{_value_path(column_question, 'response__answers__')}__isnull": False})
+        .values_list(_value_path(row_question), _value_path(column_question, 'response__answers__'))
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for row_value, column_value, n in pairs:
+        counts[row_value, column_value] = counts.get((row_value, column_value), 0) + n
+
+    rows, columns = _answer_values(row_question), _answer_values(column_question)
+    cells = [[counts.get((row_value, column_value), 0) for column_value, _ in columns] for row_value, _ in rows]
+    return {
+        'row_question': row_question,
+        'column_question': column_question,
+        'columns': [label for _, label in columns],
+        'rows': [(label, row_cells, sum(row_cells)) for (_, label), row_cells in zip(rows, cells)],
+        'column_totals': [sum(column) for column in zip(*cells)] if cells else [],
+        'total': sum(map(sum, cells)),
+    }
+
+
+def _responses_fingerprint(survey_id):
+    """Changes whenever a response is added to or removed from the survey. One single-row query."""
+    count = SurveyTally.objects.filter(survey_id=survey_id).values_list('response_count', flat=True).first()
+    return f'{count}-{get_responses_version(survey_id)}'
+
+
+def build_segment_report(schema, segment, row_question=None, column_question=None):
+    report = {'breakdown': role_breakdown(schema, segment), 'cross_tab': None}
+    if row_question and column_question:
+        report['cross_tab'] = cross_tab(schema, row_question, column_question, segment)
+    return report
+
+
+def get_segment_report(schema, segment, row_question=None, column_question=None):
+    """The segment report from the cache when the survey's responses have not changed since it was built."""
+    questions = f'{row_question.id if row_question else ""}x{column_question.id if column_question else ""}'
+    key = f'survey-segments:{schema.id}:{schema.version}:{_responses_fingerprint(schema.id)}:{segment.key()}:{questions}'
+    report = cache.get(key)
+    if report is None:
+        report = build_segment_report(schema, segment, row_question, column_question)
+        cache.set(key, report, SEGMENT_TIMEOUT)
+    return report
+
+
+# --- Signals ---
+
+@receiver(post_init, sender=Profile)
+def remember_role(sender, instance, **kwargs):
+    instance._loaded_user_type = instance.user_type
+
+
+@receiver(post_save, sender=Profile)
+def role_changed(sender, instance, created, **kwargs):
+    """
+    Profiles are saved along with their user (on every login, for one), so
+    the surveys are only looked up when the role really changed.
+    """
+    if not created and instance.user_type != instance._loaded_user_type:
+        for survey_id in Response.objects.filter(respondent_id=instance.user_id).values_list('survey_id', flat=True):
+            bump_responses_version(survey_id)
+    instance._loaded_user_type = instance.user_type
@@ -0,0 +1,95 @@
+# surveys/submission.py
+
+"""
+The write path for a survey submission.
+
+Saving answers one at a time (plus a Choice lookup and an M2M add for every
+choice question) costs a couple of round trips per question. Here the posted
+data is validated against the survey's cached schema (see schema.py) and then
+written with one INSERT for the Response, one bulk INSERT for all Answers and
+one bulk INSERT for all selected choices, inside a single transaction that
+also updates the survey's tallies (tallies.py), submission-rate rollups
+(rollups.py) and text answer term counts (text_summary.py). The number of queries per
+submission does not depend on how many questions the survey has.
+"""
+
+from django.db import transaction
+
+from .models import Question, Response, Answer
+from .tallies import record_submission
+from .rollups import record_submissions, respondent_role
+from .text_summary import record_text_answers
+
+BODY_TYPES = (Question.QuestionType.TEXT, Question.QuestionType.TEXTAREA)
+RATING_VALUES = {'1', '2', '3', '4', '5'}
+
+
+def _posted_choice_ids(values, valid_ids):
+    """Keep only the posted values that are ids of this question's choices (in posted order, no repeats)."""
+    selected = []
+    for value in values:
+        try:
+            choice_id = int(value)
+        except (TypeError, ValueError):
+            continue
+        if choice_id in valid_ids and choice_id not in selected:
+            selected.append(choice_id)
+    return selected
+
+
+def build_answers(questions, valid_choices, data):
+    """
+    Turn posted form data into unsaved answers, without touching the database.
+
+    `questions` are QuestionSchema entries (anything with `id` and
+    `question_type` works) and `valid_choices` maps question id -> set of
+    that question's choice ids.
+    Returns a list of (Answer, [choice ids]) pairs; `response` is not set yet.
+    Choice ids that do not belong to the question are dropped.
+    """
+    answers = []
+    for question in questions:
+        field = f'question_{question.id}'
+        q_type = question.question_type
+        if q_type in BODY_TYPES:
+            answers.append((Answer(question_id=question.id, body=data.get(field)), []))
+        elif q_type == Question.QuestionType.RATING:
+            body = data.get(field)
+            answers.append((Answer(question_id=question.id, body=body if body in RATING_VALUES else None), []))
+        elif q_type == Question.QuestionType.CHOICE:
+            choice_ids = _posted_choice_ids([data.get(field)], valid_choices.get(question.id, ()))
+            if choice_ids:
+                answers.append((Answer(question_id=question.id), choice_ids[:1]))
+        elif q_type == Question.QuestionType.MULTIPLE_CHOICE:
+            choice_ids = _posted_choice_ids(data.getlist(field), valid_choices.get(question.id, ()))
+            if choice_ids:
+                answers.append((Answer(question_id=question.id), choice_ids))
+    return answers
+
+
+def save_submission(schema, respondent, data):
+    """
+    Validate and store one submission of a survey by `respondent`.
+
+    `schema` is the survey's SurveySchema and `data` is the POST QueryDict.
+    Everything is written in one transaction, so a failure (e.g. a duplicate
+    response) leaves no partial answers behind. Returns the new Response.
+    """
+    answers = build_answers(schema.questions, schema.valid_choices, data)
+
+    with transaction.atomic():
+        response = Response.objects.create(survey_id=schema.id, respondent=respondent)
+        for answer, _ in answers:
+            answer.response = response
+        Answer.objects.bulk_create([answer for answer, _ in answers])
+
+        through = Answer.choices.through
+        through.objects.bulk_create([
+            through(answer_id=answer.pk, choice_id=choice_id)
+            for answer, choice_ids in answers
+            for choice_id in choice_ids
+        ])
+        record_submission(schema, answers)
+        record_text_answers(schema, answers)
+        record_submissions([(schema.id, response.submitted_at, respondent_role(respondent))])
+    return response
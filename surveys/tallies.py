@@ -0,0 +1,246 @@
+# surveys/tallies.py
+
+"""
+Maintenance of the denormalized tally tables (SurveyTally, QuestionTally,
+RatingTally and ChoiceTally in models.py).
+
+Every submission bumps the counters with F() increments inside the same
+transaction that saves its answers, so the tallies can never count a
+submission that was rolled back. The results page then reads one row per
+question and choice (see results.tallied_counts) instead of scanning Answer.
+
+Tallies are only maintained while the survey's SurveyTally row exists. New
+surveys get one automatically. Deleting a response subtracts its answers
+again, in the transaction that deletes it (see forget_deleted_response),
+except in a bulk deletion (deletion.py), which rebuilds the tallies once.
+`manage.py rebuild_tallies` recomputes everything from the raw answers.
+
+Alongside the counts, each survey has a responses version in the cache,
+replaced after every transaction that adds or removes one of its responses.
+Caches of reports computed from the raw responses (see segments.py) include
+it in their keys, so they need no query to tell whether they are stale.
+"""
+
+import operator
+import uuid
+from functools import reduce
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import F, Q, Case, When, Value
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Survey, Response, Answer, SurveyTally, QuestionTally, RatingTally, ChoiceTally
+from .schema import get_survey_schema
+from .results import live_counts, tallied_counts, rating_question_ids
+
+
+class BulkResponseDeletion:
+    """
+    The `origin` Django's delete signals carry while deletion.delete_responses()
+    deletes a batch of responses. The receivers that take a single deleted
+    response out of the tallies, rollups and text summaries skip it, since
+    those are rebuilt once afterwards.
+    """
+
+
+def _increment(model, key, keys, updates, **filters):
+    """
+    Apply `updates` (F() expressions) to the rows of `model` whose `key` is in
+    `keys`, creating any missing rows first. Usually a single UPDATE.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    rows = model.objects.filter(**filters)
+    if rows.filter(**{f'{key}__in': keys}).update(**updates) == len(keys):
+        return
+    # Some rows do not exist yet (e.g. a question added after the tallies were
+    # built). The rows that do exist were already updated above.
+    existing = set(rows.filter(**{f'{key}__in': keys}).values_list(key, flat=True))
+    missing = keys - existing
+    # ignore_conflicts makes this safe against a concurrent submission creating
+    # the same rows; both then increment them below.
+    model.objects.bulk_create([model(**{key: k}, **filters) for k in missing], ignore_conflicts=True)
+    rows.filter(**{f'{key}__in': missing}).update(**updates)
+
+
+def _responses_version_key(survey_id):
+    return f'survey-responses-version:{survey_id}'
+
+
+def get_responses_version(survey_id):
+    """The current responses version of a survey (see the module docstring), creating one if needed."""
+    version = cache.get(_responses_version_key(survey_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(_responses_version_key(survey_id), version, timeout=None):
+            version = cache.get(_responses_version_key(survey_id), version)
+    return version
+
+
+def bump_responses_version(survey_id):
+    """Give the survey a new responses version once the current transaction commits."""
+    transaction.on_commit(lambda: cache.set(_responses_version_key(survey_id), uuid.uuid4().hex, timeout=None))
+
+
+def record_submission(schema, answers):
+    """
+    Add one submission to the survey's tallies. Must be called inside the
+    transaction that saves it. `answers` are the (Answer, [choice ids]) pairs
+    from submission.build_answers().
+    """
+    bump_responses_version(schema.id)
+    if not SurveyTally.objects.filter(survey_id=schema.id).update(response_count=F('response_count') + 1):
+        return  # Tallies are not maintained for this survey until they are rebuilt.
+
+    answered = [answer.question_id for answer, choice_ids in answers if choice_ids or answer.body]
+    _increment(QuestionTally, 'question_id', answered, {'answered_count': F('answered_count') + 1})
+
+    rating_ids = set(rating_question_ids(schema))
+    ratings = {answer.question_id: int(answer.body) for answer, _ in answers if answer.question_id in rating_ids and answer.body}
+    if ratings:
+        # One UPDATE for every rating question, each adding its own value.
+        sum_field = models.PositiveBigIntegerField()
+        QuestionTally.objects.filter(question_id__in=ratings).update(
+            rating_sum=F('rating_sum') + Case(*[When(question_id=q, then=Value(v)) for q, v in ratings.items()], default=Value(0), output_field=sum_field),
+            rating_sum_squares=F('rating_sum_squares') + Case(*[When(question_id=q, then=Value(v * v)) for q, v in ratings.items()], default=Value(0), output_field=sum_field),
+        )
+        for value in set(ratings.values()):
+            _increment(RatingTally, 'question_id', [q for q, v in ratings.items() if v == value], {'count': F('count') + 1}, value=value)
+
+    selected = [choice_id for _, choice_ids in answers for choice_id in choice_ids]
+    _increment(ChoiceTally, 'choice_id', selected, {'selected_count': F('selected_count') + 1})
+
+
+def _decrement(model, key, keys, field, **filters):
+    """Subtract 1 from `field` of the rows of `model` whose `key` is in `keys`, never going below zero."""
+    if keys:
+        model.objects.filter(**{f'{key}__in': set(keys), f'{field}__gte': 1}, **filters).update(**{field: F(field) - 1})
+
+
+def forget_submission(schema, answers):
+    """
+    Take one deleted submission out of the survey's tallies, the reverse of
+    record_submission(). Must be called inside the transaction that deletes it.
+    """
+    bump_responses_version(schema.id)
+    if not SurveyTally.objects.filter(survey_id=schema.id, response_count__gte=1).update(response_count=F('response_count') - 1):
+        return
+
+    _decrement(QuestionTally, 'question_id', [answer.question_id for answer, choice_ids in answers if choice_ids or answer.body], 'answered_count')
+
+    rating_ids = set(rating_question_ids(schema))
+    ratings = {
+        answer.question_id: int(answer.body) for answer, _ in answers
+        if answer.question_id in rating_ids and answer.body and answer.body.isdigit()
+    }
+    if ratings:
+        sum_field = models.PositiveBigIntegerField()
+        QuestionTally.objects.filter(reduce(operator.or_, [Q(question_id=q, rating_sum__gte=v) for q, v in ratings.items()])).update(
+            rating_sum=F('rating_sum') - Case(*[When(question_id=q, then=Value(v)) for q, v in ratings.items()], default=Value(0), output_field=sum_field),
+            rating_sum_squares=F('rating_sum_squares') - Case(*[When(question_id=q, then=Value(v * v)) for q, v in ratings.items()], default=Value(0), output_field=sum_field),
+        )
+        for value in set(ratings.values()):
+            _decrement(RatingTally, 'question_id', [q for q, v in ratings.items() if v == value], 'count', value=value)
+
+    _decrement(ChoiceTally, 'choice_id', [choice_id for _, choice_ids in answers for choice_id in choice_ids], 'selected_count')
+
+
+def rebuild_tallies(schema):
+    """Recompute every tally of a survey from its raw responses."""
+    with transaction.atomic():
+        # Locking the SurveyTally row makes concurrent submissions wait (their
+        # increment of the same row blocks) until the rebuilt counts are committed.
+        SurveyTally.objects.get_or_create(survey_id=schema.id)
+        SurveyTally.objects.select_for_update().get(survey_id=schema.id)
+        counts = live_counts(schema)
+
+        question_ids = [question.id for question in schema.questions]
+        QuestionTally.objects.filter(question_id__in=question_ids).delete()
+        RatingTally.objects.filter(question_id__in=question_ids).delete()
+        ChoiceTally.objects.filter(choice_id__in=schema.choice_text).delete()
+
+        question_tallies = []
+        for question_id in question_ids:
+            histogram = counts['ratings'].get(question_id, {})
+            question_tallies.append(QuestionTally(
+                question_id=question_id,
+                answered_count=counts['answered'].get(question_id, 0),
+                rating_sum=sum(value * n for value, n in histogram.items()),
+                rating_sum_squares=sum(value * value * n for value, n in histogram.items()),
+            ))
+        QuestionTally.objects.bulk_create(question_tallies)
+        RatingTally.objects.bulk_create([
+            RatingTally(question_id=question_id, value=value, count=n)
+            for question_id, histogram in counts['ratings'].items()
+            for value, n in histogram.items()
+        ])
+        ChoiceTally.objects.bulk_create([
+            ChoiceTally(choice_id=choice_id, selected_count=counts['selected'].get(choice_id, 0))
+            for choice_id in schema.choice_text
+        ])
+        SurveyTally.objects.filter(survey_id=schema.id).update(response_count=counts['total_responses'])
+        bump_responses_version(schema.id)
+
+
+def verify_tallies(schema):
+    """
+    Compare a survey's tallies with its raw responses. Returns a list of
+    human-readable differences; an empty list means the tallies are correct.
+    """
+    tallied = tallied_counts(schema)
+    if tallied is None:
+        return ["tallies are not maintained for this survey"]
+    live = live_counts(schema)
+    problems = []
+    if tallied['total_responses'] != live['total_responses']:
+        problems.append(f"response count: tallied {tallied['total_responses']}, actual {live['total_responses']}")
+    for question in schema.questions:
+        if tallied['answered'].get(question.id, 0) != live['answered'].get(question.id, 0):
+            problems.append(f"question {question.id} answered: tallied {tallied['answered'].get(question.id, 0)}, actual {live['answered'].get(question.id, 0)}")
+        if tallied['ratings'].get(question.id, {}) != live['ratings'].get(question.id, {}):
+            problems.append(f"question {question.id} ratings: tallied {tallied['ratings'].get(question.id, {})}, actual {live['ratings'].get(question.id, {})}")
+    for choice_id in schema.choice_text:
+        if tallied['selected'].get(choice_id, 0) != live['selected'].get(choice_id, 0):
+            problems.append(f"choice {choice_id} selected: tallied {tallied['selected'].get(choice_id, 0)}, actual {live['selected'].get(choice_id, 0)}")
+
+    # The rating sums are only used for the mean and spread, so check them against the histogram.
+    sums = QuestionTally.objects.filter(question_id__in=rating_question_ids(schema)).values_list('question_id', 'rating_sum', 'rating_sum_squares')
+    for question_id, rating_sum, rating_sum_squares in sums:
+        histogram = live['ratings'].get(question_id, {})
+        if rating_sum != sum(v * n for v, n in histogram.items()) or rating_sum_squares != sum(v * v * n for v, n in histogram.items()):
+            problems.append(f"question {question_id} rating sums do not match its ratings")
+    return problems
+
+
+# --- Signals ---
+
+@receiver(post_save, sender=Survey)
+def start_survey_tally(sender, instance, created, **kwargs):
+    """A brand new survey has no responses, so its tallies can start at zero right away."""
+    if created:
+        SurveyTally.objects.get_or_create(survey=instance)
+
+
+@receiver(pre_delete, sender=Response)
+def forget_deleted_response(sender, instance, origin=None, **kwargs):
+    """
+    Subtract a response's answers from the tallies while they can still be
+    read: pre_delete runs in the deleting transaction, before its answers go.
+    """
+    if isinstance(origin, (Survey, BulkResponseDeletion)):
+        return  # The survey's tallies are being deleted along with it, or rebuilt afterwards.
+    try:
+        schema = get_survey_schema(instance.survey_id)
+    except Survey.DoesNotExist:
+        return
+    selected = {}
+    for answer_id, choice_id in Answer.choices.through.objects.filter(answer__response_id=instance.pk).values_list('answer_id', 'choice_id'):
+        selected.setdefault(answer_id, []).append(choice_id)
+    answers = [
+        (Answer(question_id=question_id, body=body), selected.get(answer_id, []))
+        for answer_id, question_id, body in Answer.objects.filter(response_id=instance.pk).values_list('id', 'question_id', 'body')
+    ]
+    forget_submission(schema, answers)
@@ -1,3 +1,1186 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+from datetime import datetime, timedelta
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection
+from django.http import QueryDict
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import escape
+
+from .models import Survey, Question, Choice, Response, Answer, Profile, SubmissionRollup
+from .ingest import _connect as queue_connection, enqueue_submission, failed_submissions, flush_queue, is_queued, queue_length
+from .async_views import survey_take
+from .availability import available_surveys_for, _load_open_surveys
+from .results import build_results_summary, get_results_summary, tallied_counts
+from .rollups import compact_rollups, rebuild_rollups, submission_series
+from .schema import get_survey_schema
+from .seeding import EPOCH, SurveyDataGenerator
+from .search import search_answers
+from .export import stream_export
+from .deletion import delete_responses
+from .definitions import build_survey, definition_formats, dump_definition, export_definition, import_definition, load_definition, yaml
+from .text_summary import extract_terms, rebuild_text_summary, recent_text_answers, top_terms
+from .matrix import build_response_matrix, usable_response_matrix
+from .segments import Segment, cross_tab, get_segment_report, role_breakdown
+from .submission import save_submission, build_answers
+from .tallies import verify_tallies
+from .throttling import PRUNE_INTERVAL, take_token, take_tokens, acquire_slot, release_slot, _connect
+
+# Applied to every test, so that none depends on state other runs left in
+# the site's files. ThrottleTests turns rate limiting back on, with its own file.
+TEST_SETTINGS = {
+    # A private cache, so the tests neither read nor clear the site's cache.
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'RATE_LIMIT_ENABLED': False,
+}
+
+
+class EmptyCacheMixin:
+    """
+    Every test starts and ends with an empty cache. The test database hands
+    out the same survey ids again, so a schema cached by an earlier test
+    (or by another class's setUpTestData) could belong to a different survey.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+
+@override_settings(**TEST_SETTINGS)
+class SurveyTestCase(EmptyCacheMixin, TestCase):
+    pass
+
+
+@override_settings(**TEST_SETTINGS)
+class SurveyTransactionTestCase(EmptyCacheMixin, TransactionTestCase):
+    pass
+
+
+def make_survey(creator, num_questions, title='Survey'):
+    """Create a survey cycling through every question type, with 4 choices per choice question."""
+    survey = Survey.objects.create(title=title, creator=creator)
+    types = [value for value, _ in Question.QuestionType.choices]
+    for i in range(num_questions):
+        question = Question.objects.create(survey=survey, text=f'Question {i}', question_type=types[i % len(types)], order=i)
+        if question.question_type in (Question.QuestionType.CHOICE, Question.QuestionType.MULTIPLE_CHOICE):
+            Choice.objects.bulk_create([Choice(question=question, text=f'Choice {n}') for n in range(4)])
+    return survey
+
+
+def make_post_data(survey):
+    """Build POST data answering every question of the survey."""
+    data = QueryDict(mutable=True)
+    for question in survey.questions.prefetch_related('choices'):
+        field = f'question_{question.id}'
+        choice_ids = [str(choice.id) for choice in question.choices.all()]
+        if question.question_type == Question.QuestionType.CHOICE:
+            data[field] = choice_ids[0]
+        elif question.question_type == Question.QuestionType.MULTIPLE_CHOICE:
+            data.setlist(field, choice_ids[:2])
+        elif question.question_type == Question.QuestionType.RATING:
+            data[field] = '4'
+        else:
+            data[field] = 'Some text'
+    return data
+
+
+class SubmissionTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creator = User.objects.create(username='creator', is_staff=True)
+        cls.respondent = User.objects.create(username='respondent')
+
+    def test_saves_every_answer_and_choice(self):
+        survey = make_survey(self.creator, 5)
+        save_submission(get_survey_schema(survey.pk), self.respondent, make_post_data(survey))
+
+        response = Response.objects.get(survey=survey, respondent=self.respondent)
+        self.assertEqual(response.answers.count(), 5)
+        multi = response.answers.get(question__question_type=Question.QuestionType.MULTIPLE_CHOICE)
+        self.assertEqual(multi.choices.count(), 2)
+        rating = response.answers.get(question__question_type=Question.QuestionType.RATING)
+        self.assertEqual(rating.body, '4')
+
+    def test_choice_ids_from_other_questions_are_ignored(self):
+        survey = make_survey(self.creator, 5)
+        other = make_survey(self.creator, 5, title='Other')
+        data = make_post_data(survey)
+        choice_question = survey.questions.get(question_type=Question.QuestionType.CHOICE)
+        data[f'question_{choice_question.id}'] = str(other.questions.get(question_type=Question.QuestionType.CHOICE).choices.first().id)
+
+        save_submission(get_survey_schema(survey.pk), self.respondent, data)
+        self.assertFalse(Answer.objects.filter(question=choice_question).exists())
+
+    def test_queries_per_submission_do_not_grow_with_survey_length(self):
+        counts = []
+        for num_questions in (5, 40):
+            survey = make_survey(self.creator, num_questions, title=f'{num_questions} questions')
+            schema = get_survey_schema(survey.pk)
+            data = make_post_data(survey)
+            with CaptureQueriesContext(connection) as queries:
+                save_submission(schema, self.respondent, data)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class SurveySchemaTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = get_user_model().objects.create(username='creator', is_staff=True)
+
+    def test_schema_is_served_from_cache_after_warm_up(self):
+        survey = make_survey(self.creator, 5)
+        get_survey_schema(survey.pk)
+        with self.assertNumQueries(0):
+            schema = get_survey_schema(survey.pk)
+        self.assertEqual([q.text for q in schema.questions], [f'Question {i}' for i in range(5)])
+
+    def test_editing_a_choice_invalidates_the_schema(self):
+        survey = make_survey(self.creator, 5)
+        get_survey_schema(survey.pk)
+        choice = Choice.objects.filter(question__survey=survey).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            choice.text = 'Renamed'
+            choice.save()
+        self.assertIn('Renamed', get_survey_schema(survey.pk).choice_text.values())
+
+    def test_editing_choices_through_their_question_needs_no_lookup(self):
+        survey = make_survey(self.creator, 3)
+        question = survey.questions.get(order=2)
+        choices = list(question.choices.all())
+        with CaptureQueriesContext(connection) as queries:
+            for choice in choices:
+                choice.text += '!'
+                choice.save()
+        self.assertEqual(len(queries), len(choices))  # Just the UPDATEs.
+
+        # The question edit page saves its choices the same way.
+        self.client.force_login(self.creator)
+        data = {'text': question.text, 'question_type': question.question_type, 'order': question.order,
+                'choices-TOTAL_FORMS': len(choices), 'choices-INITIAL_FORMS': len(choices),
+                'choices-MIN_NUM_FORMS': 0, 'choices-MAX_NUM_FORMS': 1000}
+        for i, choice in enumerate(choices):
+            data.update({f'choices-{i}-id': choice.pk, f'choices-{i}-text': f'Edited {i}'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('surveys:question-edit', args=[question.pk]), data)
+        self.assertEqual(response.status_code, 302)
+        lookups = [query['sql'] for query in queries if 'SELECT "surveys_question"."survey_id"' in query['sql']]
+        self.assertEqual(lookups, [])
+
+    def test_cached_take_form_fragment_follows_the_schema_version(self):
+        survey = make_survey(self.creator, 3)
+        self.client.force_login(get_user_model().objects.create(username='respondent'))
+        url = reverse('surveys:survey-take', args=[survey.pk])
+        self.assertContains(self.client.get(url), 'Question 1')
+
+        question = survey.questions.get(order=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            question.text = 'Renamed question'
+            question.save()
+        # The fragment cached for the old version is not served any more.
+        page = self.client.get(url)
+        self.assertContains(page, 'Renamed question')
+        self.assertNotContains(page, 'Question 1<')
+
+
+class TallyTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creator = User.objects.create(username='creator', is_staff=True)
+        cls.respondents = [User.objects.create(username=f'respondent{i}') for i in range(3)]
+
+    def test_submissions_keep_tallies_in_step_with_answers(self):
+        survey = make_survey(self.creator, 10)
+        schema = get_survey_schema(survey.pk)
+        for respondent in self.respondents:
+            save_submission(schema, respondent, make_post_data(survey))
+
+        self.assertEqual(verify_tallies(schema), [])
+        self.assertEqual(get_results_summary(schema), build_results_summary(schema))
+
+    def test_deleting_a_response_subtracts_it_from_the_tallies(self):
+        survey = make_survey(self.creator, 10)
+        schema = get_survey_schema(survey.pk)
+        for respondent in self.respondents:
+            save_submission(schema, respondent, make_post_data(survey))
+
+        Response.objects.filter(survey=survey).first().delete()
+        # Still read from the tallies, and still right.
+        self.assertEqual(tallied_counts(schema)['total_responses'], 2)
+        self.assertEqual(verify_tallies(schema), [])
+        self.assertEqual(get_results_summary(schema), build_results_summary(schema))
+
+        # Deleting a respondent deletes their responses the same way.
+        self.respondents[1].delete()
+        self.assertEqual(tallied_counts(schema)['total_responses'], 1)
+        self.assertEqual(verify_tallies(schema), [])
+
+
+class ResultsSummaryTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creator = User.objects.create(username='creator', is_staff=True)
+        users = User.objects.bulk_create([User(username=f'respondent{n}') for n in range(25)])
+        cls.survey = make_survey(cls.creator, 10)
+        SurveyDataGenerator(seed=5).create_responses(cls.survey, [user.pk for user in users])
+        # One respondent who skipped every question.
+        skipper = User.objects.create(username='skipper')
+        save_submission(get_survey_schema(cls.survey.pk), skipper, QueryDict())
+
+    def test_grouped_counts_match_counting_question_by_question(self):
+        summary = build_results_summary(get_survey_schema(self.survey.pk))
+        self.assertEqual(summary['total_responses'], 26)
+        for item, question in zip(summary['questions'], self.survey.questions.order_by('order', 'id')):
+            answers = Answer.objects.filter(question=question)
+            answered = sum(1 for answer in answers if answer.body or answer.choices.exists())
+            self.assertEqual((item['answered'], item['skipped']), (answered, 26 - answered), question.text)
+            if question.question_type in (Question.QuestionType.CHOICE, Question.QuestionType.MULTIPLE_CHOICE):
+                expected = {choice.id: choice.answers.count() for choice in question.choices.all()}
+                self.assertEqual({row['choice'].id: row['count'] for row in item['choices']}, expected, question.text)
+            elif question.question_type == Question.QuestionType.RATING:
+                ratings = [int(answer.body) for answer in answers if answer.body]
+                self.assertEqual({row['value']: row['count'] for row in item['rating']['histogram']}, {value: ratings.count(value) for value in range(1, 6)})
+                self.assertEqual(item['rating']['mean'], round(sum(ratings) / len(ratings), 2))
+
+    def test_results_page_shows_the_newest_text_answers(self):
+        schema = get_survey_schema(self.survey.pk)
+        samples = recent_text_answers(schema)
+        text_questions = self.survey.questions.filter(question_type__in=['TEXT', 'TEXTAREA'])
+        self.assertEqual(set(samples), set(text_questions.values_list('id', flat=True)))
+        for question in text_questions:
+            newest = (Answer.objects.filter(question=question, body__gt='')
+                      .order_by('-response__submitted_at', '-response_id').values_list('body', flat=True)[:5])
+            self.assertEqual(samples[question.id], list(newest))
+
+        self.client.force_login(self.creator)
+        page = self.client.get(reverse('surveys:survey-results', args=[self.survey.pk])).content.decode()
+        self.assertIn('Recent answers', page)
+        self.assertIn(escape(samples[text_questions[0].id][0]), page)
+
+
+class ResponsesBrowserTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creator = User.objects.create(username='creator', is_staff=True)
+        users = User.objects.bulk_create([User(username=f'respondent{n}') for n in range(60)])
+        cls.survey = make_survey(cls.creator, 3)
+        SurveyDataGenerator(seed=6).create_responses(cls.survey, [user.pk for user in users])
+        # Ties on submitted_at must be broken by id, across page boundaries too.
+        tied = list(cls.survey.responses.order_by('id').values_list('id', flat=True)[:30])
+        Response.objects.filter(id__in=tied).update(submitted_at=timezone.now())
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.creator)
+
+    def test_cursor_pages_cover_every_response_once(self):
+        url = reverse('surveys:survey-responses', args=[self.survey.pk])
+        seen, cursor, pages = [], None, 0
+        while True:
+            context = self.client.get(url, {'cursor': cursor} if cursor else {}).context
+            seen += [response.pk for response in context['responses']]
+            pages += 1
+            cursor = context['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(pages, 3)
+        expected = list(self.survey.responses.order_by('-submitted_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+
+class ExportTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creator = User.objects.create(username='creator', is_staff=True)
+        # TEXT, TEXTAREA, CHOICE, MULTICHOICE, RATING.
+        cls.survey = make_survey(cls.creator, 5)
+        schema = get_survey_schema(cls.survey.pk)
+        save_submission(schema, User.objects.create(username='alice'), make_post_data(cls.survey))
+        text_question = cls.survey.questions.order_by('order')[0]
+        save_submission(schema, User.objects.create(username='bob'), QueryDict(f'question_{text_question.pk}=Hello%2C+%22world%22%0Abye'))
+
+    def expected_rows(self):
+        alice, bob = self.survey.responses.order_by('id')
+        return [
+            [str(alice.pk), 'alice', alice.submitted_at.isoformat(), 'Some text', 'Some text', 'Choice 0', 'Choice 0; Choice 1', '4'],
+            [str(bob.pk), 'bob', bob.submitted_at.isoformat(), 'Hello, "world"\nbye', '', '', '', ''],
+        ]
+
+    def test_csv_has_one_row_per_response_and_column_per_question(self):
+        # chunk_size=1 puts every response in its own chunk.
+        rows = list(csv.reader(io.StringIO(''.join(stream_export(self.survey, 'csv', chunk_size=1)))))
+        labels = [f'Q{n}. Question {n - 1}' for n in range(1, 6)]
+        self.assertEqual(rows[0], ['response_id', 'respondent', 'submitted_at'] + labels)
+        self.assertEqual(rows[1:], self.expected_rows())
+
+    def test_jsonl_has_the_same_content(self):
+        lines = ''.join(stream_export(self.survey, 'jsonl', chunk_size=1)).splitlines()
+        header = next(csv.reader(io.StringIO(''.join(stream_export(self.survey, 'csv')))))
+        self.assertEqual([list(map(str, json.loads(line).values())) for line in lines], self.expected_rows())
+        self.assertEqual(list(json.loads(lines[0])), header)
+
+
+class AvailabilityTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creator = User.objects.create(username='creator', is_staff=True)
+        cls.student = User.objects.create(username='student')
+        cls.student.profile.user_type = 'STUDENT'
+        cls.student.profile.save()
+
+    def test_lists_open_surveys_for_the_users_audience_only(self):
+        now = timezone.now()
+        open_all = Survey.objects.create(title='Open to all', creator=self.creator)
+        open_students = Survey.objects.create(title='Students', creator=self.creator, target_audience='STUDENT')
+        Survey.objects.create(title='Staff', creator=self.creator, target_audience='STAFF')
+        Survey.objects.create(title='Closed', creator=self.creator, end_date=now - timedelta(days=1))
+        Survey.objects.create(title='Not yet', creator=self.creator, start_date=now + timedelta(days=1))
+        Survey.objects.create(title='Inactive', creator=self.creator, is_active=False)
+        Response.objects.create(survey=open_all, respondent=self.student)
+
+        titles = [survey['title'] for survey in available_surveys_for(self.student)]
+        self.assertEqual(titles, [open_students.title])
+
+    def test_cached_list_only_costs_the_taken_surveys_query(self):
+        Survey.objects.create(title='Open to all', creator=self.creator)
+        available_surveys_for(self.student)
+        with self.assertNumQueries(1):
+            available_surveys_for(self.student)
+
+    def test_cached_list_expires_at_the_next_start_or_end_date(self):
+        now = timezone.now()
+        Survey.objects.create(title='Soon', creator=self.creator, start_date=now + timedelta(minutes=5))
+        Survey.objects.create(title='Closing', creator=self.creator, end_date=now + timedelta(minutes=2))
+        open_surveys, timeout = _load_open_surveys('STUDENT', now)
+        self.assertEqual([survey['title'] for survey in open_surveys], ['Closing'])
+        self.assertEqual(timeout, 121)
+
+
+class AsyncTakeViewTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creator = User.objects.create(username='creator', is_staff=True)
+        cls.respondent = User.objects.create(username='respondent')
+
+    def async_request(self, method, path, user, data=None):
+        request = getattr(AsyncRequestFactory(), method)(path, data or {})
+        async def auser():
+            return user
+        request.auser = auser
+        return request
+
+    async def test_submits_once_then_refuses(self):
+        survey = await Survey.objects.acreate(title='Async', creator=self.creator)
+        question = await Question.objects.acreate(survey=survey, text='Rate it', question_type=Question.QuestionType.RATING)
+        path = f'/surveys/survey/{survey.pk}/take/'
+
+        response = await survey_take(self.async_request('post', path, self.respondent, {f'question_{question.pk}': '5'}), pk=survey.pk)
+        self.assertEqual(response.status_code, 302)
+        answer = await Answer.objects.select_related('response').aget(question=question)
+        self.assertEqual((answer.response.respondent_id, answer.body), (self.respondent.pk, '5'))
+
+        with self.assertRaises(PermissionDenied):
+            await survey_take(self.async_request('get', path, self.respondent), pk=survey.pk)
+
+
+@override_settings(SUBMISSION_QUEUE_PATH=os.path.join(tempfile.mkdtemp(), 'queue.sqlite3'))
+class SubmissionQueueTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creator = User.objects.create(username='creator', is_staff=True)
+        cls.respondents = [User.objects.create(username=f'respondent{i}') for i in range(3)]
+
+    def test_connection_is_reused(self):
+        self.assertFalse(is_queued(1, self.respondents[0].pk))
+        self.assertIs(queue_connection(), queue_connection())
+
+    def test_queued_submissions_are_saved_exactly_once(self):
+        survey = make_survey(self.creator, 5)
+        schema = get_survey_schema(survey.pk)
+        answers = build_answers(schema.questions, schema.valid_choices, make_post_data(survey))
+        for respondent in self.respondents:
+            self.assertTrue(enqueue_submission(schema, respondent, answers))
+        # A second submission by the same respondent is refused by the queue itself.
+        self.assertFalse(enqueue_submission(schema, self.respondents[0], answers))
+
+        # Pretend an earlier run saved the first submission but crashed before
+        # removing it from the queue.
+        save_submission(schema, self.respondents[0], make_post_data(survey))
+
+        self.assertEqual(flush_queue(batch_size=10), (3, 2))
+        self.assertEqual(queue_length(), 0)
+        self.assertEqual(Response.objects.filter(survey=survey).count(), 3)
+        self.assertEqual(Answer.objects.filter(response__survey=survey).count(), 15)
+
+
+@override_settings(SUBMISSION_QUEUE_PATH=os.path.join(tempfile.mkdtemp(), 'queue.sqlite3'))
+class SubmissionQueueFailureTests(SurveyTransactionTestCase):
+    # Foreign keys are only checked when a transaction really commits, which
+    # TestCase never lets happen.
+
+    def test_a_failing_submission_does_not_block_the_queue(self):
+        User = get_user_model()
+        creator = User.objects.create(username='creator', is_staff=True)
+        respondents = [User.objects.create(username=f'respondent{i}') for i in range(3)]
+        survey = make_survey(creator, 3)
+        schema = get_survey_schema(survey.pk)
+        answers = build_answers(schema.questions, schema.valid_choices, make_post_data(survey))
+        for respondent in respondents:
+            enqueue_submission(schema, respondent, answers)
+        # Deleted while its submission waits in the queue.
+        gone = respondents[1].pk
+        respondents[1].delete()
+
+        with self.assertLogs('surveys.ingest', 'WARNING'):
+            self.assertEqual(flush_queue(batch_size=10), (3, 2))
+        self.assertEqual(queue_length(), 0)
+        self.assertEqual(sorted(Response.objects.values_list('respondent_id', flat=True)), [respondents[0].pk, respondents[2].pk])
+        [failed] = failed_submissions()
+        self.assertEqual(failed[1:3], (survey.pk, gone))
+        self.assertEqual(flush_queue(), (0, 0))
+
+
+class SeedingTests(SurveyTestCase):
+    def test_generates_consistent_data_with_tallies(self):
+        counts = SurveyDataGenerator(users={'STUDENT': 20, 'STAFF': 5}, surveys=3, response_rate=0.5, seed=7, chunk_size=4).run()
+        self.assertEqual(counts['users'], 25)
+        self.assertEqual(Response.objects.count(), counts['responses'])
+        self.assertEqual(Answer.objects.count(), counts['answers'])
+        # bulk_create skips the signal, so the generator must add the profiles itself.
+        self.assertFalse(get_user_model().objects.filter(profile__isnull=True).exists())
+        for survey in Survey.objects.all():
+            self.assertEqual(verify_tallies(get_survey_schema(survey.pk)), [])
+
+    def test_same_seed_gives_the_same_timestamps(self):
+        def generate():
+            SurveyDataGenerator(users={'STUDENT': 6}, surveys=2, seed=8).run()
+            stamps = (list(Survey.objects.order_by('title').values_list('title', 'created_at')),
+                      sorted(Response.objects.values_list('submitted_at', flat=True)))
+            get_user_model().objects.filter(username__startswith='seed8-').delete()
+            return stamps
+
+        first = generate()
+        self.assertEqual(generate(), first)
+        self.assertTrue(all(submitted < EPOCH for submitted in first[1]))
+
+        call_command('seed_survey_data', '--users', 'STUDENT=2', '--surveys', '1', '--seed', '9', '--now', '2024-06-01',
+                     stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertLess(Survey.objects.get().created_at, timezone.make_aware(datetime(2024, 6, 1)))
+        with self.assertRaises(CommandError):
+            call_command('seed_survey_data', '--seed', '10', '--now', 'soon', stdout=io.StringIO())
+
+
+@override_settings(METRICS_PATH=os.path.join(tempfile.mkdtemp(), 'metrics.sqlite3'), METRICS_FLUSH_INTERVAL=3600, METRICS_TOKEN='secret')
+class MetricsTests(SurveyTestCase):
+    def test_requests_are_exposed_per_view(self):
+        self.client.get(reverse('login'))
+        self.client.get(reverse('login'))
+        body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('django_view_requests_total{view="login",status="200"} 2', body)
+        self.assertIn('django_view_latency_seconds_count{view="login"} 2', body)
+        self.assertIn('django_view_template_seconds_bucket{view="login",le="+Inf"} 2', body)
+
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_refused_without_a_configured_token_unless_debugging(self):
+        with self.settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            with self.settings(DEBUG=True):
+                self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+# The most SQL queries each page may run, whatever the size of the survey,
+# with a cold cache. The counts include the session, user and profile lookups.
+# A page going over its budget, or running more queries for a bigger survey,
+# usually means a template started looping over related objects (an N+1).
+QUERY_BUDGETS = {
+    'surveys:survey-list': 6,
+    'surveys:survey-detail': 5,
+    'surveys:survey-update': 4,
+    'surveys:survey-take': 6,
+    'surveys:survey-results': 13,
+    'surveys:survey-responses': 7,
+    'surveys:survey-export': 8,
+    'surveys:survey-segments': 11,
+    'surveys:survey-timeline': 5,
+    'surveys:survey-search': 4,
+    'surveys:survey-public-take': 4,
+    'surveys:question-edit': 5,
+    'surveys:survey-delete': 4,
+}
+
+
+class QueryBudgetTests(SurveyTestCase):
+    """Every page must cost the same number of queries for a small and a large survey."""
+    # (questions, responses). make_survey() cycles through the question types,
+    # so even the small survey has one question of every type.
+    SIZES = {'small': (5, 5), 'large': (60, 500)}
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creator = User.objects.create(username='creator', is_staff=True)
+        cls.respondent = User.objects.create(username='respondent')
+        cls.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        users = User.objects.bulk_create([User(username=f'respondent{n}') for n in range(max(r for _, r in cls.SIZES.values()))])
+        generator = SurveyDataGenerator(seed=1)
+        cls.surveys = {}
+        for size, (questions, responses) in cls.SIZES.items():
+            survey = make_survey(cls.creator, questions, title=size)
+            generator.create_responses(survey, [user.pk for user in users[:responses]])
+            cls.surveys[size] = survey
+        Survey.objects.filter(pk__in=[survey.pk for survey in cls.surveys.values()]).update(is_public=True)
+        generator.finish(cls.surveys.values())
+
+    def count_queries(self, user, url_name, survey):
+        return self.count_url_queries(user, reverse(url_name, args=[survey.pk] if survey else []))
+
+    def count_url_queries(self, user, url):
+        cache.clear()
+        ContentType.objects.clear_cache()
+        if user is None:
+            self.client.logout()
+        else:
+            self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries)
+
+    def assert_within_budget(self, user, url_name, per_survey=True):
+        counts = {size: self.count_queries(user, url_name, survey if per_survey else None) for size, survey in self.surveys.items()}
+        self.assertEqual(counts['small'], counts['large'], f"{url_name} runs more queries for a bigger survey: {counts}")
+        self.assertLessEqual(counts['large'], QUERY_BUDGETS[url_name], f"{url_name} is over its query budget")
+
+    def test_creator_pages(self):
+        for url_name in ('surveys:survey-detail', 'surveys:survey-update', 'surveys:survey-results', 'surveys:survey-responses', 'surveys:survey-export', 'surveys:survey-segments', 'surveys:survey-timeline', 'surveys:survey-search'):
+            with self.subTest(url_name):
+                self.assert_within_budget(self.creator, url_name)
+
+    def test_take_form(self):
+        self.assert_within_budget(self.respondent, 'surveys:survey-take')
+
+    def test_public_link_question_edit_and_delete_pages(self):
+        # (user, url name, url arguments for a survey).
+        pages = [
+            (None, 'surveys:survey-public-take', lambda survey: [survey.public_id]),
+            (self.creator, 'surveys:question-edit', lambda survey: [survey.questions.order_by('order')[2].pk]),
+            (self.creator, 'surveys:survey-delete', lambda survey: [survey.pk]),
+        ]
+        for user, url_name, args_for in pages:
+            with self.subTest(url_name):
+                counts = {size: self.count_url_queries(user, reverse(url_name, args=args_for(survey))) for size, survey in self.surveys.items()}
+                self.assertEqual(counts['small'], counts['large'], f"{url_name} runs more queries for a bigger survey: {counts}")
+                self.assertLessEqual(counts['large'], QUERY_BUDGETS[url_name], f"{url_name} is over its query budget")
+
+    def test_admin_pages(self):
+        # (budget, url for a survey): the responses list filtered to the survey,
+        # and the change page of one of its responses with its answers.
+        pages = {
+            'admin responses list': (5, lambda survey: reverse('admin:surveys_response_changelist') + f'?survey={survey.pk}'),
+            'admin response page': (6, lambda survey: reverse('admin:surveys_response_change', args=[survey.responses.first().pk])),
+        }
+        for name, (budget, url_for) in pages.items():
+            with self.subTest(name):
+                counts = {size: self.count_url_queries(self.admin, url_for(survey)) for size, survey in self.surveys.items()}
+                self.assertEqual(counts['small'], counts['large'], f"{name} runs more queries for a bigger survey: {counts}")
+                self.assertLessEqual(counts['large'], budget, f"{name} is over its query budget")
+
+    def test_dashboards(self):
+        for user in (self.creator, self.respondent):
+            with self.subTest(user.username):
+                self.assert_within_budget(user, 'surveys:survey-list', per_survey=False)
+
+
+class AnonymousPublicLinkTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = get_user_model().objects.create(username='creator', is_staff=True)
+
+    def test_anonymous_submission_once_per_browser(self):
+        survey = make_survey(self.creator, 5)
+        survey.is_public = True
+        survey.save()
+        url = reverse('surveys:survey-public-take', args=[survey.public_id])
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post(url, make_post_data(survey))
+        self.assertRedirects(response, reverse('surveys:survey-thank-you'))
+        saved = Response.objects.get(survey=survey)
+        self.assertIsNone(saved.respondent)
+        self.assertEqual(saved.answers.count(), 5)
+
+        # The signed cookie stops this browser from answering again.
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.post(url, make_post_data(survey)).status_code, 403)
+        self.assertEqual(Response.objects.filter(survey=survey).count(), 1)
+
+    def test_public_form_posts_to_its_own_action(self):
+        survey = make_survey(self.creator, 3)
+        survey.is_public = True
+        survey.save()
+        url = reverse('surveys:survey-public-take', args=[survey.public_id])
+        page = self.client.get(url).content.decode()
+        action = re.search(r'<form method="POST" action="([^"]+)"', page).group(1)
+        self.assertEqual(action, url)
+        response = self.client.post(action, make_post_data(survey))
+        self.assertRedirects(response, reverse('surveys:survey-thank-you'))
+        self.assertIsNone(Response.objects.get(survey=survey).respondent)
+
+    def test_private_surveys_still_require_login(self):
+        survey = make_survey(self.creator, 1)
+        response = self.client.get(reverse('surveys:survey-take', args=[survey.pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response.url)
+
+
+@override_settings(RATE_LIMIT_PATH=os.path.join(tempfile.mkdtemp(), 'rate_limits.sqlite3'), RATE_LIMIT_ENABLED=True)
+class ThrottleTests(SurveyTestCase):
+    def test_token_bucket_refills_over_time(self):
+        self.assertEqual(take_token('bucket', 2, 10, now=100), (True, 0))
+        self.assertEqual(take_token('bucket', 2, 10, now=100), (True, 0))
+        self.assertEqual(take_token('bucket', 2, 10, now=100), (False, 5))
+        # One token comes back every 5 seconds.
+        self.assertEqual(take_token('bucket', 2, 10, now=105), (True, 0))
+
+    def test_no_token_is_spent_when_another_bucket_refuses(self):
+        self.assertEqual(take_token('survey', 1, 60, now=100), (True, 0))
+        self.assertEqual(take_tokens([('ip', 1, 60), ('survey', 1, 60)], now=100), (False, 60))
+        # The per-IP bucket still has its token.
+        self.assertEqual(take_token('ip', 1, 60, now=100), (True, 0))
+
+    def test_idle_buckets_are_pruned(self):
+        with self.settings(RATE_LIMIT_PATH=os.path.join(tempfile.mkdtemp(), 'rate_limits.sqlite3')):
+            take_token('idle', 1, 60, now=100)
+            take_token('busy', 1, 60, now=100 + PRUNE_INTERVAL - 10)
+            take_token('busy', 1, 60, now=100 + PRUNE_INTERVAL + 50)
+            keys = [key for (key,) in _connect().execute('SELECT key FROM bucket')]
+        self.assertEqual(keys, ['busy'])
+
+    def test_connection_is_reused(self):
+        take_token('reused', 5, 10)
+        self.assertIs(_connect(), _connect())
+
+    def test_concurrency_slots_are_shared_and_released(self):
+        first = acquire_slot('route', 1)
+        self.assertIsNotNone(first)
+        self.assertIsNone(acquire_slot('route', 1))
+        release_slot(first)
+        self.assertIsNotNone(acquire_slot('route', 1))
+
+    def test_public_link_returns_429_with_retry_after(self):
+        survey = Survey.objects.create(title='Public', creator=get_user_model().objects.create(username='creator'), is_public=True)
+        url = reverse('surveys:survey-public-take', args=[survey.public_id])
+        limits = {'surveys:survey-public-take': {'per_ip': (2, 60)}}
+        with self.settings(RATE_LIMITS=limits, RATE_LIMIT_PATH=os.path.join(tempfile.mkdtemp(), 'rate_limits.sqlite3')):
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(self.client.get(url).status_code, 200)
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+
+    def test_middleware_runs_as_coroutines_under_asgi(self):
+        # Django logs (at DEBUG) each middleware it has to wrap in async_to_sync.
+        with self.settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            handler = ASGIHandler()
+        self.assertTrue(iscoroutinefunction(handler._middleware_chain))
+
+    async def test_public_link_is_limited_under_asgi(self):
+        creator = await get_user_model().objects.acreate(username='creator')
+        survey = await Survey.objects.acreate(title='Public', creator=creator, is_public=True)
+        url = reverse('surveys:survey-public-take', args=[survey.public_id])
+        limits = {'surveys:survey-public-take': {'per_ip': (1, 60), 'max_concurrent': 1}}
+        with self.settings(RATE_LIMITS=limits, RATE_LIMIT_PATH=os.path.join(tempfile.mkdtemp(), 'rate_limits.sqlite3')):
+            self.assertEqual((await self.async_client.get(url)).status_code, 200)
+            self.assertEqual((await self.async_client.get(url)).status_code, 429)
+
+    def test_submissions_through_the_rendered_form_are_limited(self):
+        creator = get_user_model().objects.create(username='creator', is_staff=True)
+        survey = make_survey(creator, 2)
+        survey.is_public = True
+        survey.save()
+        url = reverse('surveys:survey-public-take', args=[survey.public_id])
+        limits = {'surveys:survey-public-take': {'per_ip': (2, 60)}}
+        with self.settings(RATE_LIMITS=limits, RATE_LIMIT_PATH=os.path.join(tempfile.mkdtemp(), 'rate_limits.sqlite3')):
+            page = self.client.get(url).content.decode()
+            action = re.search(r'<form method="POST" action="([^"]+)"', page).group(1)
+            self.assertEqual(self.client.post(action, make_post_data(survey)).status_code, 302)
+            # Refused before the view runs (which would say 403: already submitted).
+            self.assertEqual(self.client.post(action, make_post_data(survey)).status_code, 429)
+
+
+class SegmentTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creator = User.objects.create(username='creator', is_staff=True)
+        cls.survey = make_survey(cls.creator, 5)
+        cls.choice_question = cls.survey.questions.get(question_type=Question.QuestionType.CHOICE)
+        cls.rating_question = cls.survey.questions.get(question_type=Question.QuestionType.RATING)
+        first, second = cls.choice_question.choices.all()[:2]
+        # (role, chosen choice, rating) for each respondent
+        cls.answers = [('STUDENT', first, '5'), ('STUDENT', first, '5'), ('STUDENT', second, '3'), ('STAFF', second, '5')]
+        for n, (role, choice, rating) in enumerate(cls.answers):
+            user = User.objects.create(username=f'respondent{n}')
+            user.profile.user_type = role
+            user.profile.save()
+            data = make_post_data(cls.survey)
+            data[f'question_{cls.choice_question.id}'] = str(choice.id)
+            data[f'question_{cls.rating_question.id}'] = rating
+            save_submission(get_survey_schema(cls.survey.pk), user, data)
+
+    def test_breakdown_by_role(self):
+        breakdown = role_breakdown(get_survey_schema(self.survey.pk), Segment())
+        self.assertEqual([(code, n) for code, _, n in breakdown['roles']], [('STUDENT', 3), ('STAFF', 1)])
+        choice_rows = next(item['rows'] for item in breakdown['questions'] if item['question'].id == self.choice_question.id)
+        self.assertEqual([(counts, total) for _, counts, total in choice_rows[:2]], [([2, 0], 2), ([1, 1], 2)])
+
+    def test_cross_tab_counts_answer_pairs_within_a_segment(self):
+        schema = get_survey_schema(self.survey.pk)
+        rows = {question.id: question for question in schema.questions}
+        with self.assertNumQueries(1):
+            table = cross_tab(schema, rows[self.choice_question.id], rows[self.rating_question.id], Segment(user_type='STUDENT'))
+        # Columns are the ratings 1-5; two students picked the first choice and rated 5.
+        self.assertEqual(table['rows'][0][1], [0, 0, 0, 0, 2])
+        self.assertEqual(table['rows'][1][1], [0, 0, 1, 0, 0])
+        self.assertEqual(table['total'], 3)
+
+    def test_json_format(self):
+        self.client.force_login(self.creator)
+        url = reverse('surveys:survey-segments', args=[self.survey.pk])
+        data = self.client.get(url, {'format': 'json', 'row_question': self.choice_question.id, 'column_question': self.rating_question.id}).json()
+        self.assertEqual(data['cross_tab']['total'], 4)
+        self.assertEqual(self.client.get(url, {'format': 'json', 'row_question': self.choice_question.id}).status_code, 400)
+
+    def test_cached_report_follows_new_responses_and_role_changes(self):
+        schema = get_survey_schema(self.survey.pk)
+
+        def roles():
+            return [(code, n) for code, _, n in get_segment_report(schema, Segment())['breakdown']['roles']]
+
+        self.assertEqual(roles(), [('STUDENT', 3), ('STAFF', 1)])
+        with self.assertNumQueries(1):  # The tallied response count; the rest comes from the cache.
+            roles()
+
+        staff = Profile.objects.get(user_type='STAFF')
+        staff.user_type = 'FACULITY'
+        with self.captureOnCommitCallbacks(execute=True):
+            staff.save()
+        self.assertEqual(roles(), [('STUDENT', 3), ('FACULITY', 1)])
+
+        newcomer = get_user_model().objects.create(username='newcomer')
+        with self.captureOnCommitCallbacks(execute=True):
+            save_submission(schema, newcomer, make_post_data(self.survey))
+        self.assertEqual(sum(n for _, n in roles()), 5)
+
+        # Logging in saves the profile too, but changes no role.
+        with self.assertNumQueries(1):
+            staff.save()
+
+
+class ResponseMatrixTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creator = User.objects.create(username='creator', is_staff=True)
+        cls.users = User.objects.bulk_create([User(username=f'respondent{n}') for n in range(30)])
+        # One question of every type: TEXT, TEXTAREA, CHOICE, MULTICHOICE, RATING.
+        cls.survey = make_survey(cls.creator, 5)
+        SurveyDataGenerator(seed=3).create_responses(cls.survey, [user.pk for user in cls.users[:20]])
+
+    def setUp(self):
+        super().setUp()
+        # Every test starts without a matrix on disk.
+        settings = self.settings(ANALYTICS_CACHE_DIR=tempfile.mkdtemp())
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.schema = get_survey_schema(self.survey.pk)
+        self.choice, self.multi, self.rating = self.schema.questions[2:5]
+
+    def test_build_matches_the_database(self):
+        matrix = build_response_matrix(self.survey, full=True)
+        self.assertEqual(list(matrix.response_ids), list(self.survey.responses.order_by('id').values_list('id', flat=True)))
+        through = Answer.choices.through.objects
+        for question in (self.choice, self.multi):
+            expected = {choice.id: through.filter(choice_id=choice.id).count() for choice in question.choices}
+            self.assertEqual(matrix.choice_counts(question.id), expected)
+        bodies = Answer.objects.filter(question_id=self.rating.id).values_list('body', flat=True)
+        expected = {}
+        for body in bodies:
+            if body:
+                expected[int(body)] = expected.get(int(body), 0) + 1
+        self.assertEqual(matrix.rating_histogram(self.rating.id), expected)
+
+    def test_new_responses_are_appended_and_deleted_ones_force_a_rebuild(self):
+        build_response_matrix(self.survey, full=True)
+        SurveyDataGenerator(seed=4).create_responses(self.survey, [user.pk for user in self.users[20:]])
+        matrix = build_response_matrix(self.survey)
+        self.assertEqual(len(matrix), 30)
+        self.assertEqual(matrix.meta['last_response_id'], self.survey.responses.order_by('-id').first().pk)
+
+        self.survey.responses.order_by('id').first().delete()
+        self.assertIsNone(usable_response_matrix(self.schema))
+        matrix = build_response_matrix(self.survey)
+        self.assertEqual(len(matrix), 29)
+        self.assertIsNotNone(usable_response_matrix(self.schema))
+
+    def test_cross_tab_from_the_matrix_matches_the_database(self):
+        from_database = cross_tab(self.schema, self.choice, self.multi, Segment())
+        build_response_matrix(self.survey, full=True)
+        self.assertIsNotNone(usable_response_matrix(self.schema))
+        self.assertGreater(from_database['total'], 0)
+        self.assertEqual(cross_tab(self.schema, self.choice, self.multi, Segment()), from_database)
+
+        # Responses newer than the matrix are counted in the database.
+        SurveyDataGenerator(seed=4).create_responses(self.survey, [user.pk for user in self.users[20:]])
+        with self.settings(ANALYTICS_CACHE_DIR=tempfile.mkdtemp()):
+            from_database = cross_tab(self.schema, self.rating, self.multi, Segment())
+        self.assertEqual(cross_tab(self.schema, self.rating, self.multi, Segment()), from_database)
+
+
+class RollupTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creator = User.objects.create(username='creator', is_staff=True)
+        cls.survey = make_survey(cls.creator, 3)
+        cls.respondents = []
+        for n, role in enumerate(['STUDENT', 'STUDENT', 'STAFF']):
+            user = User.objects.create(username=f'respondent{n}')
+            user.profile.user_type = role
+            user.profile.save()
+            cls.respondents.append(user)
+
+    def submit_all(self):
+        schema = get_survey_schema(self.survey.pk)
+        for respondent in self.respondents:
+            save_submission(schema, respondent, make_post_data(self.survey))
+        save_submission(schema, None, make_post_data(self.survey))
+
+    def test_submissions_are_counted_per_minute_and_role(self):
+        self.submit_all()
+        rows = SubmissionRollup.objects.filter(survey=self.survey)
+        self.assertEqual(set(rows.values_list('granularity', flat=True)), {'MINUTE'})
+        self.assertEqual(dict(rows.values_list('user_type', 'count')), {'STUDENT': 2, 'STAFF': 1, 'NONE': 1})
+
+    def test_compaction_keeps_the_totals(self):
+        self.submit_all()
+        # Pretend the submissions arrived 100 days ago.
+        old = timezone.now() - timedelta(days=100)
+        Response.objects.filter(survey=self.survey).update(submitted_at=old)
+        rebuild_rollups(self.survey.pk, now=timezone.now() - timedelta(days=100))
+        self.assertEqual(set(SubmissionRollup.objects.values_list('granularity', flat=True)), {'MINUTE'})
+
+        compact_rollups()
+        rows = SubmissionRollup.objects.filter(survey=self.survey)
+        self.assertEqual(set(rows.values_list('granularity', flat=True)), {'DAY'})
+        self.assertEqual(rows.count(), 3)  # one per role
+        series = submission_series(self.survey.pk, 'DAY')
+        self.assertEqual(series['total'], 4)
+        self.assertEqual([point['total'] for point in series['points']], [4])
+
+    def test_deleting_a_response_takes_it_out_of_its_bucket(self):
+        self.submit_all()
+        Response.objects.get(survey=self.survey, respondent=self.respondents[2]).delete()
+        self.assertEqual(submission_series(self.survey.pk, 'HOUR')['total'], 3)
+
+    def test_admin_delete_action_rebuilds_the_tallies_and_rollups_once(self):
+        self.submit_all()
+        admin = get_user_model().objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        doomed = list(Response.objects.filter(respondent__in=self.respondents[:2]).values_list('pk', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('admin:surveys_response_changelist'), {
+                'action': 'delete_selected', 'post': 'yes', '_selected_action': doomed,
+            })
+        self.assertEqual(response.status_code, 302)
+        # No per-response role lookups for the rollups, nor answer lookups for the tallies.
+        self.assertEqual([query for query in queries if 'FROM "surveys_profile"' in query['sql']], [])
+        self.assertEqual([query for query in queries if re.search(r'"surveys_answer"\."response_id" = \d', query['sql'])], [])
+        rows = SubmissionRollup.objects.filter(survey=self.survey)
+        self.assertEqual(dict(rows.values_list('user_type', 'count')), {'STAFF': 1, 'NONE': 1})
+        self.assertEqual(verify_tallies(get_survey_schema(self.survey.pk)), [])
+
+    def test_timeline_json(self):
+        self.submit_all()
+        self.client.force_login(self.creator)
+        url = reverse('surveys:survey-timeline', args=[self.survey.pk])
+        data = self.client.get(url, {'format': 'json', 'granularity': 'MINUTE'}).json()
+        self.assertEqual(data['total'], 4)
+        # The last three hours, minute by minute, including the empty ones.
+        self.assertGreaterEqual(len(data['points']), 3 * 60)
+        self.assertEqual(sum(point['by_role']['STUDENT'] for point in data['points']), 2)
+        self.assertEqual(self.client.get(url, {'format': 'json', 'granularity': 'WEEK'}).status_code, 400)
+
+
+class SearchTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creator = User.objects.create(username='creator', is_staff=True)
+        cls.survey = make_survey(cls.creator, 5)
+        cls.other_survey = make_survey(cls.creator, 5, title='Other')
+        cls.text_question = cls.survey.questions.get(question_type=Question.QuestionType.TEXT)
+        comments = ['The wifi keeps dropping', 'Wifi in the <b>library</b> is slow', 'More study rooms please']
+        comments += ['Another comment about the wifi'] * 12
+        for n, comment in enumerate(comments):
+            user = User.objects.create(username=f'respondent{n}')
+            data = make_post_data(cls.survey)
+            data[f'question_{cls.text_question.id}'] = comment
+            save_submission(get_survey_schema(cls.survey.pk), user, data)
+        other = cls.other_survey.questions.get(question_type=Question.QuestionType.TEXT)
+        data = make_post_data(cls.other_survey)
+        data[f'question_{other.id}'] = 'wifi is fine here'
+        save_submission(get_survey_schema(cls.other_survey.pk), cls.creator, data)
+
+    def search(self, query, **kwargs):
+        return search_answers(get_survey_schema(self.survey.pk), query, **kwargs)
+
+    def search_pages(self, query, page_size):
+        schema = get_survey_schema(self.survey.pk)
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(2):
+                results, cursor = search_answers(schema, query, cursor=cursor, page_size=page_size)
+            seen += [result['answer_id'] for result in results]
+            if not cursor:
+                return seen
+
+    def test_finds_matching_text_answers_in_this_survey_only(self):
+        results, _ = self.search('WiFi', page_size=100)
+        self.assertEqual(len(results), 14)
+        self.assertTrue(all(result['question'].id == self.text_question.id for result in results))
+        self.assertEqual(self.search('study room')[0][0]['snippet'], 'More <mark>study</mark> <mark>rooms</mark> please')
+        # Rating answers are not indexed, and operators typed by the user are plain words.
+        self.assertEqual(self.search('4')[0], [])
+        self.assertEqual(self.search('wifi AND (NEAR')[0], [])
+
+    def test_snippets_are_escaped(self):
+        results, _ = self.search('library')
+        self.assertEqual(results[0]['snippet'], 'Wifi in the &lt;b&gt;<mark>library</mark>&lt;/b&gt; is slow')
+
+    def test_pages_cover_every_match_once(self):
+        seen = self.search_pages('wifi', page_size=5)
+        self.assertEqual(len(seen), 14)
+        self.assertEqual(len(set(seen)), 14)
+
+    def test_deleted_and_edited_answers_leave_the_index(self):
+        answer = Answer.objects.get(body='The wifi keeps dropping')
+        answer.body = 'The network keeps dropping'
+        answer.save()
+        self.assertEqual(len(self.search('network')[0]), 1)
+        answer.response.delete()
+        self.assertEqual(self.search('network')[0], [])
+        self.assertEqual(len(self.search('wifi', page_size=100)[0]), 13)
+
+
+class TextSummaryTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creator = User.objects.create(username='creator', is_staff=True)
+        cls.survey = make_survey(cls.creator, 5)
+        cls.text_question = cls.survey.questions.get(question_type=Question.QuestionType.TEXT)
+        comments = ['The wifi is slow', 'Slow wifi, slow wifi!', 'The library wifi is great', 'Library hours are too short']
+        for n, comment in enumerate(comments):
+            user = User.objects.create(username=f'respondent{n}')
+            data = make_post_data(cls.survey)
+            data[f'question_{cls.text_question.id}'] = comment
+            save_submission(get_survey_schema(cls.survey.pk), user, data)
+
+    def test_extract_terms(self):
+        self.assertEqual(extract_terms("The Wi-Fi isn't working, the wifi"), ({'wi', 'fi', 'working', 'wifi'}, {'wi fi'}))
+
+    def test_submissions_update_the_top_terms(self):
+        schema = get_survey_schema(self.survey.pk)
+        with self.assertNumQueries(1):
+            terms = top_terms(schema)
+        # Counted once per answer, however often an answer repeats a word.
+        self.assertEqual(terms[self.text_question.id]['words'][:3], [('wifi', 3), ('library', 2), ('slow', 2)])
+        self.assertEqual(terms[self.text_question.id]['pairs'], [('library hours', 1), ('library wifi', 1), ('slow wifi', 1)])
+        # The other text question only ever got "Some text" ("some" is a stop word).
+        other = next(question_id for question_id in terms if question_id != self.text_question.id)
+        self.assertEqual(terms[other]['words'], [('text', 4)])
+
+    def test_deleting_and_rebuilding_match_the_answers(self):
+        schema = get_survey_schema(self.survey.pk)
+        Response.objects.filter(answers__body='The wifi is slow').delete()
+        after_delete = top_terms(schema)
+        self.assertEqual(after_delete[self.text_question.id]['words'][:2], [('library', 2), ('wifi', 2)])
+        rebuild_text_summary(schema)
+        self.assertEqual(top_terms(schema), after_delete)
+
+    def test_deleting_a_response_updates_the_counts_once(self):
+        response = Response.objects.filter(answers__body='The wifi is slow').get()
+        with CaptureQueriesContext(connection) as queries:
+            response.delete()
+        # Both of its text answers in one UPDATE, not one per answer.
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "surveys_texttermtally"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(top_terms(get_survey_schema(self.survey.pk))[self.text_question.id]['words'][:2], [('library', 2), ('wifi', 2)])
+
+    def test_bulk_deletion_rebuilds_the_counts(self):
+        schema = get_survey_schema(self.survey.pk)
+        delete_responses(Response.objects.filter(answers__body__icontains='wifi'))
+        after_delete = top_terms(schema)
+        self.assertEqual(after_delete[self.text_question.id]['words'], [('hours', 1), ('library', 1), ('short', 1)])
+        rebuild_text_summary(schema)
+        self.assertEqual(top_terms(schema), after_delete)
+
+
+class AdminPaginationTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        users = User.objects.bulk_create([User(username=f'respondent{n}') for n in range(130)])
+        cls.survey = make_survey(cls.admin, 3)
+        generator = SurveyDataGenerator(seed=1)
+        generator.create_responses(cls.survey, [user.pk for user in users])
+        generator.finish([cls.survey])
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def test_responses_list_pages_with_a_cursor(self):
+        url = reverse('admin:surveys_response_changelist')
+        first = self.client.get(url)
+        self.assertNotIn('?p=', first.content.decode())
+        cl = first.context['cl']
+        self.assertEqual(len(cl.result_list), 100)
+        self.assertIn('cursor=', cl.next_page_url)
+
+        second = self.client.get(url + cl.next_page_url).context['cl']
+        self.assertIsNone(second.next_page_url)
+        ids = [row.pk for row in cl.result_list] + [row.pk for row in second.result_list]
+        self.assertEqual(ids, list(Response.objects.order_by('-pk').values_list('pk', flat=True)))
+
+    def test_users_list_pages_with_a_cursor_on_username(self):
+        url = reverse('admin:users_customuser_changelist')
+        cl = self.client.get(url).context['cl']
+        second = self.client.get(url + cl.next_page_url).context['cl']
+        names = [user.username for user in cl.result_list] + [user.username for user in second.result_list]
+        self.assertEqual(names, sorted(get_user_model().objects.values_list('username', flat=True)))
+
+
+class DefinitionTests(SurveyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = get_user_model().objects.create(username='creator', is_staff=True)
+        cls.survey = make_survey(cls.creator, 7, title='Original')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.creator)
+
+    def create_page_data(self, num_questions):
+        """POST data for the single-page create view with a choice question every other question."""
+        data = {
+            'title': f'{num_questions} questions', 'target_audience': 'ALL', 'is_active': 'on',
+            'questions-TOTAL_FORMS': num_questions, 'questions-INITIAL_FORMS': 0,
+            'questions-MIN_NUM_FORMS': 1, 'questions-MAX_NUM_FORMS': 1000,
+        }
+        for i in range(num_questions):
+            data[f'questions-{i}-text'] = f'Question {i}'
+            data[f'questions-{i}-question_type'] = 'CHOICE' if i % 2 else 'TEXT'
+            data[f'questions-{i}-choices_text'] = 'Yes\nNo\nMaybe' if i % 2 else ''
+        return data
+
+    def test_export_and_import_round_trip(self):
+        definition = export_definition(self.survey)
+        for definition_format in definition_formats():
+            with self.subTest(definition_format):
+                text = dump_definition(definition, definition_format)
+                copy = import_definition(load_definition(text, definition_format), self.creator)
+                self.assertNotEqual(copy.pk, self.survey.pk)
+                self.assertEqual(export_definition(copy), definition)
+                self.assertEqual(get_survey_schema(copy.pk).questions[2].question_type, Question.QuestionType.CHOICE)
+
+    def test_invalid_definition_lists_every_problem(self):
+        definition = {'title': '', 'questions': [
+            {'text': 'Fine', 'type': 'TEXT'},
+            {'text': 'Bad type', 'type': 'ESSAY'},
+            {'text': 'Choices on text', 'type': 'TEXT', 'choices': ['a']},
+        ]}
+        with self.assertRaises(ValidationError) as raised:
+            build_survey(definition, self.creator)
+        self.assertEqual(len(raised.exception.messages), 3, raised.exception.messages)
+        with self.assertRaises(ValidationError):
+            load_definition('{not json')
+
+    def test_create_view_statements_do_not_grow_with_questions(self):
+        counts = {}
+        for num_questions in (4, 150):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(reverse('surveys:survey-create'), self.create_page_data(num_questions))
+            self.assertEqual(response.status_code, 302)
+            counts[num_questions] = len(queries)
+            survey = Survey.objects.get(title=f'{num_questions} questions')
+            self.assertEqual(survey.questions.count(), num_questions)
+            self.assertEqual(Choice.objects.filter(question__survey=survey).count(), 3 * (num_questions // 2))
+            self.assertEqual(list(survey.questions.values_list('order', flat=True)), list(range(num_questions)))
+        self.assertEqual(counts[4], counts[150], counts)
+
+    def test_import_view_and_definition_download(self):
+        download = self.client.get(reverse('surveys:survey-definition', args=[self.survey.pk]))
+        self.assertEqual(download['Content-Type'], 'application/json; charset=utf-8')
+        upload = SimpleUploadedFile('original.json', download.content, content_type='application/json')
+        response = self.client.post(reverse('surveys:survey-import'), {'file': upload})
+        copy = Survey.objects.exclude(pk=self.survey.pk).get()
+        self.assertRedirects(response, reverse('surveys:survey-detail', args=[copy.pk]))
+        self.assertEqual(copy.creator, self.creator)
+
+        bad = SimpleUploadedFile('bad.json', b'{"title": "No questions"}')
+        response = self.client.post(reverse('surveys:survey-import'), {'file': bad})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('non-empty list of questions', response.content.decode())
+
+    def test_commands(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'survey.json')
+            call_command('export_survey_definition', self.survey.pk, '-o', path, stderr=io.StringIO())
+            call_command('import_survey_definition', path, '--creator', 'creator', stdout=io.StringIO())
+        copy = Survey.objects.exclude(pk=self.survey.pk).get()
+        self.assertEqual(export_definition(copy), export_definition(self.survey))
+
+    @skipUnless(yaml, "PyYAML is not installed")
+    def test_commands_with_yaml(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'survey.yaml')
+            call_command('export_survey_definition', self.survey.pk, '--format', 'yaml', '-o', path, stderr=io.StringIO())
+            call_command('import_survey_definition', path, '--creator', 'creator', stdout=io.StringIO())
+        copy = Survey.objects.exclude(pk=self.survey.pk).get()
+        self.assertEqual(export_definition(copy), export_definition(self.survey))
@@ -0,0 +1,213 @@
+# surveys/text_summary.py
+
+"""
+Top words and word pairs of the answers to TEXT and TEXTAREA questions.
+
+Each answer is split into lowercase words, common English words are dropped,
+and every remaining word and every pair of adjacent remaining words counts
+once per answer in TextTermTally. Like the other tallies (tallies.py), the
+counts are increased in the transaction that saves a submission, and whole
+batches of queued submissions are added up before touching the database.
+A deleted response's text answers are subtracted again, all in one go,
+from a pre_delete receiver on Response as in tallies.py; a receiver on
+Answer would stop Django from deleting a response's or a survey's answers
+with one DELETE. The results page then reads the top terms of every text
+question in one query, however many answers there are.
+
+`manage.py rebuild_text_summaries` recomputes the counts from the saved
+answers, reading them in chunks by id, e.g. after answers were edited in
+the admin.
+"""
+
+import re
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .models import Survey, Question, Response, Answer, TextTermTally
+from .tallies import BulkResponseDeletion
+
+TEXT_TYPES = (Question.QuestionType.TEXT, Question.QuestionType.TEXTAREA)
+TOP_K = 10
+SAMPLE_SIZE = 5
+SAMPLE_RESPONSES = 50
+CHUNK_SIZE = 2000
+WORD_RE = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+FRAGMENT_RE = re.compile(r'[.,;:!?()\[\]"\n]+')
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both but by
+can could did do does doing down during each few for from further had has have having he her here hers herself him
+himself his how i if in into is it its itself just me more most my myself no nor not of off on once only or other our
+ours ourselves out over own same she should so some such than that the their theirs them themselves then there these
+they this those through to too under until up very was we were what when where which while who whom why will with
+would you your yours yourself yourselves i'm it's don't i've isn't also really get got lot
+""".split())
+
+
+def extract_terms(body):
+    """
+    The distinct words and adjacent word pairs of one answer, as
+    ({words}, {pairs}). A pair is only kept when neither word is a stop word
+    and no punctuation separates them.
+    """
+    terms, pairs = set(), set()
+    for fragment in FRAGMENT_RE.split((body or '').lower()):
+        words = [word[:100] for word in WORD_RE.findall(fragment)]
+        keep = [len(word) > 1 and word not in STOP_WORDS for word in words]
+        terms.update(word for word, kept in zip(words, keep) if kept)
+        pairs.update(
+            f'{first} {second}'[:100]
+            for first, second, kept_first, kept_second in zip(words, words[1:], keep, keep[1:])
+            if kept_first and kept_second
+        )
+    return terms, pairs
+
+
+def _count_terms(answers):
+    """Add up the terms of (question id, body) pairs: {(question id, n): Counter(term -> answers)}."""
+    counts = defaultdict(Counter)
+    for question_id, body in answers:
+        terms, pairs = extract_terms(body)
+        counts[question_id, 1].update(terms)
+        counts[question_id, 2].update(pairs)
+    return counts
+
+
+def _matching(keys):
+    """A Q object selecting the TextTermTally rows of (question id, term) pairs."""
+    by_question = defaultdict(list)
+    for question_id, term in keys:
+        by_question[question_id].append(term)
+    condition = Q()
+    for question_id, terms in by_question.items():
+        condition |= Q(question_id=question_id, term__in=terms)
+    return condition
+
+
+def _apply(counts, sign):
+    """
+    Add (sign=1) or subtract (sign=-1) term counts. Terms are grouped by how
+    much they change, and each group is one UPDATE across all questions (plus
+    a SELECT and an INSERT for terms seen for the first time), so the number
+    of queries does not depend on the number of text questions.
+    """
+    by_change = defaultdict(dict)  # count -> {(question id, term): n}
+    for (question_id, n), terms in counts.items():
+        for term, count in terms.items():
+            by_change[count][question_id, term] = n
+    for count, keys in by_change.items():
+        if sign < 0:
+            TextTermTally.objects.filter(_matching(keys), answer_count__gte=count).update(answer_count=F('answer_count') - count)
+            continue
+        if TextTermTally.objects.filter(_matching(keys)).update(answer_count=F('answer_count') + count) == len(keys):
+            continue
+        # Some terms are new. The rows that do exist were already updated above.
+        existing = set(TextTermTally.objects.filter(_matching(keys)).values_list('question_id', 'term'))
+        missing = [key for key in keys if key not in existing]
+        # ignore_conflicts makes this safe against a concurrent submission
+        # creating the same rows; both then increment them below.
+        TextTermTally.objects.bulk_create([
+            TextTermTally(question_id=question_id, term=term, n=keys[question_id, term]) for question_id, term in missing
+        ], ignore_conflicts=True, batch_size=CHUNK_SIZE)
+        TextTermTally.objects.filter(_matching(missing)).update(answer_count=F('answer_count') + count)
+
+
+def record_text_answers(schema, answers):
+    """
+    Add the text answers of one or more submissions of a survey to its term
+    counts. Must be called inside the transaction that saves them. `answers`
+    are (Answer, [choice ids]) pairs, as for tallies.record_submission.
+    """
+    text_ids = {question.id for question in schema.questions if question.question_type in TEXT_TYPES}
+    _apply(_count_terms((answer.question_id, answer.body) for answer, _ in answers if answer.question_id in text_ids and answer.body), 1)
+
+
+def rebuild_text_summary(schema):
+    """Recompute the term counts of every text question of a survey from its saved answers."""
+    question_ids = [question.id for question in schema.questions if question.question_type in TEXT_TYPES]
+    with transaction.atomic():
+        # Locking the survey row makes new submissions (whose INSERT must lock
+        # it too, for the foreign key) wait until the rebuilt counts are committed.
+        list(Survey.objects.select_for_update().filter(pk=schema.id).values_list('pk', flat=True))
+        TextTermTally.objects.filter(question_id__in=question_ids).delete()
+        counts = defaultdict(Counter)
+        answers = Answer.objects.filter(question_id__in=question_ids).exclude(Q(body__isnull=True) | Q(body='')).order_by('pk')
+        last_pk = 0
+        while True:
+            chunk = list(answers.filter(pk__gt=last_pk).values_list('pk', 'question_id', 'body')[:CHUNK_SIZE])
+            if not chunk:
+                break
+            last_pk = chunk[-1][0]
+            for key, terms in _count_terms((question_id, body) for _, question_id, body in chunk).items():
+                counts[key].update(terms)
+        TextTermTally.objects.bulk_create([
+            TextTermTally(question_id=question_id, n=n, term=term, answer_count=count)
+            for (question_id, n), terms in counts.items()
+            for term, count in terms.items()
+        ], batch_size=CHUNK_SIZE)
+    return sum(len(terms) for terms in counts.values())
+
+
+def top_terms(schema, k=TOP_K):
+    """
+    {question id: {'words': [(term, answers)], 'pairs': [(term, answers)]}}
+    with the k most used words and word pairs of every text question of a
+    survey, read from the counts in one query.
+    """
+    question_ids = [question.id for question in schema.questions if question.question_type in TEXT_TYPES]
+    summary = {question_id: {'words': [], 'pairs': []} for question_id in question_ids}
+    if not question_ids:
+        return summary
+    rows = (
+        TextTermTally.objects.filter(question_id__in=question_ids, answer_count__gt=0)
+        .annotate(position=Window(RowNumber(), partition_by=[F('question_id'), F('n')], order_by=[F('answer_count').desc(), F('term')]))
+        .filter(position__lte=k)
+        .order_by('question_id', 'n', 'position')
+        .values_list('question_id', 'n', 'term', 'answer_count')
+    )
+    for question_id, n, term, count in rows:
+        summary[question_id]['words' if n == 1 else 'pairs'].append((term, count))
+    return summary
+
+
+def recent_text_answers(schema, k=SAMPLE_SIZE):
+    """
+    {question id: [answer text]} with up to k of the newest answers to every
+    text question of a survey, newest first. One query, which only looks at
+    the survey's SAMPLE_RESPONSES newest responses, so a question that is
+    rarely answered may show fewer.
+    """
+    question_ids = [question.id for question in schema.questions if question.question_type in TEXT_TYPES]
+    samples = {question_id: [] for question_id in question_ids}
+    if not question_ids:
+        return samples
+    recent = Response.objects.filter(survey_id=schema.id).order_by('-submitted_at', '-id').values('id')[:SAMPLE_RESPONSES]
+    answers = (
+        Answer.objects.filter(response_id__in=recent, question_id__in=question_ids)
+        .exclude(Q(body__isnull=True) | Q(body=''))
+        .order_by('-response__submitted_at', '-response_id')
+        .values_list('question_id', 'body')
+    )
+    for question_id, body in answers:
+        if len(samples[question_id]) < k:
+            samples[question_id].append(body)
+    return samples
+
+
+# --- Signals ---
+
+@receiver(pre_delete, sender=Response)
+def forget_text_answers(sender, instance, origin=None, **kwargs):
+    """Take a deleted response's text answers out of the counts, while they can still be read."""
+    if isinstance(origin, (Survey, BulkResponseDeletion)):
+        return  # The counts are being deleted along with the survey, or rebuilt afterwards.
+    answers = (
+        Answer.objects.filter(response_id=instance.pk, question__question_type__in=TEXT_TYPES)
+        .exclude(Q(body__isnull=True) | Q(body=''))
+        .values_list('question_id', 'body')
+    )
+    _apply(_count_terms(answers), -1)
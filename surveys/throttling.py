@@ -0,0 +1,204 @@
+# surveys/throttling.py
+
+"""
+Rate limiting and load shedding for the public, internet-facing routes.
+
+Both are configured per URL name in settings.RATE_LIMITS and applied by
+ThrottleMiddleware (middleware.py). Their state lives in a small SQLite file
+(RATE_LIMIT_PATH) so that every gunicorn worker on the machine shares it:
+
+* Token buckets. Each key (a client IP or a survey, per route) holds up to
+  `capacity` tokens, refilled at capacity/period tokens per second, and each
+  request takes one from each of its buckets, or from none of them when
+  any is empty. The check and the take happen under the file's write lock,
+  so two workers can never spend the same token. A bucket left alone for a
+  whole period is full again, which is what a missing row means too, so
+  such rows are deleted every PRUNE_INTERVAL seconds.
+
+* Concurrency slots. A route may have at most `max_concurrent` requests in
+  progress across all workers; beyond that, requests are turned away with a
+  503 straight away instead of queueing up in front of the database. A slot
+  whose worker died without releasing it expires after SLOT_TIMEOUT seconds.
+
+Each thread keeps one connection to the file open, so a request costs no
+new connections. If the state file cannot be used, requests are let through: throttling
+must never take the site down itself.
+"""
+
+import math
+import sqlite3
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+SLOT_TIMEOUT = 60
+PRUNE_INTERVAL = 300
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bucket (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS slot (
+    token TEXT PRIMARY KEY,
+    route TEXT NOT NULL,
+    started REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS slot_route ON slot (route, started);
+"""
+
+
+def throttling_enabled():
+    return getattr(settings, 'RATE_LIMIT_ENABLED', False)
+
+
+def route_limits(route):
+    """The RATE_LIMITS entry for a URL name, or None if the route is not limited."""
+    return settings.RATE_LIMITS.get(route)
+
+
+# One connection per thread (and state file), opened and set up on first use.
+_local = threading.local()
+
+
+def _connect():
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    path = settings.RATE_LIMIT_PATH
+    if path not in connections:
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+        # The state is short-lived by nature, so durability is traded for speed.
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=OFF')
+        connection.executescript(STORE_SCHEMA)
+        connections[path] = connection
+    return connections[path]
+
+
+def _longest_period(buckets):
+    """The longest refill period of any bucket that may be in the file."""
+    periods = [period for _, _, period in buckets]
+    for limits in settings.RATE_LIMITS.values():
+        periods += [limits[name][1] for name in ('per_ip', 'per_survey') if name in limits]
+    return max(periods)
+
+
+def _prune_due(now):
+    """True once every PRUNE_INTERVAL seconds per thread and state file, starting with the first request."""
+    pruned = getattr(_local, 'pruned', None)
+    if pruned is None:
+        pruned = _local.pruned = {}
+    path = settings.RATE_LIMIT_PATH
+    if now - pruned.get(path, float('-inf')) < PRUNE_INTERVAL:
+        return False
+    pruned[path] = now
+    return True
+
+
+def _forget_connection():
+    """Drop this thread's connection after an error, so the next request opens a fresh one."""
+    connection = getattr(_local, 'connections', {}).pop(settings.RATE_LIMIT_PATH, None)
+    if connection is not None:
+        connection.close()
+
+
+def take_tokens(buckets, now=None):
+    """
+    Take one token from each of the buckets [(key, capacity, period)], where a
+    bucket refills `capacity` tokens every `period` seconds, or from none of
+    them if any is empty. Returns (allowed, seconds until all have a token).
+    """
+    now = time.time() if now is None else now
+    connection = _connect()
+    try:
+        # The write lock is held from the first read, so no other worker can
+        # spend the tokens between the check and the take.
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            wait = 0
+            for key, capacity, period in buckets:
+                rate = capacity / period
+                row = connection.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+                available = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+                if available < 1:
+                    wait = max(wait, math.ceil((1 - available) / rate), 1)
+            if not wait:
+                for key, capacity, period in buckets:
+                    connection.execute(
+                        'INSERT INTO bucket (key, tokens, updated) VALUES (:key, :capacity - 1, :now) '
+                        'ON CONFLICT (key) DO UPDATE SET tokens = MIN(:capacity, tokens + (:now - updated) * :rate) - 1, updated = :now',
+                        {'key': key, 'capacity': capacity, 'now': now, 'rate': capacity / period},
+                    )
+            if _prune_due(now):
+                connection.execute('DELETE FROM bucket WHERE updated < ?', (now - _longest_period(buckets),))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+    except sqlite3.Error:
+        _forget_connection()
+        raise
+    return (False, wait) if wait else (True, 0)
+
+
+def take_token(key, capacity, period, now=None):
+    """Take one token from the bucket `key` (see take_tokens)."""
+    return take_tokens([(key, capacity, period)], now)
+
+
+def acquire_slot(route, limit, now=None):
+    """Claim one of a route's `limit` concurrency slots. Returns a token to release, or None if all are taken."""
+    now = time.time() if now is None else now
+    token = uuid.uuid4().hex
+    try:
+        inserted = _connect().execute(
+            'INSERT INTO slot (token, route, started) '
+            'SELECT ?, ?, ? WHERE (SELECT COUNT(*) FROM slot WHERE route = ? AND started > ?) < ?',
+            (token, route, now, route, now - SLOT_TIMEOUT, limit),
+        ).rowcount
+    except sqlite3.Error:
+        _forget_connection()
+        raise
+    return token if inserted else None
+
+
+def release_slot(token):
+    try:
+        _connect().execute('DELETE FROM slot WHERE token = ? OR started < ?', (token, time.time() - SLOT_TIMEOUT))
+    except sqlite3.Error:
+        _forget_connection()
+        raise
+
+
+def client_ip(request):
+    """
+    The client's IP address. Behind a reverse proxy (RATE_LIMIT_TRUST_PROXY),
+    that is the last address in X-Forwarded-For, the one the proxy saw;
+    earlier entries can be made up by the client.
+    """
+    if settings.RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            return forwarded.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check_rate_limits(request, route, limits, view_kwargs):
+    """
+    Apply a route's per-IP and per-survey token buckets.
+    Returns None if the request may go ahead, else the Retry-After seconds.
+    """
+    buckets = []
+    if 'per_ip' in limits:
+        buckets.append((f'{route}:ip:{client_ip(request)}', *limits['per_ip']))
+    survey_key = view_kwargs.get('public_id') or view_kwargs.get('pk')
+    if 'per_survey' in limits and survey_key:
+        buckets.append((f'{route}:survey:{survey_key}', *limits['per_survey']))
+    if not buckets:
+        return None
+    allowed, retry_after = take_tokens(buckets)
+    return None if allowed else retry_after
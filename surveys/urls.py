@@ -1,7 +1,8 @@
 # surveys/urls.py
 
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
 
 # This creates the "surveys:" namespace that is used in all templates and views.
 app_name = 'surveys'
@@ -12,12 +13,32 @@ urlpatterns = [
     
     # All your other URL patterns are preserved and will work correctly.
     path('survey/create/', views.survey_create_view, name='survey-create'),
+    path('survey/import/', views.SurveyImportView.as_view(), name='survey-import'),
     path('survey/<int:pk>/', views.SurveyDetailView.as_view(), name='survey-detail'),
     path('survey/<int:pk>/update/', views.SurveyUpdateView.as_view(), name='survey-update'),
     path('survey/<int:pk>/delete/', views.SurveyDeleteView.as_view(), name='survey-delete'),
     path('question/<int:pk>/edit/', views.QuestionUpdateView.as_view(), name='question-edit'),
     path('survey/<int:pk>/take/', views.SurveyTakeView.as_view(), name='survey-take'),
-    path('public/<uuid:public_id>/', views.SurveyTakeView.as_view(), name='survey-public-take'),
+    path('public/<uuid:public_id>/', views.PublicSurveyTakeView.as_view(), name='survey-public-take'),
     path('survey/<int:pk>/results/', views.SurveyResultsView.as_view(), name='survey-results'),
+    path('survey/<int:pk>/responses/', views.SurveyResponsesView.as_view(), name='survey-responses'),
+    path('survey/<int:pk>/export/', views.SurveyExportView.as_view(), name='survey-export'),
+    path('survey/<int:pk>/search/', views.SurveySearchView.as_view(), name='survey-search'),
+    path('survey/<int:pk>/segments/', views.SurveySegmentsView.as_view(), name='survey-segments'),
+    path('survey/<int:pk>/timeline/', views.SurveyTimelineView.as_view(), name='survey-timeline'),
+    path('survey/<int:pk>/definition/', views.SurveyDefinitionView.as_view(), name='survey-definition'),
     path('survey/thank-you/', views.SurveyThankYouView.as_view(), name='survey-thank-you'),
-]
\ No newline at end of file
+]
+
+# When serving through ASGI, the take/submit, public-link and thank-you pages
+# can use the async views instead (see async_views.py and the README).
+if settings.SURVEY_ASYNC_VIEWS:
+    async_routes = {
+        'survey-take': async_views.survey_take,
+        'survey-public-take': async_views.public_survey_take,
+        'survey-thank-you': async_views.survey_thank_you,
+    }
+    urlpatterns = [
+        path(str(pattern.pattern), async_routes[pattern.name], name=pattern.name) if pattern.name in async_routes else pattern
+        for pattern in urlpatterns
+    ]
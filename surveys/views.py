@@ -1,21 +1,42 @@
 # surveys/views.py
 
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, Http404
 from django.urls import reverse, reverse_lazy
-from django.views.generic import ListView, DetailView, TemplateView
-from django.views.generic.edit import CreateView, UpdateView, DeleteView
+from django.views.generic import ListView, DetailView, TemplateView, View
+from django.views.generic.edit import CreateView, UpdateView, DeleteView, FormView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.db.models import Q
+from django.db.models import Prefetch
 from django.utils import timezone
+from datetime import datetime, time, timedelta
+from django.utils.crypto import constant_time_compare
 from django.contrib import messages
 from django.forms import inlineformset_factory
-from django.db import transaction
 
 from .models import Survey, Question, Choice, Response, Answer, Profile
+from .results import get_results_summary
+from .pagination import keyset_page
+from .export import EXPORT_FORMATS, stream_export
+from .submission import save_submission, build_answers
+from .ingest import queue_enabled, enqueue_submission, is_queued
+from .schema import get_survey_schema, get_survey_id_for_public_id
+from .anonymous import has_submitted, remember_submission
+from .availability import available_surveys_for, is_open_to, respondent_status
+from .metrics import metrics_enabled, render_metrics
+from .segments import Segment, segment_filter, segmentable_questions, get_segment_report
+from .rollups import submission_series
+from .search import search_available, search_answers
+from .text_summary import recent_text_answers, top_terms
+from .definitions import definition_formats, dump_definition, export_definition, save_new_survey
 from .forms import (
     SurveyCreateForm, QuestionCreateForm, # Our new forms for the create page
-    QuestionForm, ChoiceFormSet             # Your original forms for the update page
+    QuestionForm, ChoiceFormSet,            # Your original forms for the update page
+    ResponseFilterForm,                     # Filters for the individual responses page
+    SegmentForm,                            # Filters and questions for the segments page
+    TimelineForm,                           # Bucket size and dates for the timeline page
+    SurveyImportForm,                       # Upload of a survey definition file
 )
 
 # Your helper function is perfect.
@@ -23,6 +44,34 @@ def is_creator_or_staff(user):
     """A helper function to identify a survey creator by their 'is_staff' status."""
     return user.is_staff
 
+
+class MemoizedObjectMixin:
+    """
+    Loads the view's object once per request. UserPassesTestMixin calls
+    test_func() (which needs the object) before get()/post() load it again,
+    so without this every page fetched its survey two or three times.
+    Set `select_related` to join in what test_func and the template use.
+    """
+    select_related = ()
+
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, '_memoized_object'):
+            self._memoized_object = self.fetch_object()
+        return self._memoized_object
+
+    def fetch_object(self):
+        queryset = self.get_queryset()
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        return super().get_object(queryset)
+
+
+def is_owner(user, survey):
+    """The survey's creator or a superuser. Compares ids, so the creator is never fetched."""
+    return survey.creator_id == user.pk or user.is_superuser
+
 # ==============================================================================
 # === THE NEW SINGLE-PAGE SURVEY CREATION VIEW (REPLACES SurveyCreateView) ===
 # ==============================================================================
@@ -48,27 +97,24 @@ def survey_create_view(request):
         formset = QuestionFormSet(request.POST, prefix='questions')
 
         if survey_form.is_valid() and formset.is_valid():
-            with transaction.atomic():
-                survey = survey_form.save(commit=False)
-                survey.creator = request.user
-                survey.save()
-
-                for i, form in enumerate(formset):
-                    if form.cleaned_data and not form.cleaned_data.get('DELETE', False):
-                        question = form.save(commit=False)
-                        question.survey = survey
-                        question.order = i
-                        question.save()
-
-                        choices_text = form.cleaned_data.get('choices_text')
-                        if choices_text and question.question_type in [Question.QuestionType.CHOICE, Question.QuestionType.MULTIPLE_CHOICE]:
-                            choices_list = [choice.strip() for choice in choices_text.splitlines() if choice.strip()]
-                            for choice_text in choices_list:
-                                Choice.objects.create(question=question, text=choice_text)
-                
-                for form in formset.deleted_forms:
-                    if form.instance.pk:
-                        form.instance.delete()
+            survey = survey_form.save(commit=False)
+            survey.creator = request.user
+
+            # Collect the questions and their choices first, then save them all
+            # with a few bulk INSERTs (see definitions.py).
+            questions = []
+            for i, form in enumerate(formset):
+                if form.cleaned_data and not form.cleaned_data.get('DELETE', False):
+                    question = form.save(commit=False)
+                    question.order = i
+
+                    choices_list = []
+                    choices_text = form.cleaned_data.get('choices_text')
+                    if choices_text and question.question_type in [Question.QuestionType.CHOICE, Question.QuestionType.MULTIPLE_CHOICE]:
+                        choices_list = [choice.strip() for choice in choices_text.splitlines() if choice.strip()]
+                    questions.append((question, choices_list))
+
+            save_new_survey(survey, questions)
 
             messages.success(request, f"Survey '{survey.title}' created successfully!")
             # THIS LINE IS ALREADY CORRECT and does not need to be changed.
@@ -97,25 +143,12 @@ class SurveyListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         user = self.request.user
-        now = timezone.now()
         if is_creator_or_staff(user):
             return Survey.objects.filter(creator=user).order_by('-created_at')
         else:
-            queryset = Survey.objects.filter(is_active=True)
-            queryset = queryset.filter(
-                Q(start_date__isnull=True) | Q(start_date__lte=now)
-            ).filter(
-                Q(end_date__isnull=True) | Q(end_date__gte=now)
-            )
-            if hasattr(user, 'profile'):
-                user_role = user.profile.user_type
-                queryset = queryset.filter(Q(target_audience='ALL') | Q(target_audience=user_role))
-            else:
-                queryset = queryset.filter(target_audience='ALL')
-
-            taken_survey_ids = Response.objects.filter(respondent=user).values_list('survey__id', flat=True)
-            queryset = queryset.exclude(pk__in=taken_survey_ids)
-            return queryset.order_by('-created_at')
+            # Respondents see the cached list of surveys open to their role,
+            # minus the ones they have already taken (see availability.py).
+            return available_surveys_for(user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -123,11 +156,11 @@ class SurveyListView(LoginRequiredMixin, ListView):
         return context
 
 
-class SurveyUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class SurveyUpdateView(LoginRequiredMixin, UserPassesTestMixin, MemoizedObjectMixin, UpdateView):
     model = Survey
     fields = ['title', 'description', 'target_audience', 'is_active', 'start_date', 'end_date','is_public']
     template_name = 'surveys/survey_form.html'
-    def test_func(self): return self.request.user == self.get_object().creator
+    def test_func(self): return self.get_object().creator_id == self.request.user.pk
     def get_success_url(self):
         messages.success(self.request, "Survey settings updated successfully.")
         
@@ -135,7 +168,7 @@ class SurveyUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         # Add the 'surveys:' namespace to the redirect.
         return reverse('surveys:survey-detail', kwargs={'pk': self.object.pk})
 
-class SurveyDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class SurveyDeleteView(LoginRequiredMixin, UserPassesTestMixin, MemoizedObjectMixin, DeleteView):
     model = Survey
     template_name = 'surveys/survey_confirm_delete.html'
     
@@ -143,27 +176,28 @@ class SurveyDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     # Add the 'surveys:' namespace to the redirect.
     success_url = reverse_lazy('surveys:survey-list')
     
-    def test_func(self): return self.request.user == self.get_object().creator
+    def test_func(self): return self.get_object().creator_id == self.request.user.pk
     def form_valid(self, form):
         messages.success(self.request, f"The survey '{self.object.title}' has been successfully deleted.")
         return super().form_valid(form)
 
-class SurveyDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
+class SurveyDetailView(LoginRequiredMixin, UserPassesTestMixin, MemoizedObjectMixin, DetailView):
     # This view has no redirects, so it is already correct.
     model = Survey
     template_name = 'surveys/survey_detail.html'
     def test_func(self):
-        return self.request.user == self.get_object().creator or self.request.user.is_superuser
+        return is_owner(self.request.user, self.get_object())
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['is_creator'] = self.request.user == self.get_object().creator or self.request.user.is_superuser
+        context['is_creator'] = is_owner(self.request.user, self.object)
         return context
 
-class QuestionUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class QuestionUpdateView(LoginRequiredMixin, UserPassesTestMixin, MemoizedObjectMixin, UpdateView):
     model = Question
     form_class = QuestionForm
     template_name = 'surveys/question_form.html'
-    def test_func(self): return self.request.user == self.get_object().survey.creator
+    select_related = ('survey',)
+    def test_func(self): return self.get_object().survey.creator_id == self.request.user.pk
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         if self.request.POST:
@@ -185,65 +219,337 @@ class QuestionUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
             return redirect('surveys:survey-detail', pk=self.object.survey.pk)
         else: return self.render_to_response(self.get_context_data(form=form))
 
-class SurveyTakeView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
-    # Your get_object and test_func methods are preserved and correct.
+class BaseSurveyTakeView(UserPassesTestMixin, MemoizedObjectMixin, DetailView):
+    # The "object" here is the survey's cached, compiled schema (see schema.py)
+    # rather than a Survey instance, so taking and submitting a survey does not
+    # read Survey, Question or Choice from the database once the cache is warm.
     model = Survey
     template_name = 'surveys/survey_take_form.html'
-    def get_object(self, queryset=None):
-        if 'public_id' in self.kwargs:
-            return get_object_or_404(
-                Survey, 
-                public_id=self.kwargs['public_id'], 
-                is_public=True,
-                is_active=True
-            )
-        return super().get_object(queryset)
+    context_object_name = 'survey'
+    def fetch_object(self):
+        try:
+            if 'public_id' in self.kwargs:
+                survey_id = get_survey_id_for_public_id(self.kwargs['public_id'])
+            else:
+                survey_id = self.kwargs['pk']
+            survey = get_survey_schema(survey_id)
+        except Survey.DoesNotExist:
+            raise Http404("No survey found matching the query")
+        if 'public_id' in self.kwargs and not (survey.is_public and survey.is_active):
+            raise Http404("No survey found matching the query")
+        return survey
     def test_func(self):
         survey = self.get_object()
         user = self.request.user
-        now = timezone.now()
-        if user == survey.creator: return False
-        if Response.objects.filter(survey=survey, respondent=user).exists(): return False
+        if not user.is_authenticated:
+            # Only a public link gets here without logging in. Anonymous
+            # respondents are recognised by a signed cookie (see anonymous.py).
+            return not has_submitted(self.request, survey.id)
+        if user.pk == survey.creator_id: return False
+        # One query for both the earlier-response check and the user's audience.
+        has_responded, user_type = respondent_status(survey.id, user)
+        if has_responded: return False
+        if queue_enabled() and is_queued(survey.id, user.pk): return False
         if 'public_id' in self.kwargs:
             return True
-        if not survey.is_active: return False
-        if survey.start_date and now < survey.start_date: return False
-        if survey.end_date and now > survey.end_date: return False
-        if hasattr(user, 'profile'):
-            if survey.target_audience != 'ALL' and survey.target_audience != user.profile.user_type: return False
-        elif survey.target_audience != 'ALL': return False
-        return True
-    
+        return is_open_to(survey, user_type)
+
     def post(self, request, *args, **kwargs):
-        # Your post logic for saving answers is preserved and correct.
+        # All answers are validated and written in one transaction with bulk
+        # inserts, so the cost of a submission does not grow with survey length.
+        # In queued ingest mode they are only validated and queued here, and
+        # the submission worker saves them in batches.
         survey = self.get_object()
-        response = Response.objects.create(survey=survey, respondent=request.user)
-        for question in survey.questions.all():
-            answer = Answer(response=response, question=question)
-            q_type = question.question_type
-            if q_type in [Question.QuestionType.TEXT, Question.QuestionType.TEXTAREA, Question.QuestionType.RATING]:
-                answer.body = request.POST.get(f'question_{question.id}')
-                answer.save()
-            elif q_type == Question.QuestionType.CHOICE:
-                choice_id = request.POST.get(f'question_{question.id}')
-                if choice_id:
-                    answer.save()
-                    answer.choices.add(Choice.objects.get(id=choice_id))
-            elif q_type == Question.QuestionType.MULTIPLE_CHOICE:
-                choice_ids = request.POST.getlist(f'question_{question.id}')
-                if choice_ids:
-                    answer.save()
-                    answer.choices.add(*choice_ids)
-        
+        if not request.user.is_authenticated:
+            # Anonymous public submission: saved straight away without touching
+            # the user tables (the queue is keyed by respondent), and the
+            # browser is marked so it cannot submit again.
+            save_submission(survey, None, request.POST)
+            return remember_submission(redirect('surveys:survey-thank-you'), survey.id)
+        if queue_enabled():
+            enqueue_submission(survey, request.user, build_answers(survey.questions, survey.valid_choices, request.POST))
+        else:
+            save_submission(survey, request.user, request.POST)
+
         # This line is already correct and does not need to be changed.
         return redirect('surveys:survey-thank-you')
 
-class SurveyResultsView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
+class SurveyTakeView(LoginRequiredMixin, BaseSurveyTakeView):
+    pass
+
+class PublicSurveyTakeView(BaseSurveyTakeView):
+    # Public links can be answered without an account. A visitor who is
+    # refused (e.g. already submitted) gets a 403 instead of the login page.
+    raise_exception = True
+
+class SurveyResultsView(LoginRequiredMixin, UserPassesTestMixin, MemoizedObjectMixin, DetailView):
     # This view has no redirects, so it is already correct.
     model = Survey
     template_name = 'surveys/survey_results.html'
-    def test_func(self): return self.request.user == self.get_object().creator or self.request.user.is_superuser
+    def test_func(self): return is_owner(self.request.user, self.get_object())
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # The page renders from the survey's tallies (or, when those are being
+        # rebuilt, from aggregated counts) instead of walking every response.
+        schema = get_survey_schema(self.object.pk)
+        summary = get_results_summary(schema)
+        # Text questions show their most used words and word pairs, and a few
+        # of their newest answers (see text_summary.py).
+        terms = top_terms(schema)
+        samples = recent_text_answers(schema)
+        for item in summary['questions']:
+            item['terms'] = terms.get(item['question'].id)
+            item['recent_answers'] = samples.get(item['question'].id)
+        context['summary'] = summary
+        return context
+
+class SurveyResponsesView(LoginRequiredMixin, UserPassesTestMixin, MemoizedObjectMixin, DetailView):
+    """
+    Browse individual responses one page at a time, newest first.
+    Uses keyset pagination, so every page costs the same three queries
+    (responses, their answers with questions, and the selected choices).
+    """
+    model = Survey
+    template_name = 'surveys/survey_responses.html'
+    page_size = 25
+    def test_func(self): return is_owner(self.request.user, self.get_object())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        filter_form = ResponseFilterForm(self.request.GET or None)
+        responses = Response.objects.filter(survey=self.object).select_related('respondent')
+
+        if filter_form.is_valid():
+            data = filter_form.cleaned_data
+            responses = responses.filter(segment_filter(Segment(data['user_type'], data['start'], data['end'])))
+
+        responses = responses.prefetch_related(
+            Prefetch('answers', queryset=Answer.objects.select_related('question').prefetch_related('choices').order_by('question__order', 'id'))
+        )
+        page, next_cursor = keyset_page(responses, self.request.GET.get('cursor'), self.page_size)
+
+        # Carry the filters over to the "next page" link.
+        params = self.request.GET.copy()
+        params.pop('cursor', None)
+        context['filter_form'] = filter_form
+        context['responses'] = page
+        context['next_cursor'] = next_cursor
+        context['filter_query'] = params.urlencode()
+        context['is_first_page'] = not self.request.GET.get('cursor')
+        return context
+
+class SurveySearchView(LoginRequiredMixin, UserPassesTestMixin, MemoizedObjectMixin, DetailView):
+    """
+    Search a survey's free-text answers (?q=wifi), best matches first, with
+    the matching words highlighted. Served by a full-text index (see
+    search.py) and paged with a cursor, so it stays fast on large surveys.
+    """
+    model = Survey
+    template_name = 'surveys/survey_search.html'
+    page_size = 25
+    def test_func(self): return is_owner(self.request.user, self.get_object())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '')
+        results, next_cursor = [], None
+        if query and search_available():
+            results, next_cursor = search_answers(get_survey_schema(self.object.pk), query, self.request.GET.get('cursor'), self.page_size)
+
+        params = self.request.GET.copy()
+        params.pop('cursor', None)
+        context['query'] = query
+        context['search_available'] = search_available()
+        context['results'] = results
+        context['next_cursor'] = next_cursor
+        context['search_query'] = params.urlencode()
+        context['is_first_page'] = not self.request.GET.get('cursor')
+        return context
+
+class SurveySegmentsView(LoginRequiredMixin, UserPassesTestMixin, MemoizedObjectMixin, DetailView):
+    """
+    Results broken down by respondent role, for a role and/or date range, and
+    optionally a cross-tab of two questions. Everything is counted with
+    GROUP BY queries and cached until the survey's responses change (see
+    segments.py). Add ?format=json to get the same numbers as JSON.
+    """
+    model = Survey
+    template_name = 'surveys/survey_segments.html'
+    def test_func(self): return is_owner(self.request.user, self.get_object())
+
+    def get_report(self):
+        schema = get_survey_schema(self.object.pk)
+        questions = segmentable_questions(schema)
+        form = SegmentForm(self.request.GET or None, questions=questions)
+        segment, row_question, column_question = Segment(), None, None
+        if form.is_valid():
+            data = form.cleaned_data
+            segment = Segment(data['user_type'], data['start'], data['end'])
+            by_id = {question.id: question for question in questions}
+            row_question, column_question = by_id.get(data['row_question']), by_id.get(data['column_question'])
+        return form, get_segment_report(schema, segment, row_question, column_question)
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        if request.GET.get('format') != 'json':
+            return super().get(request, *args, **kwargs)
+        form, report = self.get_report()
+        if form.errors:
+            return JsonResponse({'errors': form.errors}, status=400)
+        return JsonResponse(segment_report_json(report))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['segment_form'], context['report'] = self.get_report()
+        return context
+
+def segment_report_json(report):
+    """The segment report with plain values only, for the JSON format."""
+    breakdown = report['breakdown']
+    data = {
+        'roles': [{'role': code, 'label': label, 'responses': n} for code, label, n in breakdown['roles']],
+        'questions': [
+            {
+                'question_id': item['question'].id,
+                'question': item['question'].text,
+                'answers': [{'answer': label, 'by_role': dict(zip([code for code, _, _ in breakdown['roles']], counts)), 'total': total}
+                            for label, counts, total in item['rows']],
+            }
+            for item in breakdown['questions']
+        ],
+        'cross_tab': None,
+    }
+    table = report['cross_tab']
+    if table:
+        data['cross_tab'] = {
+            'row_question_id': table['row_question'].id,
+            'column_question_id': table['column_question'].id,
+            'columns': table['columns'],
+            'rows': [{'answer': label, 'counts': cells, 'total': total} for label, cells, total in table['rows']],
+            'column_totals': table['column_totals'],
+            'total': table['total'],
+        }
+    return data
+
+class SurveyTimelineView(LoginRequiredMixin, UserPassesTestMixin, MemoizedObjectMixin, DetailView):
+    """
+    Submissions per minute, hour or day, by respondent role. Read from the
+    submission-rate rollups (see rollups.py), so reloading it while a survey
+    is live does not scan the responses. Add ?format=json for the raw series.
+    """
+    model = Survey
+    template_name = 'surveys/survey_timeline.html'
+    # How far back the page looks when no start date is given (None: the whole survey).
+    DEFAULT_WINDOWS = {'MINUTE': timedelta(hours=3), 'HOUR': timedelta(days=7), 'DAY': None}
+    def test_func(self): return is_owner(self.request.user, self.get_object())
+
+    def get_series(self):
+        form = TimelineForm(self.request.GET)
+        granularity, start, end = 'HOUR', None, None
+        if form.is_valid():
+            data = form.cleaned_data
+            granularity = data['granularity']
+            if data['start']:
+                start = timezone.make_aware(datetime.combine(data['start'], time.min))
+            if data['end']:
+                end = timezone.make_aware(datetime.combine(data['end'] + timedelta(days=1), time.min))
+        if start is None and self.DEFAULT_WINDOWS[granularity]:
+            start = (end or timezone.now()) - self.DEFAULT_WINDOWS[granularity]
+        return form, submission_series(self.object.pk, granularity, start, end)
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        if request.GET.get('format') != 'json':
+            return super().get(request, *args, **kwargs)
+        form, series = self.get_series()
+        if form.errors:
+            return JsonResponse({'errors': form.errors}, status=400)
+        return JsonResponse({
+            'granularity': series['granularity'],
+            'roles': [{'role': code, 'label': label} for code, label in series['roles']],
+            'points': [
+                {'bucket': point['bucket'].isoformat(), 'by_role': dict(zip([code for code, _ in series['roles']], point['counts'])), 'total': point['total']}
+                for point in series['points']
+            ],
+            'total': series['total'],
+        })
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['timeline_form'], series = self.get_series()
+        # The busiest bucket fills the bar; every other bar is scaled to it.
+        peak = max([point['total'] for point in series['points']] + [1])
+        for point in series['points']:
+            point['percent'] = round(100 * point['total'] / peak)
+        context['series'] = series
+        return context
+
+class SurveyExportView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Download all responses as CSV (default) or JSONL, streamed in chunks."""
+    def get_object(self):
+        if not hasattr(self, 'object'):
+            self.object = get_object_or_404(Survey, pk=self.kwargs['pk'])
+        return self.object
+    def test_func(self): return is_owner(self.request.user, self.get_object())
+    def get(self, request, *args, **kwargs):
+        survey = self.get_object()
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            export_format = 'csv'
+        content_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(stream_export(survey, export_format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="survey_{survey.pk}_responses.{export_format}"'
+        return response
+
+class SurveyImportView(LoginRequiredMixin, UserPassesTestMixin, FormView):
+    """Create a new survey from an uploaded definition file (see definitions.py)."""
+    form_class = SurveyImportForm
+    template_name = 'surveys/survey_import.html'
+    def test_func(self): return is_creator_or_staff(self.request.user)
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['creator'] = self.request.user
+        return kwargs
+    def form_valid(self, form):
+        survey = save_new_survey(form.cleaned_data['survey'], form.cleaned_data['questions'])
+        messages.success(self.request, f"Survey '{survey.title}' imported with {len(form.cleaned_data['questions'])} questions.")
+        return redirect('surveys:survey-detail', pk=survey.pk)
+
+class SurveyDefinitionView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Download a survey's settings, questions and choices as JSON (default) or YAML, for importing elsewhere."""
+    def get_object(self):
+        if not hasattr(self, 'object'):
+            self.object = get_object_or_404(Survey, pk=self.kwargs['pk'])
+        return self.object
+    def test_func(self): return is_owner(self.request.user, self.get_object())
+    def get(self, request, *args, **kwargs):
+        survey = self.get_object()
+        definition_format = request.GET.get('format', 'json')
+        if definition_format not in definition_formats():
+            definition_format = 'json'
+        content_type = 'application/json' if definition_format == 'json' else 'application/yaml'
+        response = HttpResponse(dump_definition(export_definition(survey), definition_format), content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="survey_{survey.pk}.{definition_format}"'
+        return response
+
+class SurveyThankYouView(TemplateView):
+    # Anonymous public respondents land here too, so no login is required.
+    template_name = 'surveys/survey_thank_you.html'
+
+def metrics_view(request):
+    """
+    The per-view performance metrics (see metrics.py) in the Prometheus text
+    format, for every worker on this machine. The scraper must send
+    METRICS_TOKEN as "Authorization: Bearer <token>". They show per-survey
+    traffic, so with no token configured they are only served with DEBUG on.
+    """
+    if not metrics_enabled():
+        raise Http404("Metrics are disabled")
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponse('Forbidden: set METRICS_TOKEN to expose the metrics.', status=403)
+    elif not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('Unauthorized', status=401)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-class SurveyThankYouView(LoginRequiredMixin, TemplateView):
-    # This view has no redirects, so it is already correct.
-    template_name = 'surveys/survey_thank_you.html'
\ No newline at end of file
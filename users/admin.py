@@ -5,6 +5,7 @@ from django.contrib.auth.admin import UserAdmin
 from .models import CustomUser
 # We will also need the Profile model to show the user's role
 from surveys.models import Profile
+from surveys.admin_pagination import LargeTableAdminMixin
 
 # This defines an "inline" admin view for the Profile model
 # It allows you to edit the Profile directly on the User's admin page
@@ -14,7 +15,7 @@ class ProfileInline(admin.StackedInline):
     verbose_name_plural = 'Profile'
     fk_name = 'user'
 
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(LargeTableAdminMixin, UserAdmin):
     """
     This class defines the custom admin interface for our CustomUser model.
     """
@@ -25,6 +26,10 @@ class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'get_user_type', 'is_staff')
     
     list_filter = ('is_staff', 'is_superuser', 'is_active') # 'user_type' removed
+
+    # Loads every row's Profile in the same query, so get_user_type() below
+    # does not run one query per user.
+    list_select_related = ('profile',)
     
     # We must remove 'user_type' from the fieldsets
     fieldsets = (